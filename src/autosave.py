@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# autosave.py - journaled autosave and recovery of unsaved sessions
+import os
+import json
+from gi.repository import Gtk, GLib, Gio, Adw, WebKit
+
+import session_journal
+import docx_import
+import mhtml_import
+import wwd_format
+from file_operations import _get_save_executor
+
+# Archive types by extension; other archived documents are MHTML
+ARCHIVE_CLASSES = {'.wwd': wwd_format.WwdArchive, '.docx': docx_import.DocxArchive}
+
+
+def get_window_journal(self, win):
+    """Return the session journal of a window, creating it on first use"""
+    if getattr(win, 'journal', None) is None:
+        win.journal = session_journal.SessionJournal()
+    return win.journal
+
+
+def auto_save(self, win):
+    """Journal the editor changes made since the last autosave"""
+    if win.modified and not getattr(win, 'journal_pending', False):
+        win.journal_pending = True
+        win.webview.evaluate_javascript(
+            "journalCollectChanges();",
+            -1, None, None, None,
+            lambda webview, result, data: self._on_journal_changes(win, webview, result),
+            None
+        )
+    return win.auto_save_enabled
+
+
+def _on_journal_changes(self, win, webview, result):
+    """Append a change record from the editor to the window's journal"""
+    try:
+        js_result = webview.evaluate_javascript_finish(result)
+        message = js_result.to_string() if js_result else None
+    except Exception as e:
+        print(f"Error collecting changes for auto-save: {e}")
+        win.journal_pending = False
+        return
+
+    if not message or message in ('null', 'undefined'):
+        win.journal_pending = False
+        return
+
+    record = json.loads(message)
+    journal = self.get_window_journal(win)
+    meta = {
+        'title': win.get_title(),
+        'file': win.current_file.get_path() if win.current_file else None,
+        'modified': True,
+    }
+
+    def worker():
+        error = None
+        written = 0
+        try:
+            journal.update_meta(**meta)
+            written = journal.append(record)
+            if journal.needs_compaction():
+                journal.compact()
+        except (OSError, ValueError) as e:
+            error = str(e)
+
+        def finish():
+            win.journal_pending = False
+            if error:
+                print(f"Auto-save failed: {error}")
+                win.statusbar.set_text(f"Auto-save failed: {error}")
+                # The editor already moved past this record; resend everything next time
+                self.execute_js(win, "journalReset();")
+            else:
+                win.statusbar.set_text(
+                    f"Auto-saved {GLib.format_size(written)} at {GLib.DateTime.new_now_local().format('%H:%M:%S')}")
+            return False
+
+        GLib.idle_add(finish)
+
+    # Share the save worker so journal writes and saves keep their order
+    _get_save_executor(win).submit(worker)
+
+
+def mark_journal_saved(self, win):
+    """Record that the journal's contents have been saved to a file"""
+    journal = getattr(win, 'journal', None)
+    if journal is None:
+        return
+    path = win.current_file.get_path() if win.current_file else None
+
+    def worker():
+        try:
+            if os.path.exists(journal.path):
+                journal.update_meta(modified=False, file=path, title=win.get_title())
+        except OSError as e:
+            print(f"Could not update session journal: {e}")
+
+    _get_save_executor(win).submit(worker)
+
+
+def discard_window_journal(self, win):
+    """Delete a window's journal once the window is closed on purpose"""
+    journal = getattr(win, 'journal', None)
+    if journal is None:
+        return
+    win.journal = None
+    _get_save_executor(win).submit(journal.discard)
+
+
+def offer_session_recovery(self, win):
+    """Offer to restore sessions that ended without saving their changes"""
+    def scan():
+        sessions = session_journal.list_recoverable_sessions()
+        if sessions:
+            GLib.idle_add(lambda: self.show_session_recovery_dialog(win, sessions) and False)
+
+    GLib.Thread.new(None, scan)
+    return False
+
+
+def show_session_recovery_dialog(self, win, sessions):
+    """Ask whether to recover or discard unsaved sessions"""
+    dialog = Adw.Dialog.new()
+    dialog.set_title("Recover Unsaved Documents")
+    dialog.set_content_width(400)
+
+    content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=20)
+    content_box.set_margin_top(24)
+    content_box.set_margin_bottom(24)
+    content_box.set_margin_start(24)
+    content_box.set_margin_end(24)
+
+    icon = Gtk.Image.new_from_icon_name("document-revert-symbolic")
+    icon.set_pixel_size(48)
+    icon.set_margin_bottom(12)
+    content_box.append(icon)
+
+    count = len(sessions)
+    message_label = Gtk.Label()
+    message_label.set_markup(f"<b>{count} document{'s' if count != 1 else ''} "
+                             f"{'were' if count != 1 else 'was'} closed with unsaved changes</b>")
+    message_label.set_wrap(True)
+    message_label.set_max_width_chars(40)
+    content_box.append(message_label)
+
+    names = []
+    for journal in sessions:
+        meta = journal.read_meta()
+        if meta.get('file'):
+            names.append(os.path.basename(meta['file']))
+        else:
+            names.append("Untitled")
+    description_label = Gtk.Label(label=", ".join(names))
+    description_label.set_wrap(True)
+    description_label.set_max_width_chars(40)
+    content_box.append(description_label)
+
+    button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+    button_box.set_halign(Gtk.Align.END)
+    button_box.set_margin_top(12)
+
+    def on_discard(button):
+        dialog.close()
+        for journal in sessions:
+            journal.discard()
+
+    def on_recover(button):
+        dialog.close()
+        self.recover_sessions(win, sessions)
+
+    discard_button = Gtk.Button(label="Discard")
+    discard_button.add_css_class("destructive-action")
+    discard_button.connect("clicked", on_discard)
+    button_box.append(discard_button)
+
+    # Closing the dialog keeps the sessions so they are offered again next time
+    later_button = Gtk.Button(label="Later")
+    later_button.connect("clicked", lambda btn: dialog.close())
+    button_box.append(later_button)
+
+    recover_button = Gtk.Button(label="Recover")
+    recover_button.add_css_class("suggested-action")
+    recover_button.connect("clicked", on_recover)
+    button_box.append(recover_button)
+
+    content_box.append(button_box)
+    dialog.set_child(content_box)
+    dialog.present(win)
+
+
+def recover_sessions(self, win, sessions):
+    """Open each session in a window, reusing win if it is still empty"""
+    def worker():
+        recovered = []
+        for journal in sessions:
+            try:
+                recovered.append((journal, journal.get_html(), journal.read_meta()))
+            except OSError as e:
+                print(f"Could not recover session {journal.session_id}: {e}")
+
+        def show_recovered():
+            target = win if not win.modified and not win.current_file else None
+            for journal, html_content, meta in recovered:
+                if target is None:
+                    target = self.create_window()
+                    target.present()
+                self._load_recovered_session(target, journal, html_content, meta)
+                target = None
+            self.update_window_menu()
+            return False
+
+        GLib.idle_add(show_recovered)
+
+    GLib.Thread.new(None, worker)
+
+
+def _load_recovered_session(self, win, journal, html_content, meta):
+    """Put a recovered session into a window and keep journaling into a fresh one"""
+    if meta.get('file'):
+        win.current_file = Gio.File.new_for_path(meta['file'])
+        # Reopening the archive brings back the URLs its images were journaled with
+        if mhtml_import.ARCHIVE_SCHEME in html_content and os.path.isfile(meta['file']):
+            try:
+                file_ext = os.path.splitext(meta['file'])[1].lower()
+                archive_class = ARCHIVE_CLASSES.get(file_ext, mhtml_import.MhtmlArchive)
+                archive = mhtml_import.open_archive(meta['file'], archive_class)
+                self.set_window_archive(win, archive.archive_id)
+            except (OSError, ValueError) as e:
+                print(f"Could not reopen archive {meta['file']}: {e}")
+    content = html_content.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def on_loaded(webview, result, data):
+        try:
+            webview.evaluate_javascript_finish(result)
+        except GLib.Error as e:
+            print(f"Error restoring recovered session: {e.message}")
+            return
+        # The window starts its own journal with a full record; the old one can go
+        win.modified = True
+        win.change_count = getattr(win, 'change_count', 0) + 1
+        self.update_window_title(win)
+        win.statusbar.set_text("Recovered unsaved changes")
+        _get_save_executor(win).submit(journal.discard)
+        self.auto_save(win)
+
+    def set_content():
+        win.webview.evaluate_javascript(
+            f'setContent("{content}");', -1, None, None, None, on_loaded, None)
+
+    # A window created for the recovery may still be loading the editor
+    if win.webview.get_estimated_load_progress() == 1.0:
+        set_content()
+    else:
+        def on_load_changed(webview, event):
+            if event == WebKit.LoadEvent.FINISHED:
+                webview.disconnect_by_func(on_load_changed)
+                set_content()
+        win.webview.connect("load-changed", on_load_changed)
+
+
+def journal_js(self):
+    """JavaScript that tracks editor changes as top-level block splices"""
+    return """
+    // State of the top-level editor nodes as of the last journaled record
+    const journalState = {
+        nodes: [],
+        html: [],
+        dirty: new Set(),
+        reset: true,
+        observer: null
+    };
+
+    function journalEscapeText(text) {
+        return text.replace(/&/g, '&amp;').replace(/</g, '&lt;')
+                   .replace(/>/g, '&gt;').replace(/\\u00a0/g, '&nbsp;');
+    }
+
+    function journalSerialize(node) {
+        if (node.nodeType === Node.TEXT_NODE) return journalEscapeText(node.data);
+        if (node.nodeType === Node.COMMENT_NODE) return '<!--' + node.data + '-->';
+        if (node.nodeType !== Node.ELEMENT_NODE) return '';
+        // Placeholders of unloaded images are journaled with their real source
+        const sources = window.lazyImageSources;
+        if (!sources || sources.size === 0) return node.outerHTML;
+        const live = node.matches('img[data-lazy-placeholder]') ? [node] :
+                     Array.from(node.querySelectorAll('img[data-lazy-placeholder]'));
+        if (live.length === 0) return node.outerHTML;
+        const clone = node.cloneNode(true);
+        const copies = clone.matches('img[data-lazy-placeholder]') ? [clone] :
+                       Array.from(clone.querySelectorAll('img[data-lazy-placeholder]'));
+        copies.forEach(function(copy, index) {
+            const src = sources.get(live[index]);
+            if (src !== undefined) copy.setAttribute('src', src);
+            copy.removeAttribute('data-lazy-placeholder');
+        });
+        return clone.outerHTML;
+    }
+
+    function journalMarkDirty(mutations) {
+        const editor = document.getElementById('editor');
+        mutations.forEach(function(mutation) {
+            let node = mutation.target;
+            while (node && node.parentNode !== editor) node = node.parentNode;
+            if (node) journalState.dirty.add(node);
+        });
+    }
+
+    function setupJournal(editor) {
+        journalState.observer = new MutationObserver(journalMarkDirty);
+        journalState.observer.observe(editor, {
+            childList: true, subtree: true, characterData: true, attributes: true
+        });
+    }
+
+    function journalReset() {
+        journalState.reset = true;
+    }
+
+    // Describe the changes since the last call as one record, or null.
+    // Only changed blocks are serialized into the record; unchanged blocks are
+    // recognised by identity, or by content when they were touched or replaced
+    // (as after undo, which swaps the whole editor content)
+    function journalCollectChanges() {
+        const editor = document.getElementById('editor');
+        if (journalState.observer) journalMarkDirty(journalState.observer.takeRecords());
+
+        const current = Array.from(editor.childNodes);
+        const html = new Array(current.length);
+        let record;
+
+        if (journalState.reset) {
+            for (let i = 0; i < current.length; i++) html[i] = journalSerialize(current[i]);
+            record = { r: true, a: html.slice() };
+        } else {
+            const prevNodes = journalState.nodes;
+            const prevHtml = journalState.html;
+            const dirty = journalState.dirty;
+
+            function unchanged(ci, pi) {
+                const node = current[ci];
+                if (node === prevNodes[pi] && !dirty.has(node)) {
+                    html[ci] = prevHtml[pi];
+                    return true;
+                }
+                if (html[ci] === undefined) html[ci] = journalSerialize(node);
+                return html[ci] === prevHtml[pi];
+            }
+
+            const common = Math.min(current.length, prevNodes.length);
+            let start = 0;
+            while (start < common && unchanged(start, start)) start++;
+            let end = 0;
+            while (end < common - start &&
+                   unchanged(current.length - 1 - end, prevNodes.length - 1 - end)) end++;
+
+            const added = [];
+            for (let i = start; i < current.length - end; i++) {
+                if (html[i] === undefined) html[i] = journalSerialize(current[i]);
+                added.push(html[i]);
+            }
+            const removed = prevNodes.length - start - end;
+            if (removed > 0 || added.length > 0) {
+                record = { i: start, d: removed, a: added };
+            }
+        }
+
+        journalState.nodes = current;
+        journalState.html = html;
+        journalState.dirty.clear();
+        journalState.reset = false;
+        return record ? JSON.stringify(record) : null;
+    }
+    """
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# batch_convert.py - headless batch conversion from the command line
+#
+#   webkitword --convert IN... --to wwd|html|md|txt|mhtml|odt|docx [--jobs N] [--outdir DIR]
+#
+# Documents are loaded the same way load_file does (LibreOffice for office
+# formats, direct reading for HTML/MHTML/Markdown/text) in a pool of worker
+# processes. Each worker runs LibreOffice with its own user profile so the
+# instances do not serialize on a shared profile lock.
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import file_operations
+import markdown_export
+import mhtml_export
+import docx_export
+import docx_import
+import mhtml_import
+import odt_export
+import wwd_format
+
+BATCH_OUTPUT_FORMATS = {
+    "wwd": ".wwd",
+    "html": ".html",
+    "md": ".md",
+    "txt": ".txt",
+    "mhtml": ".mht",
+    "odt": ".odt",
+    "docx": ".docx",
+}
+
+# LibreOffice profile of the current worker process
+_profile_dir = None
+
+
+class _TextExtractor(HTMLParser):
+    """Collect the text of an HTML fragment, one line per block element"""
+
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                  'pre', 'blockquote', 'table', 'ul', 'ol'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag in ('td', 'th'):
+            self.parts.append("\t")
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip = max(0, self._skip - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def get_text(self):
+        lines = "".join(self.parts).split("\n")
+        text = "\n".join(line.rstrip() for line in lines)
+        while "\n\n\n" in text:
+            text = text.replace("\n\n\n", "\n\n")
+        return text.strip() + "\n"
+
+
+def html_to_text(html_content):
+    """Plain text of an HTML fragment"""
+    extractor = _TextExtractor()
+    extractor.feed(html_content)
+    extractor.close()
+    return extractor.get_text()
+
+
+def document_to_html(input_path, profile_dir=None):
+    """Load a document the way load_file does and return its editor HTML"""
+    file_ext = os.path.splitext(input_path)[1].lower()
+    if file_ext == '.wwd':
+        archive = wwd_format.WwdArchive(input_path)
+        try:
+            return archive.get_editor_html(inline=True)
+        finally:
+            archive.close()
+    if file_ext in ('.mht', '.mhtml'):
+        archive = mhtml_import.MhtmlArchive(input_path)
+        try:
+            return archive.rewrite_sources(file_operations.extract_body(archive.get_html()), inline=True)
+        finally:
+            archive.close()
+    if file_ext == '.docx':
+        try:
+            return docx_import.docx_to_html(input_path)
+        except ValueError as e:
+            # Unsupported features or a damaged file; LibreOffice may cope
+            print(f"{os.path.basename(input_path)}: {e}, converting with LibreOffice", file=sys.stderr)
+    if not file_operations.is_libreoffice_format(input_path):
+        return file_operations.content_to_editor_html(file_operations.read_text_file(input_path), file_ext)
+
+    converted_file, output_dir = file_operations.convert_with_libreoffice(
+        None, input_path, "html", profile_dir=profile_dir)
+    if not converted_file:
+        raise RuntimeError("LibreOffice conversion failed")
+    try:
+        with open(converted_file, 'r', encoding='utf-8') as f:
+            html_content = file_operations.extract_body(f.read())
+        images_dir = file_operations.find_converted_images_dir(output_dir)
+        if images_dir:
+            html_content = file_operations._process_image_references(None, html_content, images_dir)
+        return html_content
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def write_output(html_content, output_format, output_path, base_dir=None):
+    """Write editor HTML to output_path in one of BATCH_OUTPUT_FORMATS"""
+    if output_format == "wwd":
+        with open(output_path, 'wb') as f:
+            wwd_format.write_wwd(f, html_content, html_to_text(html_content),
+                                 os.path.splitext(os.path.basename(output_path))[0], base_dir)
+        return
+
+    if output_format == "mhtml":
+        with open(output_path, 'wb') as f:
+            mhtml_export.write_mhtml(file_operations.wrap_html_document(html_content), f,
+                                     os.path.splitext(os.path.basename(output_path))[0], base_dir)
+        return
+
+    if output_format == "odt":
+        with open(output_path, 'wb') as f:
+            odt_export.write_odt(html_content, f, os.path.splitext(os.path.basename(output_path))[0], base_dir)
+        return
+
+    if output_format == "docx":
+        with open(output_path, 'wb') as f:
+            docx_export.write_docx(html_content, f, os.path.splitext(os.path.basename(output_path))[0], base_dir)
+        return
+
+    if output_format == "md":
+        with open(output_path, 'wb') as f:
+            markdown_export.write_markdown(html_content, f)
+        return
+
+    if output_format == "html":
+        data = file_operations.wrap_html_document(html_content)
+    elif output_format == "txt":
+        data = html_to_text(html_content)
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+
+
+def get_output_path(input_path, output_format, outdir=None):
+    """Output file for input_path, next to it unless outdir is given"""
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    directory = outdir or os.path.dirname(os.path.abspath(input_path))
+    output_path = os.path.join(directory, base_name + BATCH_OUTPUT_FORMATS[output_format])
+    if os.path.abspath(output_path) == os.path.abspath(input_path):
+        # Never overwrite the source document
+        output_path = os.path.join(directory, f"{base_name}.converted{BATCH_OUTPUT_FORMATS[output_format]}")
+    return output_path
+
+
+def _init_worker(profiles):
+    """Give this worker process its own LibreOffice profile"""
+    global _profile_dir
+    _profile_dir = profiles.get()
+
+
+def convert_file(input_path, output_format, outdir=None):
+    """Convert one file; runs in a worker process and never raises"""
+    started = time.monotonic()
+    output_path = get_output_path(input_path, output_format, outdir)
+    try:
+        html_content = document_to_html(input_path, _profile_dir)
+        write_output(html_content, output_format, output_path,
+                     os.path.dirname(os.path.abspath(input_path)))
+        error = None
+    except Exception as e:
+        error = str(e)
+    return {
+        "input": input_path,
+        "output": output_path,
+        "size": os.path.getsize(input_path) if os.path.exists(input_path) else 0,
+        "seconds": time.monotonic() - started,
+        "error": error,
+    }
+
+
+def main(argv):
+    """Entry point for webkitword --convert; returns the process exit status"""
+    parser = argparse.ArgumentParser(
+        prog="webkitword",
+        description="Convert documents without opening the editor.")
+    parser.add_argument("--convert", nargs="+", required=True, metavar="IN",
+                        help="documents to convert")
+    parser.add_argument("--to", required=True, choices=sorted(BATCH_OUTPUT_FORMATS),
+                        help="output format")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of parallel conversions (default: CPU count)")
+    parser.add_argument("--outdir", help="directory for converted files (default: next to each input)")
+    args = parser.parse_args(argv)
+
+    supported = set(file_operations.get_all_supported_extensions())
+    inputs = []
+    for path in args.convert:
+        if not os.path.isfile(path):
+            print(f"Skipping {path}: file not found", file=sys.stderr)
+        elif os.path.splitext(path)[1].lower() not in supported:
+            print(f"Skipping {path}: unsupported format", file=sys.stderr)
+        else:
+            inputs.append(path)
+    if not inputs:
+        return 1
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+
+    jobs = max(1, min(args.jobs, len(inputs)))
+    profile_root = tempfile.mkdtemp(prefix="webkitword-batch-")
+    context = multiprocessing.get_context("spawn")
+    profiles = context.Queue()
+    for index in range(jobs):
+        profiles.put(os.path.join(profile_root, f"profile-{index}"))
+
+    converted = 0
+    total_size = 0
+    started = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                 initializer=_init_worker, initargs=(profiles,)) as executor:
+            futures = [executor.submit(convert_file, path, args.to, args.outdir) for path in inputs]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                prefix = f"[{done}/{len(inputs)}]"
+                if result["error"]:
+                    print(f"{prefix} FAILED {result['input']}: {result['error']} "
+                          f"({result['seconds']:.2f}s)", file=sys.stderr)
+                else:
+                    converted += 1
+                    total_size += result["size"]
+                    print(f"{prefix} {result['input']} -> {result['output']} ({result['seconds']:.2f}s)")
+    finally:
+        shutil.rmtree(profile_root, ignore_errors=True)
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"Converted {converted} of {len(inputs)} files in {elapsed:.2f}s with {jobs} jobs: "
+          f"{converted / elapsed:.2f} files/s, {total_size / elapsed / (1024 * 1024):.2f} MB/s")
+    return 0 if converted == len(inputs) else 1
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# conversion_cache.py - content-addressed cache of LibreOffice conversions
+#
+# Each entry lives in $XDG_CACHE_HOME/webkitword/conversions/<key>/ where key
+# is the SHA-256 of the source document plus the converter version:
+#
+#   content.html   extracted <body> HTML
+#   <name>.html    hard links to content.html named after the source files
+#   images/        images written by the converter
+#   meta.json      entry size, used for eviction
+#
+# Entries are touched on every hit and the least recently used ones are
+# removed once the cache grows past CACHE_MAX_BYTES.
+import os
+import re
+import json
+import shutil
+import hashlib
+import subprocess
+
+# Bump when the stored layout or the HTML post-processing changes
+CACHE_FORMAT_VERSION = "1"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_converter_version = None
+
+
+def get_cache_dir():
+    """Root directory of the conversion cache"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "webkitword", "conversions")
+
+
+def get_converter_version():
+    """Identify the installed LibreOffice build, without starting it if possible"""
+    global _converter_version
+    if _converter_version is not None:
+        return _converter_version
+
+    version = "unknown"
+    office = shutil.which("libreoffice") or shutil.which("soffice")
+    if office:
+        # versionrc sits next to the real soffice binary and carries the build id
+        versionrc = os.path.join(os.path.dirname(os.path.realpath(office)), "versionrc")
+        try:
+            with open(versionrc, "r", encoding="utf-8", errors="replace") as f:
+                match = re.search(r"^buildid=(.+)$", f.read(), re.MULTILINE)
+                if match:
+                    version = match.group(1).strip()
+        except OSError:
+            pass
+
+        if version == "unknown":
+            try:
+                result = subprocess.run([office, "--version"], stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, timeout=30)
+                version = result.stdout.strip() or version
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+
+    _converter_version = version
+    return version
+
+
+def compute_cache_key(file_path):
+    """SHA-256 of the file contents, the converter version and the cache format"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    digest.update(b"\0" + get_converter_version().encode("utf-8"))
+    digest.update(b"\0" + CACHE_FORMAT_VERSION.encode("ascii"))
+    return digest.hexdigest()
+
+
+def is_cache_path(path):
+    """Check whether path lies inside the conversion cache"""
+    cache_dir = os.path.realpath(get_cache_dir())
+    return os.path.realpath(path).startswith(cache_dir + os.sep)
+
+
+def _named_html_path(entry_dir, base_name):
+    """Return <base_name>.html inside an entry, linking it to content.html if needed"""
+    content_path = os.path.join(entry_dir, "content.html")
+    safe_name = base_name.replace(os.sep, "_") or "document"
+    named_path = os.path.join(entry_dir, f"{safe_name}.html")
+    if not os.path.exists(named_path):
+        try:
+            os.link(content_path, named_path)
+        except OSError:
+            shutil.copyfile(content_path, named_path)
+    return named_path
+
+
+def lookup(key, base_name):
+    """
+    Look up a converted document
+
+    Returns:
+        Tuple of (body HTML, HTML path named after base_name, entry directory)
+        or None on a miss
+    """
+    entry_dir = os.path.join(get_cache_dir(), key)
+    content_path = os.path.join(entry_dir, "content.html")
+    try:
+        with open(content_path, "r", encoding="utf-8") as f:
+            html_content = f.read()
+        html_path = _named_html_path(entry_dir, base_name)
+        # Record the access for LRU eviction
+        os.utime(os.path.join(entry_dir, "meta.json"))
+    except OSError:
+        return None
+    return html_content, html_path, entry_dir
+
+
+def store(key, base_name, html_content, output_dir):
+    """
+    Add a conversion to the cache, moving the converter's images out of output_dir
+
+    Returns:
+        Tuple of (HTML path named after base_name, entry directory)
+    """
+    cache_dir = get_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    entry_dir = os.path.join(cache_dir, key)
+    staging_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+    images_dir = os.path.join(staging_dir, "images")
+    os.makedirs(images_dir)
+    total_size = 0
+
+    # Gather images whether the converter put them in an images/ folder or next to the HTML
+    source_dirs = [output_dir, os.path.join(output_dir, "images")]
+    for source_dir in source_dirs:
+        if not os.path.isdir(source_dir):
+            continue
+        for name in os.listdir(source_dir):
+            source_path = os.path.join(source_dir, name)
+            if os.path.isfile(source_path) and not name.lower().endswith((".html", ".htm")):
+                shutil.move(source_path, os.path.join(images_dir, name))
+                total_size += os.path.getsize(os.path.join(images_dir, name))
+
+    content_bytes = html_content.encode("utf-8")
+    with open(os.path.join(staging_dir, "content.html"), "wb") as f:
+        f.write(content_bytes)
+    total_size += len(content_bytes)
+
+    with open(os.path.join(staging_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"size": total_size, "converter": get_converter_version()}, f)
+
+    try:
+        os.rename(staging_dir, entry_dir)
+    except OSError:
+        # Another window stored the same document first; keep theirs
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    evict()
+    return _named_html_path(entry_dir, base_name), entry_dir
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    cache_dir = get_cache_dir()
+    entries = []
+    total_size = 0
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+
+    for name in names:
+        meta_path = os.path.join(cache_dir, name, "meta.json")
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                size = json.load(f).get("size", 0)
+            last_used = os.path.getmtime(meta_path)
+        except (OSError, ValueError):
+            continue
+        entries.append((last_used, size, name))
+        total_size += size
+
+    for last_used, size, name in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        total_size -= size
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# conversion_service.py - long-lived headless LibreOffice used for document conversion
+#
+# The app talks to a helper process (this file run with --worker) over a
+# line-based JSON protocol on stdin/stdout. The helper starts soffice once,
+# connects to it over a UNO pipe and converts every request with the already
+# warm office instance. Any process speaking the same protocol can stand in
+# for the helper, which is how the service is exercised without LibreOffice:
+#
+#   <- {"event": "ready"}                       once the office is accepting
+#   -> {"id": 1, "input": "/a.docx", "outdir": "/tmp/x", "format": "html:HTML (StarWriter)"}
+#   <- {"id": 1, "ok": true, "output": "/tmp/x/a.html"}
+#   <- {"id": 1, "ok": false, "error": "..."}
+import os
+import sys
+import json
+import glob
+import time
+import queue
+import atexit
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+import importlib.util
+
+# Stop the office after this many seconds without a request
+IDLE_TIMEOUT = 300
+# Seconds allowed for the office to start and for a single conversion
+START_TIMEOUT = 60
+CONVERT_TIMEOUT = 60
+# Restarts attempted for one request before giving up on the service
+MAX_RESTARTS = 2
+
+# Python interpreters shipped with LibreOffice, used when ours lacks pyuno
+UNO_PYTHON_CANDIDATES = [
+    "/usr/lib/libreoffice/program/python",
+    "/usr/lib64/libreoffice/program/python",
+    "/opt/libreoffice*/program/python",
+    "/app/libreoffice/program/python",
+]
+
+
+class ServiceUnavailable(Exception):
+    """The conversion service could not be started or has stopped"""
+
+
+class ConversionError(Exception):
+    """The office failed to convert a document"""
+
+
+class _HelperExited(ServiceUnavailable):
+    """The helper process went away while a request was in flight"""
+
+
+def find_uno_python():
+    """Return a Python interpreter that can import uno, or None"""
+    if importlib.util.find_spec("uno") is not None:
+        return sys.executable
+    for pattern in UNO_PYTHON_CANDIDATES:
+        for candidate in sorted(glob.glob(pattern)):
+            if os.access(candidate, os.X_OK):
+                return candidate
+    return None
+
+
+def default_worker_command():
+    """Command line for the helper process, or None if pyuno is not installed"""
+    python = find_uno_python()
+    if python is None or (shutil.which("soffice") is None and shutil.which("libreoffice") is None):
+        return None
+    return [python, os.path.abspath(__file__), "--worker"]
+
+
+class ConversionService:
+    """
+    Manage a persistent conversion helper process
+
+    The helper is started lazily by the first request (or by start()), is
+    restarted if it dies and is stopped after idle_timeout seconds without
+    work. convert() blocks the calling thread, so call it from a worker thread.
+    """
+
+    def __init__(self, command=None, idle_timeout=IDLE_TIMEOUT, start_timeout=START_TIMEOUT):
+        self.command = command
+        self.idle_timeout = idle_timeout
+        self.start_timeout = start_timeout
+        self._requests = queue.Queue()
+        self._process = None
+        self._responses = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._stopped = False
+
+    @property
+    def available(self):
+        return self.command is not None and not self._stopped
+
+    def start(self):
+        """Start the helper in the background without waiting for it"""
+        if self.available:
+            self._requests.put(None)
+            self._ensure_dispatcher()
+
+    def convert(self, input_file, outdir, conversion_format, timeout=CONVERT_TIMEOUT):
+        """
+        Convert input_file into outdir with the office's conversion_format
+        (same syntax as --convert-to, e.g. "html:HTML (StarWriter)")
+
+        Returns:
+            Path of the converted file
+        """
+        if not self.available:
+            raise ServiceUnavailable("Conversion service is not available")
+
+        with self._lock:
+            self._next_id += 1
+            request = {
+                "id": self._next_id,
+                "input": os.path.abspath(input_file),
+                "outdir": outdir,
+                "format": conversion_format,
+                "timeout": timeout,
+            }
+        reply = queue.Queue(maxsize=1)
+        self._requests.put((request, reply))
+        self._ensure_dispatcher()
+
+        response = reply.get()
+        if isinstance(response, Exception):
+            raise response
+        if not response.get("ok"):
+            raise ConversionError(response.get("error", "Conversion failed"))
+        return response["output"]
+
+    def shutdown(self):
+        """Stop the helper and refuse further requests"""
+        self._stopped = True
+        self._requests.put(None)
+        if self._dispatcher and self._dispatcher is not threading.current_thread():
+            self._dispatcher.join(timeout=5)
+        self._stop_process()
+
+    # Dispatcher thread: owns the helper process
+
+    def _ensure_dispatcher(self):
+        with self._lock:
+            if self._dispatcher is None or not self._dispatcher.is_alive():
+                self._dispatcher = threading.Thread(target=self._dispatch, daemon=True,
+                                                    name="conversion-service")
+                self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            try:
+                item = self._requests.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Idle: release the office, it is restarted on the next request
+                self._stop_process()
+                with self._lock:
+                    if self._requests.empty():
+                        self._dispatcher = None
+                        return
+                continue
+
+            if self._stopped:
+                self._fail_pending(item, ServiceUnavailable("Conversion service stopped"))
+                return
+
+            if item is None:
+                # Wake-up only: make sure the helper is warm
+                try:
+                    self._ensure_process()
+                except ServiceUnavailable as e:
+                    print(f"Could not start conversion service: {e}")
+                continue
+
+            request, reply = item
+            reply.put(self._run_request(request))
+
+    def _run_request(self, request):
+        last_error = None
+        for _ in range(MAX_RESTARTS + 1):
+            try:
+                self._ensure_process()
+                self._send(request)
+                while True:
+                    response = self._read(request["timeout"])
+                    # Skip late answers to requests that already timed out
+                    if response.get("id") == request["id"]:
+                        return response
+            except _HelperExited as e:
+                # Crashed: restart the helper and retry the request
+                last_error = e
+                self._stop_process()
+            except ServiceUnavailable as e:
+                # Hung or failed to start: retrying would only wait again
+                self._stop_process()
+                return e
+        return last_error
+
+    def _fail_pending(self, item, error):
+        while True:
+            if item is not None:
+                item[1].put(error)
+            try:
+                item = self._requests.get_nowait()
+            except queue.Empty:
+                return
+
+    def _ensure_process(self):
+        if self._process and self._process.poll() is None:
+            return
+
+        self._stop_process()
+        try:
+            self._process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=None,
+                text=True,
+                bufsize=1,
+                # Its own process group, so the office it starts can be
+                # stopped with it
+                start_new_session=True,
+            )
+        except OSError as e:
+            raise ServiceUnavailable(f"Could not start conversion helper: {e}")
+
+        self._responses = queue.Queue()
+        threading.Thread(target=self._read_output, args=(self._process, self._responses),
+                         daemon=True, name="conversion-service-reader").start()
+
+        started = time.monotonic()
+        message = self._read(self.start_timeout)
+        if message.get("event") != "ready":
+            self._stop_process()
+            raise ServiceUnavailable(message.get("error", "Conversion helper failed to start"))
+        print(f"Conversion service ready in {time.monotonic() - started:.1f}s")
+
+    @staticmethod
+    def _read_output(process, responses):
+        for line in process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                responses.put(json.loads(line))
+            except ValueError:
+                print(f"Conversion helper: {line}")
+        responses.put(None)  # EOF: the helper exited
+
+    def _send(self, request):
+        try:
+            self._process.stdin.write(json.dumps(request) + "\n")
+            self._process.stdin.flush()
+        except (OSError, ValueError, AttributeError) as e:
+            raise _HelperExited(f"Conversion helper is not running: {e}")
+
+    def _read(self, timeout):
+        try:
+            message = self._responses.get(timeout=timeout)
+        except queue.Empty:
+            raise ServiceUnavailable("Conversion helper timed out")
+        if message is None:
+            raise _HelperExited("Conversion helper exited")
+        return message
+
+    def _stop_process(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=10)
+        except Exception:
+            process.kill()
+            process.wait()
+        # A helper that hung or was killed leaves its office running, holding
+        # the profile lock; it shares the helper's process group
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_conversion_service():
+    """Return the shared conversion service, creating it on first use"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ConversionService(default_worker_command())
+            atexit.register(_service.shutdown)
+        return _service
+
+
+# Helper process side (runs under a Python that can import uno)
+
+def _property(name, value):
+    from com.sun.star.beans import PropertyValue
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def _connect_office(pipe_name, timeout):
+    import uno
+    local_context = uno.getComponentContext()
+    resolver = local_context.ServiceManager.createInstanceWithContext(
+        "com.sun.star.bridge.UnoUrlResolver", local_context)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            context = resolver.resolve(
+                f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+            return context.ServiceManager.createInstanceWithContext(
+                "com.sun.star.frame.Desktop", context)
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.25)
+
+
+def _convert_document(desktop, request):
+    import uno
+    ext, _, filter_name = request["format"].partition(":")
+    base_name = os.path.splitext(os.path.basename(request["input"]))[0]
+    output = os.path.join(request["outdir"], f"{base_name}.{ext}")
+
+    document = desktop.loadComponentFromURL(
+        uno.systemPathToFileUrl(request["input"]), "_blank", 0,
+        (_property("Hidden", True), _property("ReadOnly", True)))
+    if document is None:
+        raise ConversionError(f"Could not load {request['input']}")
+    try:
+        store_args = (_property("FilterName", filter_name),) if filter_name else ()
+        document.storeToURL(uno.systemPathToFileUrl(output), store_args)
+    finally:
+        document.close(True)
+    return output
+
+
+def run_worker():
+    """Serve conversion requests from stdin until it is closed"""
+    def emit(message):
+        sys.stdout.write(json.dumps(message) + "\n")
+        sys.stdout.flush()
+
+    office = shutil.which("soffice") or shutil.which("libreoffice")
+    profile_dir = tempfile.mkdtemp(prefix="webkitword-office-")
+    pipe_name = f"webkitword_{os.getpid()}"
+    process = None
+    try:
+        import uno  # noqa: F401 - fail early if pyuno is missing
+        process = subprocess.Popen([
+            office, "--headless", "--invisible", "--nologo", "--norestore",
+            "--nodefault", "--nolockcheck",
+            f"-env:UserInstallation=file://{profile_dir}",
+            f"--accept=pipe,name={pipe_name};urp;StarOffice.ComponentContext",
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        desktop = _connect_office(pipe_name, START_TIMEOUT)
+    except Exception as e:
+        emit({"event": "error", "error": f"Could not start office: {e}"})
+        if process:
+            process.kill()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        return 1
+
+    emit({"event": "ready"})
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            try:
+                output = _convert_document(desktop, request)
+                emit({"id": request["id"], "ok": True, "output": output})
+            except Exception as e:
+                if process.poll() is not None:
+                    # The office died; exit so the app restarts us
+                    emit({"id": request["id"], "ok": False, "error": f"Office crashed: {e}"})
+                    return 1
+                emit({"id": request["id"], "ok": False, "error": str(e)})
+    finally:
+        try:
+            desktop.terminate()
+        except Exception:
+            pass
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(profile_dir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__" and "--worker" in sys.argv:
+    sys.exit(run_worker())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# document_stats.py - word, character, paragraph and page counts
+#
+# The editor caches the counts of each top-level block and, in idle time,
+# recounts only the blocks that mutations touched, so typing never waits for
+# a count of the whole document. Totals, and the counts of the selection, are
+# sent over the documentStats message handler as
+#
+#   {"words": N, "chars": N, "paragraphs": N, "pages": N,
+#    "selection": {"words": N, "chars": N, "paragraphs": N} or null}
+import json
+from gi.repository import Gtk
+
+
+def create_stats_label(self, win):
+    """Create the statusbar label showing the document statistics"""
+    win.stats_label = Gtk.Label()
+    win.stats_label.add_css_class("dim-label")
+    win.stats_label.set_margin_start(10)
+    win.stats_label.set_margin_end(6)
+    return win.stats_label
+
+
+def on_document_stats(self, win, manager, result):
+    """Show the counts reported by the editor in the statusbar"""
+    label = getattr(win, 'stats_label', None)
+    if label is None:
+        return
+    try:
+        if hasattr(result, 'get_js_value'):
+            message = result.get_js_value().to_string()
+        else:
+            message = result.to_string()
+        stats = json.loads(message)
+    except Exception as e:
+        print(f"Invalid document statistics: {e}")
+        return
+
+    win.document_stats = stats
+    self.update_stats_label(win)
+
+
+def update_stats_label(self, win):
+    """Show the last counts, with the page of the caret once the editor is paginated"""
+    stats = getattr(win, 'document_stats', None)
+    if stats is None:
+        return
+    label = win.stats_label
+    page_count = getattr(win, 'page_count', None)
+    if page_count:
+        page_text = f"Page {win.current_page:,} of {page_count:,}"
+    else:
+        pages = stats['pages']
+        page_text = f"{pages:,} page{'s' if pages != 1 else ''}"
+    selection = stats.get('selection')
+    if selection:
+        label.set_text(f"{selection['words']:,} of {stats['words']:,} words  ·  {page_text}")
+        label.set_tooltip_text(
+            f"Selection: {selection['words']:,} words, {selection['chars']:,} characters, "
+            f"{selection['paragraphs']:,} paragraphs\n"
+            f"Document: {stats['words']:,} words, {stats['chars']:,} characters, "
+            f"{stats['paragraphs']:,} paragraphs")
+    else:
+        label.set_text(f"{stats['words']:,} words  ·  {page_text}")
+        label.set_tooltip_text(
+            f"{stats['words']:,} words, {stats['chars']:,} characters, "
+            f"{stats['paragraphs']:,} paragraphs")
+
+
+def document_stats_js(self):
+    """JavaScript that keeps word, character and paragraph counts per block"""
+    return """
+    // Pages are estimated from the word count until the document is paginated
+    const STATS_WORDS_PER_PAGE = 500;
+    // Elements that start a new line of text
+    const STATS_BREAKS = /^(BR|P|DIV|LI|TD|TH|TR|H[1-6]|PRE|BLOCKQUOTE|UL|OL|TABLE|HR)$/;
+    // Longest stretch of counting per idle callback, in milliseconds
+    const STATS_SLICE_MS = 8;
+
+    const statsState = {
+        counts: new Map(),   // top-level node -> its counts
+        totals: { words: 0, chars: 0, paragraphs: 0 },
+        dirty: new Set(),
+        pending: false,
+        lastReport: ''
+    };
+
+    function statsCount(root) {
+        const pieces = [];
+        let chars = 0;
+        function visit(node) {
+            if (node.nodeType === Node.TEXT_NODE) {
+                const preformatted = node.parentElement && node.parentElement.closest('pre');
+                const text = preformatted ? node.data : node.data.replace(/\\s+/g, ' ');
+                if (preformatted) {
+                    chars += text.replace(/\\n/g, '').length;
+                } else if (/\\S/.test(text)) {
+                    chars += text.length;
+                }
+                pieces.push(text);
+            } else if (STATS_BREAKS.test(node.nodeName)) {
+                pieces.push('\\n');
+            }
+        }
+        visit(root);
+        const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT);
+        while (walker.nextNode()) visit(walker.currentNode);
+
+        const text = pieces.join('');
+        const words = text.match(/\\S+/g);
+        let paragraphs = 0;
+        text.split('\\n').forEach(function(line) {
+            if (/\\S/.test(line)) paragraphs++;
+        });
+        return { words: words ? words.length : 0, chars: chars, paragraphs: paragraphs };
+    }
+
+    function statsAdd(totals, counts, sign) {
+        totals.words += sign * counts.words;
+        totals.chars += sign * counts.chars;
+        totals.paragraphs += sign * counts.paragraphs;
+    }
+
+    function statsBlockCounts(node) {
+        let counts = statsState.counts.get(node);
+        if (!counts || statsState.dirty.has(node)) counts = statsCount(node);
+        return counts;
+    }
+
+    // Counts of the selection: whole blocks come from the cache, only the
+    // blocks at either end are counted from their selected part
+    function statsSelection() {
+        const editor = document.getElementById('editor');
+        const selection = window.getSelection();
+        if (selection.rangeCount === 0 || selection.isCollapsed) return null;
+        const range = selection.getRangeAt(0);
+        if (!editor.contains(range.commonAncestorContainer)) return null;
+        if (range.commonAncestorContainer !== editor) return statsCount(range.cloneContents());
+
+        function topBlock(container, offset, isEnd) {
+            if (container === editor) return editor.childNodes[isEnd ? offset - 1 : offset] || null;
+            let node = container;
+            while (node && node.parentNode !== editor) node = node.parentNode;
+            return node;
+        }
+        const first = topBlock(range.startContainer, range.startOffset, false);
+        const last = topBlock(range.endContainer, range.endOffset, true);
+        if (!first || !last) return null;
+
+        const totals = { words: 0, chars: 0, paragraphs: 0 };
+        if (range.startContainer === editor) {
+            statsAdd(totals, statsBlockCounts(first), 1);
+        } else {
+            const head = document.createRange();
+            head.setStart(range.startContainer, range.startOffset);
+            head.setEndAfter(first);
+            statsAdd(totals, statsCount(head.cloneContents()), 1);
+        }
+        for (let node = first.nextSibling; node && node !== last; node = node.nextSibling) {
+            statsAdd(totals, statsBlockCounts(node), 1);
+        }
+        if (last !== first) {
+            if (range.endContainer === editor) {
+                statsAdd(totals, statsBlockCounts(last), 1);
+            } else {
+                const tail = document.createRange();
+                tail.setStartBefore(last);
+                tail.setEnd(range.endContainer, range.endOffset);
+                statsAdd(totals, statsCount(tail.cloneContents()), 1);
+            }
+        }
+        return totals;
+    }
+
+    function statsReport() {
+        const totals = statsState.totals;
+        const pages = Math.max(1, Math.ceil(totals.words / STATS_WORDS_PER_PAGE));
+        const message = JSON.stringify({
+            words: totals.words,
+            chars: totals.chars,
+            paragraphs: totals.paragraphs,
+            pages: pages,
+            selection: statsSelection()
+        });
+        if (message === statsState.lastReport) return;
+        statsState.lastReport = message;
+        try {
+            window.webkit.messageHandlers.documentStats.postMessage(message);
+        } catch (e) {
+            console.log("Could not send document statistics:", e);
+        }
+    }
+
+    function statsUpdate() {
+        const editor = document.getElementById('editor');
+        const started = performance.now();
+        for (const node of statsState.dirty) {
+            statsState.dirty.delete(node);
+            const previous = statsState.counts.get(node);
+            if (previous) {
+                statsAdd(statsState.totals, previous, -1);
+                statsState.counts.delete(node);
+            }
+            if (node.parentNode === editor) {
+                const counts = statsCount(node);
+                statsState.counts.set(node, counts);
+                statsAdd(statsState.totals, counts, 1);
+            }
+            if (performance.now() - started > STATS_SLICE_MS) break;
+        }
+        if (statsState.dirty.size > 0) {
+            scheduleIdle(statsUpdate);
+            return;
+        }
+        statsState.pending = false;
+        statsReport();
+    }
+
+    function statsSchedule() {
+        if (statsState.pending) return;
+        statsState.pending = true;
+        scheduleIdle(statsUpdate);
+    }
+
+    function statsMarkDirty(records) {
+        const editor = document.getElementById('editor');
+        records.forEach(function(record) {
+            if (record.target === editor) {
+                record.addedNodes.forEach(function(node) { statsState.dirty.add(node); });
+                record.removedNodes.forEach(function(node) { statsState.dirty.add(node); });
+                return;
+            }
+            let node = record.target;
+            while (node && node.parentNode !== editor) node = node.parentNode;
+            if (node) statsState.dirty.add(node);
+        });
+        statsSchedule();
+    }
+
+    function setupDocumentStats(editor) {
+        new MutationObserver(statsMarkDirty).observe(editor, {
+            childList: true, subtree: true, characterData: true
+        });
+        editor.childNodes.forEach(function(node) { statsState.dirty.add(node); });
+        document.addEventListener('selectionchange', statsSchedule);
+        statsSchedule();
+    }
+    """
@@ -0,0 +1,848 @@
+#!/usr/bin/env python3
+# docx_export.py - native WordprocessingML (.docx) export of editor content
+#
+# DocxConverter is an html.parser.HTMLParser working like OdtConverter: the
+# editor's paragraphs, headings, lists, blockquotes, <pre> blocks, tables
+# (floating tables and text boxes as floating tables), images and
+# <font>/<span style> runs are mapped onto word/document.xml as they are
+# parsed. Each distinct combination of run properties becomes one hidden
+# character style that runs refer to, and each distinct image is stored once
+# under word/media/.
+#
+# Like write_odt, the body is spooled while parsing and document.xml is
+# streamed into the package afterwards, followed by the styles, numbering and
+# relationships collected on the way. Entries carry a fixed timestamp, so the
+# same HTML always gives the same bytes and output can be compared against
+# golden files.
+import hashlib
+import tempfile
+import mimetypes
+import zipfile
+from html.parser import HTMLParser
+from xml.sax.saxutils import quoteattr
+
+from markdown_export import HEADING_TAGS, VOID_TAGS, SKIP_TAGS, SKIP_CLASSES, WHITESPACE
+from odt_export import (
+    BLOCK_TAGS, TAG_PROPERTIES, ALIGNMENTS, BORDER_PATTERN, SPOOL_MAX_SIZE, TEXT_WIDTH_CM,
+    parse_css, css_length_cm, css_color, span_properties, font_properties, image_size,
+    image_extent_cm, xml_text,
+)
+from wwd_format import read_image
+
+# Tables positioned as floating tables beside the text
+FLOATING_TABLE_CLASSES = {'floating-table', 'text-box', 'text-box-table'}
+# Tables that are layout rather than data: their cells are written as blocks
+LAYOUT_TABLE_CLASSES = {'image-table'}
+
+TWIPS_PER_CM = 1440 / 2.54
+EMU_PER_CM = 360000
+TEXT_WIDTH_TWIPS = round(TEXT_WIDTH_CM * TWIPS_PER_CM)
+LIST_INDENT_TWIPS = 720
+MAX_LIST_LEVEL = 8
+
+# Fixed entry timestamp so output is reproducible
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+DOCUMENT_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"
+OFFICE_RELATIONSHIPS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_RELATIONSHIPS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+W_NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    f'xmlns:r="{OFFICE_RELATIONSHIPS}" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"'
+)
+XML_PROLOG = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+ALIGN_VALUES = {'start': 'left', 'end': 'right', 'center': 'center', 'justify': 'both'}
+BORDER_STYLES = {'solid': 'single', 'dashed': 'dashed', 'dotted': 'dotted', 'double': 'double'}
+HEADING_SIZES = {1: 48, 2: 36, 3: 28, 4: 24, 5: 20, 6: 16}
+
+SECTION_PROPERTIES = (
+    '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+    '<w:pgMar w:top="1134" w:right="1134" w:bottom="1134" w:left="1134" '
+    'w:header="709" w:footer="709" w:gutter="0"/></w:sectPr>'
+)
+# A4 with 2 cm margins, in twips; see section_properties
+DEFAULT_PAGE = {'w': 11906, 'h': 16838, 'top': 1134, 'right': 1134, 'bottom': 1134, 'left': 1134,
+                'header': 709, 'footer': 709, 'gutter': 0}
+
+_HEADING_STYLES = ''.join(
+    f'<w:style w:type="paragraph" w:styleId="Heading{level}"><w:name w:val="heading {level}"/>'
+    '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:uiPriority w:val="9"/><w:qFormat/>'
+    f'<w:pPr><w:keepNext/><w:spacing w:before="240" w:after="120"/><w:outlineLvl w:val="{level - 1}"/></w:pPr>'
+    f'<w:rPr><w:rFonts w:ascii="Liberation Sans" w:hAnsi="Liberation Sans"/><w:b/><w:sz w:val="{size}"/></w:rPr>'
+    '</w:style>'
+    for level, size in HEADING_SIZES.items()
+)
+
+BASE_STYLES = (
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Liberation Serif" w:hAnsi="Liberation Serif" w:eastAsia="Liberation Serif" '
+    'w:cs="Liberation Serif"/><w:sz w:val="24"/><w:szCs w:val="24"/><w:lang w:val="en-US"/>'
+    '</w:rPr></w:rPrDefault><w:pPrDefault><w:pPr><w:widowControl/></w:pPr></w:pPrDefault></w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    + _HEADING_STYLES +
+    '<w:style w:type="paragraph" w:styleId="Quote"><w:name w:val="Quote"/><w:basedOn w:val="Normal"/>'
+    '<w:qFormat/><w:pPr><w:pBdr><w:left w:val="single" w:sz="4" w:space="6" w:color="C0C0C0"/></w:pBdr>'
+    '<w:spacing w:after="140"/><w:ind w:left="567" w:right="567"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="HTMLPreformatted"><w:name w:val="HTML Preformatted"/>'
+    '<w:basedOn w:val="Normal"/><w:pPr><w:shd w:val="clear" w:color="auto" w:fill="F4F4F4"/></w:pPr>'
+    '<w:rPr><w:rFonts w:ascii="Liberation Mono" w:hAnsi="Liberation Mono" w:cs="Liberation Mono"/>'
+    '<w:sz w:val="20"/></w:rPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="ListParagraph"><w:name w:val="List Paragraph"/>'
+    '<w:basedOn w:val="Normal"/><w:qFormat/><w:pPr><w:ind w:left="720"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="HorizontalLine"><w:name w:val="Horizontal Line"/>'
+    '<w:basedOn w:val="Normal"/><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="4" w:space="1" w:color="808080"/>'
+    '</w:pBdr><w:spacing w:after="280"/></w:pPr></w:style>'
+    '<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont">'
+    '<w:name w:val="Default Paragraph Font"/><w:uiPriority w:val="1"/><w:semiHidden/></w:style>'
+    '<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/>'
+    '<w:semiHidden/><w:tblPr><w:tblInd w:w="0" w:type="dxa"/><w:tblCellMar><w:top w:w="0" w:type="dxa"/>'
+    '<w:left w:w="108" w:type="dxa"/><w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/>'
+    '</w:tblCellMar></w:tblPr></w:style>'
+    '<w:style w:type="table" w:styleId="TableGrid"><w:name w:val="Table Grid"/><w:basedOn w:val="TableNormal"/>'
+    '<w:tblPr><w:tblBorders><w:top w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:left w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:bottom w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:right w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:insideH w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:insideV w:val="single" w:sz="4" w:space="0" w:color="auto"/></w:tblBorders>'
+    '<w:tblCellMar><w:top w:w="57" w:type="dxa"/><w:left w:w="57" w:type="dxa"/>'
+    '<w:bottom w:w="57" w:type="dxa"/><w:right w:w="57" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>'
+)
+
+
+def _abstract_numbering(abstract_id, ordered):
+    levels = []
+    for level in range(MAX_LIST_LEVEL + 1):
+        if ordered:
+            format_xml = f'<w:numFmt w:val="decimal"/><w:lvlText w:val="%{level + 1}."/>'
+        else:
+            format_xml = f'<w:numFmt w:val="bullet"/><w:lvlText w:val="{"•◦▪"[level % 3]}"/>'
+        levels.append(f'<w:lvl w:ilvl="{level}"><w:start w:val="1"/>{format_xml}<w:lvlJc w:val="left"/>'
+                      f'<w:pPr><w:ind w:left="{LIST_INDENT_TWIPS * (level + 1)}" w:hanging="360"/></w:pPr>'
+                      '</w:lvl>')
+    return (f'<w:abstractNum w:abstractNumId="{abstract_id}"><w:multiLevelType w:val="hybridMultilevel"/>'
+            f'{"".join(levels)}</w:abstractNum>')
+
+
+# abstractNumId of bulleted and numbered lists
+ABSTRACT_NUMBERING = {False: 0, True: 1}
+
+
+def _run_properties_xml(properties):
+    """WordprocessingML run properties for merged inline properties"""
+    parts = []
+    family = properties.get('family')
+    if family:
+        family = quoteattr(family)
+        parts.append(f'<w:rFonts w:ascii={family} w:hAnsi={family} w:cs={family}/>')
+    weight = properties.get('weight')
+    if weight:
+        parts.append('<w:b/><w:bCs/>' if weight == 'bold' else '<w:b w:val="0"/><w:bCs w:val="0"/>')
+    if properties.get('style'):
+        parts.append('<w:i/><w:iCs/>')
+    if properties.get('strike'):
+        parts.append('<w:strike/>')
+    color = properties.get('color')
+    if color:
+        parts.append(f'<w:color w:val="{color[1:].upper()}"/>')
+    size = properties.get('size')
+    if size and size.endswith('pt'):
+        half_points = max(2, round(float(size[:-2]) * 2))
+        parts.append(f'<w:sz w:val="{half_points}"/><w:szCs w:val="{half_points}"/>')
+    if properties.get('underline'):
+        parts.append('<w:u w:val="single"/>')
+    background = properties.get('background')
+    if background:
+        parts.append(f'<w:shd w:val="clear" w:color="auto" w:fill="{background[1:].upper()}"/>')
+    position = properties.get('position', '')
+    if position.startswith('sub'):
+        parts.append('<w:vertAlign w:val="subscript"/>')
+    elif position.startswith('super'):
+        parts.append('<w:vertAlign w:val="superscript"/>')
+    return ''.join(parts)
+
+
+def _border_xml(css):
+    """Cell borders for the border CSS the editor writes on cells"""
+    border = css.get('border', '').strip()
+    if border in ('none', '0', '0px'):
+        edge = '"nil"'
+        return ''.join(f'<w:{side} w:val={edge}/>' for side in ('top', 'left', 'bottom', 'right'))
+    match = BORDER_PATTERN.match(border)
+    if not match:
+        return ''
+    # Border widths are in eighths of a point
+    size = max(2, round(float(match.group(1)) * 0.75 * 8))
+    color = (css_color(match.group(3)) or '#000000')[1:].upper()
+    style = BORDER_STYLES[match.group(2)]
+    return ''.join(f'<w:{side} w:val="{style}" w:sz="{size}" w:space="0" w:color="{color}"/>'
+                   for side in ('top', 'left', 'bottom', 'right'))
+
+
+class DocxConverter(HTMLParser):
+    """
+    Convert editor HTML to the body of a WordprocessingML document
+
+    Body XML is passed to write() as it is produced; add_media(name, data)
+    stores an image in the package. After close(), run_styles(), numbering()
+    and relationships() return what the body refers to.
+    """
+
+    def __init__(self, write, add_media, base_dir=None):
+        super().__init__(convert_charrefs=True)
+        self._write = write
+        self._add_media = add_media
+        self._base_dir = base_dir
+        self._stack = []            # open elements: (tag, closing action)
+        self._skip_depth = 0
+        self._buffers = []          # output of the open tables, innermost last
+        self._blocks = []           # open blocks: {'level', 'align'}
+        self._para = False
+        self._pending_breaks = 0
+        self._last_space = True
+        self._tail = None           # 'p' or 'tbl', whichever block was written last
+        self._inline = []           # run properties of the open inline elements
+        self._links = []
+        self._link_open = False
+        self._lists = []            # {'num_id', 'item_open', 'numbered'}
+        self._tables = []
+        self._quote_depth = 0
+        self._pre_depth = 0
+        self._run_styles = {}
+        self._run_style_xml = []
+        self._nums = []
+        self._relationships = []
+        self._link_ids = {}
+        self._media = {}            # image digest -> (relationship id, name)
+        self._sources = {}          # src -> (relationship id, pixel size), False if unreadable
+        self._drawing_count = 0
+
+    # Output
+
+    def _emit(self, xml):
+        if self._buffers:
+            self._buffers[-1].append(xml)
+        else:
+            self._write(xml)
+
+    def _relationship(self, kind, target, external=False):
+        rel_id = f"rId{len(self._relationships) + 3}"
+        mode = ' TargetMode="External"' if external else ''
+        self._relationships.append(f'<Relationship Id="{rel_id}" Type="{OFFICE_RELATIONSHIPS}/{kind}" '
+                                   f'Target={quoteattr(target)}{mode}/>')
+        return rel_id
+
+    def _run_style(self, properties):
+        """Id of the character style holding these run properties, defining it on first use"""
+        body = _run_properties_xml(properties)
+        if not body:
+            return None
+        style_id = self._run_styles.get(body)
+        if style_id is None:
+            style_id = f"Run{len(self._run_styles) + 1}"
+            self._run_styles[body] = style_id
+            self._run_style_xml.append(
+                f'<w:style w:type="character" w:customStyle="1" w:styleId="{style_id}">'
+                f'<w:name w:val="Run {len(self._run_styles)}"/><w:basedOn w:val="DefaultParagraphFont"/>'
+                f'<w:semiHidden/><w:rPr>{body}</w:rPr></w:style>')
+        return style_id
+
+    def run_styles(self):
+        return ''.join(self._run_style_xml)
+
+    def numbering(self):
+        abstract = ''.join(_abstract_numbering(abstract_id, ordered)
+                           for ordered, abstract_id in ABSTRACT_NUMBERING.items())
+        return abstract + ''.join(self._nums)
+
+    def relationships(self):
+        return ''.join(self._relationships)
+
+    # Block structure
+
+    def _in_cell(self):
+        """Whether block content is allowed here (not between table rows)"""
+        return not self._tables or self._tables[-1]['layout'] or self._tables[-1]['cell_open']
+
+    def _paragraph_properties(self, level):
+        properties = []
+        if level:
+            properties.append(f'<w:pStyle w:val="Heading{level}"/>')
+        elif self._pre_depth:
+            properties.append('<w:pStyle w:val="HTMLPreformatted"/>')
+        elif self._quote_depth:
+            properties.append('<w:pStyle w:val="Quote"/>')
+        elif self._lists:
+            properties.append('<w:pStyle w:val="ListParagraph"/>')
+        if self._lists:
+            item = self._lists[-1]
+            list_level = min(len(self._lists) - 1, MAX_LIST_LEVEL)
+            if item['item_open'] and not item['numbered']:
+                # The first paragraph of an item carries its bullet or number
+                properties.append(f'<w:numPr><w:ilvl w:val="{list_level}"/>'
+                                  f'<w:numId w:val="{item["num_id"]}"/></w:numPr>')
+                item['numbered'] = True
+            else:
+                properties.append(f'<w:ind w:left="{LIST_INDENT_TWIPS * (list_level + 1)}"/>')
+        align = next((block['align'] for block in reversed(self._blocks) if block['align']), None)
+        if align:
+            properties.append(f'<w:jc w:val="{ALIGN_VALUES[align]}"/>')
+        return ''.join(properties)
+
+    def _ensure_paragraph(self):
+        """Open a paragraph for inline content; False where none is allowed"""
+        if self._para:
+            return True
+        if not self._in_cell():
+            return False
+        block = self._blocks[-1] if self._blocks else None
+        properties = self._paragraph_properties(block['level'] if block else 0)
+        self._emit(f'<w:p><w:pPr>{properties}</w:pPr>' if properties else '<w:p>')
+        self._para = True
+        self._pending_breaks = 0
+        self._last_space = True
+        return True
+
+    def _end_paragraph(self):
+        if not self._para:
+            return
+        self._close_link()
+        # A trailing <br> only ends the line, as in the browser
+        self._emit('<w:r><w:br/></w:r>' * max(0, self._pending_breaks - 1))
+        self._pending_breaks = 0
+        self._emit('</w:p>')
+        self._para = False
+        self._tail = 'p'
+
+    def _start_block(self, level=0, align=None):
+        self._end_paragraph()
+        self._blocks.append({'level': level, 'align': align})
+        return ('block',)
+
+    def _end_block(self):
+        self._end_paragraph()
+        self._blocks.pop()
+
+    # Inline content
+
+    def _flush_breaks(self):
+        if self._pending_breaks:
+            self._emit('<w:r><w:br/></w:r>' * self._pending_breaks)
+            self._pending_breaks = 0
+            self._last_space = True
+
+    def _run_properties(self):
+        properties = {}
+        if self._link_open:
+            properties.update({'color': '#0563c1', 'underline': True})
+        for item in self._inline:
+            properties.update(item)
+        style_id = self._run_style(properties)
+        return f'<w:rPr><w:rStyle w:val="{style_id}"/></w:rPr>' if style_id else ''
+
+    def _open_link(self):
+        if self._links and self._links[-1] and not self._link_open:
+            href = self._links[-1]
+            rel_id = self._link_ids.get(href)
+            if rel_id is None:
+                rel_id = self._link_ids[href] = self._relationship("hyperlink", href, external=True)
+            self._emit(f'<w:hyperlink r:id="{rel_id}" w:history="1">')
+            self._link_open = True
+
+    def _close_link(self):
+        if self._link_open:
+            self._emit('</w:hyperlink>')
+            self._link_open = False
+
+    def _append_text(self, text):
+        if self._pre_depth:
+            if not text or not self._ensure_paragraph():
+                return
+            self._flush_breaks()
+            self._open_link()
+            self._emit(self._preformatted(text, self._run_properties()))
+            return
+        text = WHITESPACE.sub(' ', text)
+        if not self._para and not text.strip():
+            return
+        if not self._ensure_paragraph():
+            return
+        if self._last_space:
+            text = text.lstrip(' ')
+        if not text:
+            return
+        self._last_space = text.endswith(' ')
+        self._flush_breaks()
+        self._open_link()
+        self._emit(f'<w:r>{self._run_properties()}<w:t xml:space="preserve">{xml_text(text)}</w:t></w:r>')
+
+    def _preformatted(self, text, properties):
+        parts = [f'<w:r>{properties}']
+        for index, line in enumerate(text.split('\n')):
+            if index:
+                parts.append('<w:br/>')
+            for tab_index, piece in enumerate(line.split('\t')):
+                if tab_index:
+                    parts.append('<w:tab/>')
+                if piece:
+                    parts.append(f'<w:t xml:space="preserve">{xml_text(piece)}</w:t>')
+        parts.append('</w:r>')
+        return ''.join(parts)
+
+    # Parser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict((name, value or '') for name, value in attrs)
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._skip_depth += 1
+            return
+        classes = set(attrs.get('class', '').split())
+        if tag in SKIP_TAGS or classes & SKIP_CLASSES:
+            if tag not in VOID_TAGS:
+                self._skip_depth = 1
+            return
+
+        css = parse_css(attrs.get('style'))
+        align = ALIGNMENTS.get((css.get('text-align') or attrs.get('align') or '').lower())
+        action = None
+        if tag == 'br':
+            if self._ensure_paragraph():
+                self._pending_breaks += 1
+        elif tag == 'img':
+            self._image(attrs, css)
+        elif tag == 'hr':
+            self._end_paragraph()
+            if self._in_cell():
+                self._emit('<w:p><w:pPr><w:pStyle w:val="HorizontalLine"/></w:pPr></w:p>')
+                self._tail = 'p'
+        elif tag in HEADING_TAGS:
+            action = self._start_block(HEADING_TAGS[tag], align)
+        elif tag in BLOCK_TAGS:
+            action = self._start_block(0, 'center' if tag == 'center' else align)
+        elif tag in ('ul', 'ol'):
+            action = self._start_list(tag == 'ol', attrs.get('start', ''))
+        elif tag == 'li':
+            action = self._start_item(align)
+        elif tag == 'blockquote':
+            self._start_block(0, align)
+            self._quote_depth += 1
+            action = ('quote',)
+        elif tag == 'pre':
+            self._start_block(0, align)
+            self._pre_depth += 1
+            action = ('pre',)
+        elif tag == 'a':
+            href = attrs.get('href', '')
+            self._close_link()
+            self._links.append(href if href and not href.startswith('javascript:') else None)
+            action = ('link',)
+        elif tag == 'table':
+            action = self._start_table(attrs, css, classes)
+        elif tag == 'tr':
+            action = self._start_row()
+        elif tag in ('td', 'th'):
+            action = self._start_cell(tag, attrs, css, align)
+        elif tag in TAG_PROPERTIES or tag in ('span', 'font'):
+            if tag == 'font':
+                properties = font_properties(attrs)
+            else:
+                properties = dict(TAG_PROPERTIES.get(tag, {}))
+                properties.update(span_properties(attrs.get('style')))
+            self._inline.append(properties)
+            action = ('inline',)
+
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, action))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        # Close everything up to the matching element, like a browser would
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            open_tag, action = self._stack.pop()
+            self._end_element(open_tag, action)
+
+    def _end_element(self, tag, action):
+        if action is None:
+            return
+        kind = action[0]
+        if kind == 'block':
+            self._end_block()
+        elif kind == 'quote':
+            self._end_block()
+            self._quote_depth -= 1
+        elif kind == 'pre':
+            self._end_block()
+            self._pre_depth -= 1
+        elif kind == 'inline':
+            self._inline.pop()
+        elif kind == 'link':
+            self._close_link()
+            self._links.pop()
+        elif kind == 'list':
+            self._end_list()
+        elif kind == 'item':
+            self._end_item()
+        elif kind == 'table':
+            self._end_table(action[1])
+        elif kind == 'row':
+            self._end_row()
+        elif kind == 'cell':
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self._append_text(data)
+
+    def close(self):
+        super().close()
+        while self._stack:
+            tag, action = self._stack.pop()
+            self._end_element(tag, action)
+        self._end_paragraph()
+
+    # Lists
+
+    def _start_list(self, ordered, start):
+        self._end_paragraph()
+        if not self._in_cell():
+            return None
+        # Every list gets its own instance so numbering restarts
+        num_id = len(self._nums) + 1
+        override = ''
+        if ordered:
+            level = min(len(self._lists), MAX_LIST_LEVEL)
+            start = int(start) if start.isdigit() else 1
+            override = f'<w:lvlOverride w:ilvl="{level}"><w:startOverride w:val="{start}"/></w:lvlOverride>'
+        self._nums.append(f'<w:num w:numId="{num_id}"><w:abstractNumId w:val="{ABSTRACT_NUMBERING[ordered]}"/>'
+                          f'{override}</w:num>')
+        self._lists.append({'num_id': num_id, 'item_open': False, 'numbered': False})
+        return ('list',)
+
+    def _end_list(self):
+        self._end_paragraph()
+        self._lists.pop()
+
+    def _start_item(self, align):
+        if not self._lists:
+            return self._start_block(0, align)
+        self._end_paragraph()
+        self._lists[-1]['item_open'] = True
+        self._lists[-1]['numbered'] = False
+        self._blocks.append({'level': 0, 'align': align})
+        return ('item',)
+
+    def _end_item(self):
+        self._end_paragraph()
+        self._blocks.pop()
+        if self._lists:
+            self._lists[-1]['item_open'] = False
+
+    # Tables
+
+    def _start_table(self, attrs, css, classes):
+        self._end_paragraph()
+        if not self._in_cell():
+            return None
+        layout = bool(classes & LAYOUT_TABLE_CLASSES)
+        if not layout and self._tail == 'tbl':
+            # Adjacent tables would merge into one
+            self._emit('<w:p/>')
+            self._tail = 'p'
+        width = css_length_cm(css.get('width') or attrs.get('width'))
+        floating = bool(classes & FLOATING_TABLE_CLASSES)
+        if floating and width is None:
+            width = TEXT_WIDTH_CM / 2
+        table = {
+            'layout': layout, 'floating': floating, 'classes': classes, 'columns': 0, 'row_columns': 0,
+            'row_open': False, 'cell_open': False, 'cell_header': False, 'blocks': len(self._blocks),
+            'width': min(width, TEXT_WIDTH_CM) if width else None,
+            # Cells start a fresh block context
+            'state': (self._lists, self._quote_depth, self._pre_depth),
+        }
+        self._tables.append(table)
+        if not layout:
+            self._lists, self._quote_depth, self._pre_depth = [], 0, 0
+            self._buffers.append([])
+        return ('table', table)
+
+    def _start_row(self):
+        if not self._tables:
+            return None
+        table = self._tables[-1]
+        if table['layout']:
+            return None
+        if table['row_open']:
+            self._unwind('row')
+            self._end_row()
+        self._emit('<w:tr>')
+        table['row_open'] = True
+        table['row_columns'] = 0
+        return ('row',)
+
+    def _end_row(self):
+        table = self._tables[-1]
+        if table['cell_open']:
+            self._end_cell()
+        if table['row_open']:
+            if table['row_columns'] == 0:
+                # A row needs at least one cell
+                self._emit('<w:tc><w:p/></w:tc>')
+                table['row_columns'] = 1
+            self._emit('</w:tr>')
+            table['row_open'] = False
+            table['columns'] = max(table['columns'], table['row_columns'])
+
+    def _start_cell(self, tag, attrs, css, align):
+        if not self._tables or self._tables[-1]['layout']:
+            return self._start_block(0, align)
+        table = self._tables[-1]
+        if table['cell_open']:
+            self._unwind('cell')
+            self._end_cell()
+        if not table['row_open']:
+            self._emit('<w:tr>')
+            table['row_open'] = True
+            table['row_columns'] = 0
+        span = attrs.get('colspan', '1')
+        span = max(1, int(span)) if span.isdigit() else 1
+        properties = []
+        if span > 1:
+            properties.append(f'<w:gridSpan w:val="{span}"/>')
+        borders = _border_xml(css)
+        if borders:
+            properties.append(f'<w:tcBorders>{borders}</w:tcBorders>')
+        background = css_color(css.get('background-color'))
+        if background:
+            properties.append(f'<w:shd w:val="clear" w:color="auto" w:fill="{background[1:].upper()}"/>')
+        self._emit(f'<w:tc><w:tcPr>{"".join(properties)}</w:tcPr>' if properties else '<w:tc>')
+        table['cell_open'] = True
+        table['cell_header'] = tag == 'th'
+        table['row_columns'] += span
+        self._tail = None
+        self._blocks.append({'level': 0, 'align': align})
+        if tag == 'th':
+            self._inline.append({'weight': 'bold'})
+        return ('cell',)
+
+    def _end_cell(self):
+        table = self._tables[-1]
+        if not table['cell_open']:
+            return
+        self._end_paragraph()
+        self._blocks.pop()
+        # Every cell ends with a paragraph
+        self._emit('</w:tc>' if self._tail == 'p' else '<w:p/></w:tc>')
+        table['cell_open'] = False
+        if table['cell_header']:
+            self._inline.pop()
+
+    def _unwind(self, kind):
+        """End the open elements up to and including the innermost one of kind in this table"""
+        for index in range(len(self._stack) - 1, -1, -1):
+            action = self._stack[index][1]
+            if action and action[0] == 'table':
+                return
+            if action and action[0] == kind:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            tag, action = self._stack.pop()
+            self._end_element(tag, action)
+
+    def _end_table(self, table):
+        if table['layout']:
+            self._end_paragraph()
+            del self._blocks[table['blocks']:]
+            self._tables.pop()
+            return
+        self._end_row()
+        self._tables.pop()
+        self._lists, self._quote_depth, self._pre_depth = table['state']
+        rows = self._buffers.pop()
+        columns = max(1, table['columns'])
+
+        properties = ['<w:tblStyle w:val="TableGrid"/>']
+        classes = table['classes']
+        if table['floating'] and 'no-wrap' not in classes:
+            if 'right-align' in classes:
+                position = 'right'
+            elif 'center-align' in classes:
+                position = 'center'
+            else:
+                position = 'left'
+            properties.append(f'<w:tblpPr w:leftFromText="142" w:rightFromText="142" w:bottomFromText="142" '
+                              f'w:vertAnchor="text" w:horzAnchor="margin" w:tblpXSpec="{position}" w:tblpY="1"/>')
+        elif 'center-align' in classes:
+            properties.append('<w:jc w:val="center"/>')
+        elif 'right-align' in classes:
+            properties.append('<w:jc w:val="right"/>')
+        if table['width']:
+            total = round(table['width'] * TWIPS_PER_CM)
+            properties.append(f'<w:tblW w:w="{total}" w:type="dxa"/>')
+        else:
+            total = TEXT_WIDTH_TWIPS
+            properties.append('<w:tblW w:w="5000" w:type="pct"/>')
+        properties.append('<w:tblLook w:val="0000"/>')
+        column = f'<w:gridCol w:w="{total // columns}"/>'
+        self._emit(f'<w:tbl><w:tblPr>{"".join(properties)}</w:tblPr><w:tblGrid>{column * columns}</w:tblGrid>')
+        self._emit(''.join(rows))
+        self._emit('</w:tbl>')
+        self._tail = 'tbl'
+
+    # Images
+
+    def _store_media(self, src):
+        """Add the image behind src to the package; (relationship id, pixel size) or False"""
+        try:
+            image = read_image(src, self._base_dir)
+        except (ValueError, OSError):
+            image = None
+        if image is None:
+            return False
+        data, media_type = image
+        digest = hashlib.sha1(data).hexdigest()
+        rel_id = self._media.get(digest)
+        if rel_id is None:
+            extension = mimetypes.guess_extension(media_type) or '.bin'
+            name = f"media/{digest}{extension}"
+            self._add_media(name, data, media_type)
+            rel_id = self._media[digest] = self._relationship("image", name)
+        return rel_id, image_size(data)
+
+    def _image(self, attrs, css):
+        src = attrs.get('src', '')
+        if not src or attrs.get('data-lazy-placeholder') is not None:
+            return
+        media = self._sources.get(src)
+        if media is None:
+            media = self._sources[src] = self._store_media(src)
+        if media is False:
+            if attrs.get('alt'):
+                self._append_text(attrs['alt'])
+            return
+        rel_id, natural = media
+        width, height = image_extent_cm(natural, css_length_cm(css.get('width') or attrs.get('width')),
+                                        css_length_cm(css.get('height') or attrs.get('height')))
+        if not self._ensure_paragraph():
+            return
+        self._flush_breaks()
+        self._drawing_count += 1
+        number = self._drawing_count
+        cx, cy = round(width * EMU_PER_CM), round(height * EMU_PER_CM)
+        description = quoteattr(attrs.get('alt', ''))
+        self._emit(
+            '<w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{number}" name="Picture {number}" descr={description}/>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+            f'<pic:nvPicPr><pic:cNvPr id="{number}" name="Picture {number}"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+            '</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r>')
+        self._last_space = False
+
+
+def _entry(name, compress_type=zipfile.ZIP_DEFLATED):
+    info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def section_properties(page=None):
+    """
+    The w:sectPr of a document
+
+    page keeps the layout of an opened .docx (docx_import.DocxArchive.page):
+    twips by attribute name of w:pgSz and w:pgMar, and the orientation.
+    """
+    if not page:
+        return SECTION_PROPERTIES
+    values = {name: int(page.get(name, default)) for name, default in DEFAULT_PAGE.items()}
+    orient = ' w:orient="landscape"' if page.get('orient') == 'landscape' else ''
+    return (
+        f'<w:sectPr><w:pgSz w:w="{values["w"]}" w:h="{values["h"]}"{orient}/>'
+        f'<w:pgMar w:top="{values["top"]}" w:right="{values["right"]}" w:bottom="{values["bottom"]}" '
+        f'w:left="{values["left"]}" w:header="{values["header"]}" w:footer="{values["footer"]}" '
+        f'w:gutter="{values["gutter"]}"/></w:sectPr>'
+    )
+
+
+def write_docx(html_content, output, title="Document", base_dir=None, chunk_size=64 * 1024, page=None):
+    """Write editor HTML to a binary file object as a .docx document; see section_properties for page"""
+    media_types = {}
+    with zipfile.ZipFile(output, 'w') as archive:
+        def add_media(name, data, media_type):
+            # Images are compressed already
+            archive.writestr(_entry("word/" + name, zipfile.ZIP_STORED), data)
+            media_types[name.rsplit('.', 1)[-1]] = media_type
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', encoding='utf-8') as body:
+            converter = DocxConverter(body.write, add_media, base_dir)
+            for start in range(0, len(html_content), chunk_size):
+                converter.feed(html_content[start:start + chunk_size])
+            converter.close()
+            body.seek(0)
+            with archive.open(_entry("word/document.xml"), 'w') as document:
+                document.write(f'{XML_PROLOG}<w:document {W_NAMESPACES}><w:body>'.encode('utf-8'))
+                while True:
+                    chunk = body.read(chunk_size)
+                    if not chunk:
+                        break
+                    document.write(chunk.encode('utf-8'))
+                document.write(f'{section_properties(page)}</w:body></w:document>'.encode('utf-8'))
+
+        archive.writestr(_entry("word/styles.xml"), (
+            f'{XML_PROLOG}<w:styles {W_NAMESPACES}>{BASE_STYLES}{converter.run_styles()}</w:styles>'))
+        archive.writestr(_entry("word/numbering.xml"), (
+            f'{XML_PROLOG}<w:numbering {W_NAMESPACES}>{converter.numbering()}</w:numbering>'))
+        archive.writestr(_entry("word/_rels/document.xml.rels"), (
+            f'{XML_PROLOG}<Relationships xmlns="{PACKAGE_RELATIONSHIPS}">'
+            f'<Relationship Id="rId1" Type="{OFFICE_RELATIONSHIPS}/styles" Target="styles.xml"/>'
+            f'<Relationship Id="rId2" Type="{OFFICE_RELATIONSHIPS}/numbering" Target="numbering.xml"/>'
+            f'{converter.relationships()}</Relationships>'))
+        archive.writestr(_entry("docProps/core.xml"), (
+            f'{XML_PROLOG}<cp:coreProperties '
+            'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:title>{xml_text(title)}</dc:title><dc:creator>WebkitWord</dc:creator></cp:coreProperties>'))
+        archive.writestr(_entry("_rels/.rels"), (
+            f'{XML_PROLOG}<Relationships xmlns="{PACKAGE_RELATIONSHIPS}">'
+            f'<Relationship Id="rId1" Type="{OFFICE_RELATIONSHIPS}/officeDocument" Target="word/document.xml"/>'
+            '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/'
+            'core-properties" Target="docProps/core.xml"/></Relationships>'))
+        defaults = ''.join(f'<Default Extension="{extension}" ContentType="{media_type}"/>'
+                           for extension, media_type in sorted(media_types.items()))
+        archive.writestr(_entry("[Content_Types].xml"), (
+            f'{XML_PROLOG}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>{defaults}'
+            f'<Override PartName="/word/document.xml" ContentType="{DOCUMENT_MEDIA_TYPE}"/>'
+            '<Override PartName="/word/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+            '<Override PartName="/word/numbering.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+            '<Override PartName="/docProps/core.xml" '
+            'ContentType="application/vnd.openxmlformats-package.core-properties+xml"/></Types>'))
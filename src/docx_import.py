@@ -0,0 +1,747 @@
+#!/usr/bin/env python3
+# docx_import.py - native reading of .docx documents
+#
+# The common subset of WordprocessingML -- paragraphs and runs, headings,
+# numbered and bulleted lists, tables (with merged cells) and inline images,
+# hyperlinks -- is converted straight into the editor's HTML dialect.
+# word/document.xml is read with iterparse, one top-level block at a time,
+# and every block is dropped once converted, so memory stays bounded by the
+# largest table.
+#
+# Documents using anything outside that subset (footnotes, text boxes and
+# shapes, equations, embedded objects, headers and footers, comments, tracked
+# changes, fields, bookmarks, page layouts other than one plain section, ...)
+# raise UnsupportedDocument, and the caller falls back to converting with
+# LibreOffice. Whatever a document opened here holds, saving it as .docx must
+# keep, so anything the editor would drop on save counts as unsupported. The
+# page size and margins of the section are kept as DocxArchive.page and
+# written back by docx_export. Styles, theme and settings are not, so like a
+# converted document it is saved with Save As, never over the original.
+#
+# An opened document is an archive of mhtml_import's registry: images point
+# at webkitword-archive://<archive id>/<media name> and are read from the zip
+# when the editor requests them.
+import os
+import re
+import base64
+import hashlib
+import zipfile
+import mimetypes
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+from html import escape
+
+import mhtml_import
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+WP = '{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+MC = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+M = '{http://schemas.openxmlformats.org/officeDocument/2006/math}'
+PACKAGE_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+PICTURE_URI = "http://schemas.openxmlformats.org/drawingml/2006/picture"
+
+DOCUMENT_PART = "word/document.xml"
+MEDIA_KEY_PATTERN = re.compile(r'[\w.-]+')
+
+# Elements whose content this reader cannot represent
+UNSUPPORTED_ELEMENTS = {
+    W + 'footnoteReference': "footnotes",
+    W + 'endnoteReference': "endnotes",
+    W + 'object': "embedded objects",
+    W + 'pict': "VML drawings",
+    W + 'txbxContent': "text boxes",
+    W + 'altChunk': "embedded documents",
+    MC + 'AlternateContent': "shapes",
+    M + 'oMath': "equations",
+    M + 'oMathPara': "equations",
+    W + 'headerReference': "headers",
+    W + 'footerReference': "footers",
+    W + 'commentRangeStart': "comments",
+    W + 'commentReference': "comments",
+    W + 'fldSimple': "fields",
+    W + 'fldChar': "fields",
+    W + 'instrText': "fields",
+    W + 'bookmarkStart': "bookmarks",
+    W + 'ins': "tracked changes",
+    W + 'del': "tracked changes",
+    W + 'moveFrom': "tracked changes",
+    W + 'moveTo': "tracked changes",
+    W + 'rPrChange': "tracked changes",
+    W + 'pPrChange': "tracked changes",
+    W + 'sectPrChange': "tracked changes",
+    W + 'tblPrChange': "tracked changes",
+    W + 'trPrChange': "tracked changes",
+    W + 'tcPrChange': "tracked changes",
+}
+
+# Section properties that need nothing kept beyond the page size and margins
+PLAIN_SECTION_ELEMENTS = {W + 'type', W + 'formProt', W + 'pgNumType', W + 'titlePg'}
+PAGE_SIZE_ATTRIBUTES = ('w', 'h')
+PAGE_MARGIN_ATTRIBUTES = ('top', 'right', 'bottom', 'left', 'header', 'footer', 'gutter')
+
+# Elements that only wrap content
+TRANSPARENT_ELEMENTS = {W + 'smartTag', W + 'customXml', W + 'dir', W + 'bdo'}
+
+ALIGNMENTS = {'center': 'center', 'right': 'right', 'end': 'right', 'both': 'justify', 'distribute': 'justify'}
+HIGHLIGHT_COLORS = {
+    'yellow': '#ffff00', 'green': '#00ff00', 'cyan': '#00ffff', 'magenta': '#ff00ff', 'blue': '#0000ff',
+    'red': '#ff0000', 'darkBlue': '#000080', 'darkCyan': '#008080', 'darkGreen': '#008000',
+    'darkMagenta': '#800080', 'darkRed': '#800000', 'darkYellow': '#808000', 'darkGray': '#808080',
+    'lightGray': '#c0c0c0', 'black': '#000000', 'white': '#ffffff',
+}
+# Paragraph styles with an HTML element of their own, by lowercase style name
+BLOCK_STYLES = {'quote': 'blockquote', 'intense quote': 'blockquote', 'block text': 'blockquote',
+                'html preformatted': 'pre', 'horizontal line': 'hr'}
+HEADING_NAME_PATTERN = re.compile(r'heading\s*([1-6])$', re.IGNORECASE)
+EMU_PER_PX = 9525
+
+TABLE_HTML = ('<table cellspacing="0" cellpadding="5" class="editor-table no-wrap" '
+              'style="border-collapse: collapse; width: 100%; margin: 6px 6px 0 0;">')
+
+
+class UnsupportedDocument(ValueError):
+    """The document uses features the native reader does not handle"""
+
+
+def _on(element, default=True):
+    """Value of an on/off property element, or None if absent"""
+    if element is None:
+        return None
+    return element.get(W + 'val', 'true' if default else 'false').lower() not in ('0', 'false', 'off', 'none')
+
+
+def _page_layout(sect_pr):
+    """
+    Page size and margins of the document's section, in twips as strings
+
+    Raises UnsupportedDocument for sections with more to them than
+    docx_export.section_properties writes back.
+    """
+    page = {}
+    for child in sect_pr:
+        tag = child.tag
+        if tag == W + 'pgSz':
+            for name in PAGE_SIZE_ATTRIBUTES:
+                value = child.get(W + name)
+                if value is not None:
+                    if not value.isdigit():
+                        raise UnsupportedDocument("page layout")
+                    page[name] = value
+            orient = child.get(W + 'orient')
+            if orient not in (None, 'portrait', 'landscape'):
+                raise UnsupportedDocument("page layout")
+            if orient:
+                page['orient'] = orient
+        elif tag == W + 'pgMar':
+            for name in PAGE_MARGIN_ATTRIBUTES:
+                value = child.get(W + name)
+                if value is not None:
+                    if not re.fullmatch(r'-?\d+', value):
+                        raise UnsupportedDocument("page layout")
+                    page[name] = value
+        elif tag == W + 'cols':
+            if int(child.get(W + 'num') or 1) > 1 or child.find(W + 'col') is not None:
+                raise UnsupportedDocument("columns")
+        elif tag == W + 'docGrid':
+            # Only a grid of type lines or characters changes the layout
+            if child.get(W + 'type') not in (None, 'default'):
+                raise UnsupportedDocument("document grid")
+        elif tag == W + 'textDirection':
+            if child.get(W + 'val') not in ('lrTb', 'tb'):
+                raise UnsupportedDocument("text direction")
+        elif tag not in PLAIN_SECTION_ELEMENTS:
+            raise UnsupportedDocument("page layout")
+    return page
+
+
+def _run_properties(rpr):
+    """Formatting of a w:rPr element as a dict; only properties that are set"""
+    properties = {}
+    if rpr is None:
+        return properties
+    for name, key in (('b', 'bold'), ('i', 'italic'), ('strike', 'strike'), ('dstrike', 'strike')):
+        value = _on(rpr.find(W + name))
+        if value is not None:
+            properties[key] = value
+    underline = rpr.find(W + 'u')
+    if underline is not None:
+        properties['underline'] = underline.get(W + 'val', 'single') != 'none'
+    vertical = rpr.find(W + 'vertAlign')
+    if vertical is not None:
+        properties['vertical'] = {'superscript': 'sup', 'subscript': 'sub'}.get(vertical.get(W + 'val'))
+    size = rpr.find(W + 'sz')
+    if size is not None and (size.get(W + 'val') or '').isdigit():
+        properties['size'] = int(size.get(W + 'val')) / 2
+    fonts = rpr.find(W + 'rFonts')
+    if fonts is not None:
+        family = fonts.get(W + 'ascii') or fonts.get(W + 'hAnsi')
+        if family:
+            properties['font'] = family
+    color = rpr.find(W + 'color')
+    if color is not None and re.fullmatch(r'[0-9A-Fa-f]{6}', color.get(W + 'val') or ''):
+        properties['color'] = '#' + color.get(W + 'val').lower()
+    highlight = rpr.find(W + 'highlight')
+    shading = rpr.find(W + 'shd')
+    if highlight is not None and highlight.get(W + 'val') in HIGHLIGHT_COLORS:
+        properties['background'] = HIGHLIGHT_COLORS[highlight.get(W + 'val')]
+    elif shading is not None and re.fullmatch(r'[0-9A-Fa-f]{6}', shading.get(W + 'fill') or ''):
+        properties['background'] = '#' + shading.get(W + 'fill').lower()
+    return properties
+
+
+def _format_key(properties):
+    return tuple(sorted((key, value) for key, value in properties.items() if value))
+
+
+def _wrap_formatting(key, content):
+    """Wrap HTML in the tags and span style of a format key"""
+    properties = dict(key)
+    styles = []
+    if 'font' in properties:
+        styles.append(f"font-family: {properties['font']}")
+    if 'size' in properties:
+        styles.append(f"font-size: {properties['size']:g}pt")
+    if 'color' in properties:
+        styles.append(f"color: {properties['color']}")
+    if 'background' in properties:
+        styles.append(f"background-color: {properties['background']}")
+    if styles:
+        content = f'<span style="{escape("; ".join(styles))};">{content}</span>'
+    for key, tag in (('vertical', None), ('strike', 's'), ('underline', 'u'), ('italic', 'i'), ('bold', 'b')):
+        if key in properties:
+            tag = tag or properties[key]
+            content = f'<{tag}>{content}</{tag}>'
+    return content
+
+
+class _Styles:
+    """Paragraph and character styles of word/styles.xml, resolved through basedOn"""
+
+    def __init__(self, root):
+        self._styles = {}
+        self._cache = {}
+        self.default_paragraph = None
+        if root is None:
+            return
+        for style in root.iter(W + 'style'):
+            style_id = style.get(W + 'styleId')
+            if not style_id:
+                continue
+            name = style.find(W + 'name')
+            based_on = style.find(W + 'basedOn')
+            ppr = style.find(W + 'pPr')
+            outline = ppr.find(W + 'outlineLvl') if ppr is not None else None
+            num_pr = ppr.find(W + 'numPr') if ppr is not None else None
+            tbl_pr = style.find(W + 'tblPr')
+            self._styles[style_id] = {
+                'name': (name.get(W + 'val') if name is not None else '') or '',
+                'based_on': based_on.get(W + 'val') if based_on is not None else None,
+                'outline': outline.get(W + 'val') if outline is not None else None,
+                'num_pr': _numbering_reference(num_pr),
+                'run': _run_properties(style.find(W + 'rPr')),
+                'borders': _has_borders(tbl_pr.find(W + 'tblBorders')) if tbl_pr is not None else None,
+            }
+            if style.get(W + 'type') == 'paragraph' and _on(style.get(W + 'default') and style) \
+                    and style.get(W + 'default') in ('1', 'true', 'on'):
+                self.default_paragraph = style_id
+
+    def _chain(self, style_id):
+        seen = set()
+        while style_id in self._styles and style_id not in seen:
+            seen.add(style_id)
+            yield self._styles[style_id]
+            style_id = self._styles[style_id]['based_on']
+
+    def heading_level(self, style_id):
+        for style in self._chain(style_id):
+            if style['outline'] and style['outline'].isdigit() and int(style['outline']) < 6:
+                return int(style['outline']) + 1
+            match = HEADING_NAME_PATTERN.match(style['name'])
+            if match:
+                return int(match.group(1))
+            if style['name'].lower() == 'title':
+                return 1
+        return 0
+
+    def block_tag(self, style_id):
+        """blockquote, pre or hr for paragraphs of a style that has one, otherwise None"""
+        return next((BLOCK_STYLES[style['name'].lower()] for style in self._chain(style_id)
+                     if style['name'].lower() in BLOCK_STYLES), None)
+
+    def numbering(self, style_id):
+        return next((style['num_pr'] for style in self._chain(style_id) if style['num_pr']), None)
+
+    def table_borders(self, style_id):
+        return next((style['borders'] for style in self._chain(style_id) if style['borders'] is not None), False)
+
+    def run(self, style_id):
+        """Run properties a style gives, base styles first"""
+        if style_id not in self._cache:
+            properties = {}
+            for style in reversed(list(self._chain(style_id))):
+                properties.update(style['run'])
+            self._cache[style_id] = properties
+        return self._cache[style_id]
+
+
+def _numbering_reference(num_pr):
+    if num_pr is None:
+        return None
+    num_id = num_pr.find(W + 'numId')
+    level = num_pr.find(W + 'ilvl')
+    if num_id is None:
+        return None
+    level = level.get(W + 'val') if level is not None else '0'
+    return num_id.get(W + 'val'), int(level) if (level or '').isdigit() else 0
+
+
+def _has_borders(borders):
+    if borders is None:
+        return None
+    return any((edge.get(W + 'val') or 'nil') not in ('nil', 'none') for edge in borders)
+
+
+class _Numbering:
+    """List tag (ul or ol) of each numbering instance and level"""
+
+    def __init__(self, root):
+        self._abstract = {}
+        self._nums = {}
+        if root is None:
+            return
+        for abstract in root.iter(W + 'abstractNum'):
+            formats = {}
+            for level in abstract.iter(W + 'lvl'):
+                fmt = level.find(W + 'numFmt')
+                formats[level.get(W + 'ilvl')] = fmt.get(W + 'val') if fmt is not None else 'decimal'
+            self._abstract[abstract.get(W + 'abstractNumId')] = formats
+        for num in root.iter(W + 'num'):
+            abstract_id = num.find(W + 'abstractNumId')
+            if abstract_id is not None:
+                self._nums[num.get(W + 'numId')] = abstract_id.get(W + 'val')
+
+    def tag(self, num_id, level):
+        """'ul', 'ol', or None where the reference turns numbering off"""
+        if num_id == '0' or num_id not in self._nums:
+            return None
+        fmt = self._abstract.get(self._nums[num_id], {}).get(str(level), 'decimal')
+        return 'ul' if fmt in ('bullet', 'none') else 'ol'
+
+
+class _ListState:
+    """Open lists of a block context, outermost first"""
+
+    def __init__(self):
+        self.stack = []             # [tag, num_id, item_open]
+
+    def item(self, out, tag, num_id, level):
+        """Start a list item at level, opening and closing lists around it"""
+        while len(self.stack) > level + 1:
+            self._close(out)
+        if len(self.stack) == level + 1 and (self.stack[-1][0] != tag or self.stack[-1][1] != num_id):
+            self._close(out)
+        if len(self.stack) == level + 1 and self.stack[-1][2]:
+            out.append('</li>')
+            self.stack[-1][2] = False
+        while len(self.stack) < level + 1:
+            if self.stack and not self.stack[-1][2]:
+                out.append('<li>')
+                self.stack[-1][2] = True
+            out.append(f'<{tag}>')
+            self.stack.append([tag, num_id, False])
+        out.append('<li>')
+        self.stack[-1][2] = True
+
+    def close_all(self, out):
+        while self.stack:
+            self._close(out)
+
+    def _close(self, out):
+        tag, _, item_open = self.stack.pop()
+        if item_open:
+            out.append('</li>')
+        out.append(f'</{tag}>')
+
+
+class DocxConverter:
+    """Convert WordprocessingML blocks to editor HTML"""
+
+    def __init__(self, archive, image_source):
+        self._image_source = image_source
+        self._relationships = {}
+        self.page = None
+        try:
+            rels = ET.fromstring(archive.read("word/_rels/document.xml.rels"))
+        except KeyError:
+            rels = None
+        if rels is not None:
+            for rel in rels.iter(PACKAGE_RELATIONSHIPS + 'Relationship'):
+                self._relationships[rel.get('Id')] = (rel.get('Target') or '', rel.get('TargetMode') == 'External')
+        self.styles = _Styles(self._read_xml(archive, "word/styles.xml"))
+        self.numbering = _Numbering(self._read_xml(archive, "word/numbering.xml"))
+
+    @staticmethod
+    def _read_xml(archive, name):
+        try:
+            return ET.fromstring(archive.read(name))
+        except KeyError:
+            return None
+
+    # Blocks
+
+    def block(self, element, out, lists):
+        """Append the HTML of one block-level element"""
+        tag = element.tag
+        if tag == W + 'p':
+            self.paragraph(element, out, lists)
+        elif tag == W + 'tbl':
+            lists.close_all(out)
+            self.table(element, out)
+        elif tag in (W + 'sdt', W + 'customXml'):
+            content = element.find(W + 'sdtContent') if tag == W + 'sdt' else element
+            for child in (content if content is not None else ()):
+                self.block(child, out, lists)
+        elif tag == W + 'sectPr':
+            self.page = _page_layout(element)
+        elif tag in UNSUPPORTED_ELEMENTS:
+            raise UnsupportedDocument(UNSUPPORTED_ELEMENTS[tag])
+
+    def paragraph(self, p, out, lists):
+        ppr = p.find(W + 'pPr')
+        style_id = None
+        num_pr = None
+        align = None
+        if ppr is not None:
+            style = ppr.find(W + 'pStyle')
+            style_id = style.get(W + 'val') if style is not None else None
+            num_pr = _numbering_reference(ppr.find(W + 'numPr'))
+            jc = ppr.find(W + 'jc')
+            align = ALIGNMENTS.get(jc.get(W + 'val')) if jc is not None else None
+        style_id = style_id or self.styles.default_paragraph
+        level = self.styles.heading_level(style_id) if style_id else 0
+        if num_pr is None and style_id and not level:
+            num_pr = self.styles.numbering(style_id)
+
+        block_tag = self.styles.block_tag(style_id) if style_id and not level else None
+
+        # Paragraph style formatting applies to its runs, except what the element gives
+        if level or block_tag or style_id == self.styles.default_paragraph:
+            base = {}
+        else:
+            base = self.styles.run(style_id)
+        content = self.runs(p, base)
+
+        list_tag = self.numbering.tag(*num_pr) if num_pr else None
+        style = f' style="text-align: {align};"' if align else ''
+        if list_tag:
+            lists.item(out, list_tag, num_pr[0], min(num_pr[1], 8))
+            if style:
+                out.append(f'<div{style}>{content or "<br>"}</div>')
+            else:
+                out.append(content or '<br>')
+            return
+        lists.close_all(out)
+        if block_tag == 'hr' and not content:
+            out.append('<hr>')
+        elif block_tag == 'pre':
+            out.append(f'<pre{style}>{content.replace("&emsp;", chr(9)).replace("<br>", chr(10))}</pre>')
+        elif block_tag == 'blockquote':
+            out.append(f'<blockquote><p{style}>{content or "<br>"}</p></blockquote>')
+        else:
+            tag = f'h{level}' if level else 'p'
+            out.append(f'<{tag}{style}>{content or "<br>"}</{tag}>')
+
+    def table(self, tbl, out):
+        tbl_pr = tbl.find(W + 'tblPr')
+        borders = None
+        if tbl_pr is not None:
+            borders = _has_borders(tbl_pr.find(W + 'tblBorders'))
+            if borders is None:
+                style = tbl_pr.find(W + 'tblStyle')
+                borders = self.styles.table_borders(style.get(W + 'val')) if style is not None else False
+        border = "1px solid #000000" if borders else "none"
+
+        rows = []
+        merges = {}                 # grid column -> cell a vertical merge started in
+        for tr in tbl.iter(W + 'tr'):
+            if tr not in tbl.findall(W + 'tr') and tr not in self._row_containers(tbl):
+                continue
+            trpr = tr.find(W + 'trPr')
+            header = trpr is not None and _on(trpr.find(W + 'tblHeader')) is True
+            cells = []
+            column = 0
+            for tc in tr.findall(W + 'tc') + [tc for sdt in tr.findall(W + 'sdt')
+                                              for tc in sdt.iter(W + 'tc')]:
+                tcpr = tc.find(W + 'tcPr')
+                span = 1
+                vmerge = None
+                background = None
+                if tcpr is not None:
+                    grid_span = tcpr.find(W + 'gridSpan')
+                    if grid_span is not None and (grid_span.get(W + 'val') or '').isdigit():
+                        span = max(1, int(grid_span.get(W + 'val')))
+                    merge = tcpr.find(W + 'vMerge')
+                    if merge is not None:
+                        vmerge = merge.get(W + 'val', 'continue')
+                    shading = tcpr.find(W + 'shd')
+                    if shading is not None and re.fullmatch(r'[0-9A-Fa-f]{6}', shading.get(W + 'fill') or ''):
+                        background = '#' + shading.get(W + 'fill').lower()
+                if vmerge == 'continue' and column in merges:
+                    merges[column]['rowspan'] += 1
+                    column += span
+                    continue
+                cell_out = []
+                cell_lists = _ListState()
+                for child in tc:
+                    if child.tag != W + 'tcPr':
+                        self.block(child, cell_out, cell_lists)
+                cell_lists.close_all(cell_out)
+                cell = {'html': ''.join(cell_out), 'colspan': span, 'rowspan': 1,
+                        'background': background, 'header': header}
+                if vmerge == 'restart':
+                    merges[column] = cell
+                else:
+                    merges.pop(column, None)
+                cells.append(cell)
+                column += span
+            rows.append(cells)
+
+        out.append(TABLE_HTML)
+        for cells in rows:
+            out.append('<tr>')
+            for cell in cells:
+                tag = 'th' if cell['header'] else 'td'
+                attributes = ''
+                if cell['colspan'] > 1:
+                    attributes += f' colspan="{cell["colspan"]}"'
+                if cell['rowspan'] > 1:
+                    attributes += f' rowspan="{cell["rowspan"]}"'
+                style = f"border: {border}; padding: 5px;"
+                if cell['background']:
+                    style += f" background-color: {cell['background']};"
+                out.append(f'<{tag}{attributes} style="{style}">{cell["html"]}</{tag}>')
+            out.append('</tr>')
+        out.append('</table>')
+
+    @staticmethod
+    def _row_containers(tbl):
+        """Rows wrapped in content controls directly under the table"""
+        return [tr for sdt in tbl.findall(W + 'sdt') for tr in sdt.iter(W + 'tr')]
+
+    # Runs
+
+    def runs(self, parent, base, link=None, segments=None):
+        """HTML of the runs under parent, with adjacent runs of equal formatting merged"""
+        top = segments is None
+        if top:
+            segments = []
+        for child in parent:
+            tag = child.tag
+            if tag == W + 'r':
+                self._run(child, base, link, segments)
+            elif tag == W + 'hyperlink':
+                rel = self._relationships.get(child.get(R + 'id'))
+                if rel:
+                    href = rel[0]
+                elif child.get(W + 'anchor'):
+                    href = '#' + child.get(W + 'anchor')
+                else:
+                    href = None
+                self.runs(child, base, href, segments)
+            elif tag in TRANSPARENT_ELEMENTS:
+                self.runs(child, base, link, segments)
+            elif tag == W + 'sdt':
+                content = child.find(W + 'sdtContent')
+                if content is not None:
+                    self.runs(content, base, link, segments)
+            elif tag in UNSUPPORTED_ELEMENTS:
+                raise UnsupportedDocument(UNSUPPORTED_ELEMENTS[tag])
+        if not top:
+            return None
+
+        html = []
+        for key, href, parts in segments:
+            content = ''.join(parts)
+            if key is not None:
+                content = _wrap_formatting(key, content)
+            if href:
+                content = f'<a href="{escape(href)}">{content}</a>'
+            html.append(content)
+        return ''.join(html)
+
+    def _run(self, r, base, link, segments):
+        rpr = r.find(W + 'rPr')
+        properties = dict(base)
+        if rpr is not None:
+            style = rpr.find(W + 'rStyle')
+            if style is not None:
+                properties.update(self.styles.run(style.get(W + 'val')))
+            properties.update(_run_properties(rpr))
+            if _on(rpr.find(W + 'vanish')):
+                return
+        key = _format_key(properties)
+
+        def append(html, mergeable=True):
+            if mergeable and segments and segments[-1][0] == key and segments[-1][1] == link:
+                segments[-1][2].append(html)
+            else:
+                segments.append([key if mergeable else None, link, [html]])
+
+        for child in r:
+            tag = child.tag
+            if tag == W + 't':
+                if child.text:
+                    append(escape(child.text, quote=False))
+            elif tag == W + 'tab':
+                append('&emsp;')
+            elif tag in (W + 'br', W + 'cr'):
+                if child.get(W + 'type') not in ('page', 'column'):
+                    append('<br>')
+            elif tag == W + 'noBreakHyphen':
+                append('‑')
+            elif tag == W + 'softHyphen':
+                append('­')
+            elif tag == W + 'drawing':
+                append(self._drawing(child), mergeable=False)
+            elif tag in UNSUPPORTED_ELEMENTS:
+                raise UnsupportedDocument(UNSUPPORTED_ELEMENTS[tag])
+
+    def _drawing(self, drawing):
+        container = drawing.find(WP + 'inline')
+        if container is None:
+            container = drawing.find(WP + 'anchor')
+        data = container.find(f'{A}graphic/{A}graphicData') if container is not None else None
+        if data is None or data.get('uri') != PICTURE_URI:
+            raise UnsupportedDocument("drawings")
+        blip = next(data.iter(A + 'blip'), None)
+        rel = self._relationships.get(blip.get(R + 'embed') or blip.get(R + 'link')) if blip is not None else None
+        if rel is None:
+            return ''
+        target, external = rel
+        if external:
+            src = target
+        else:
+            name = posixpath.normpath(posixpath.join("word", target.lstrip('/')) if not target.startswith('/')
+                                      else target.lstrip('/'))
+            src = self._image_source(name)
+        size = ''
+        extent = container.find(WP + 'extent')
+        if extent is not None and (extent.get('cx') or '').isdigit() and (extent.get('cy') or '').isdigit():
+            size = (f' width="{round(int(extent.get("cx")) / EMU_PER_PX)}"'
+                    f' height="{round(int(extent.get("cy")) / EMU_PER_PX)}"')
+        doc_pr = container.find(WP + 'docPr')
+        alt = doc_pr.get('descr', '') if doc_pr is not None else ''
+        return f'<img src="{escape(src)}" alt="{escape(alt)}"{size}>'
+
+
+def _convert(archive, image_source):
+    """Editor HTML of an open .docx zip and its page layout; see _page_layout"""
+    if DOCUMENT_PART not in archive.namelist():
+        raise ValueError("Not a Word document")
+    converter = DocxConverter(archive, image_source)
+    out = []
+    lists = _ListState()
+    depth = 0
+    body = None
+    with archive.open(DOCUMENT_PART) as document:
+        for event, element in ET.iterparse(document, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1 and element.tag != W + 'document':
+                    raise UnsupportedDocument("strict Office Open XML")
+                if depth == 2 and element.tag == W + 'body':
+                    body = element
+                # Checked for every element, so content the converter would
+                # skip over cannot be lost on save either
+                if element.tag in UNSUPPORTED_ELEMENTS:
+                    raise UnsupportedDocument(UNSUPPORTED_ELEMENTS[element.tag])
+                # Only the body's own section is kept; others start new sections
+                if element.tag == W + 'sectPr' and depth != 3:
+                    raise UnsupportedDocument("multiple sections")
+                continue
+            depth -= 1
+            if depth == 2 and body is not None:
+                # A whole top-level block has been read; convert and drop it
+                converter.block(element, out, lists)
+                body.clear()
+    lists.close_all(out)
+    return ''.join(out), converter.page
+
+
+class DocxArchive:
+    """
+    A .docx document converted for the editor, serving its media on request
+
+    Raises ValueError for files that are not Word documents and
+    UnsupportedDocument for documents that need LibreOffice. page is the
+    layout of the document's section, to write back on save.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        stat = os.stat(self.path)
+        self.archive_id = hashlib.sha1(
+            f"{self.path}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+        try:
+            self._zip = zipfile.ZipFile(self.path)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"Not a Word document: {e}")
+        self._lock = threading.Lock()
+        self._media = {}            # key -> name in the zip
+        try:
+            self.html, self.page = _convert(self._zip, self._media_url)
+        except ET.ParseError as e:
+            self._zip.close()
+            raise ValueError(f"Damaged Word document: {e}")
+        except BaseException:
+            self._zip.close()
+            raise
+
+    def _media_url(self, name):
+        key = posixpath.basename(name)
+        if not MEDIA_KEY_PATTERN.fullmatch(key) or self._media.get(key, name) != name:
+            raise UnsupportedDocument("media outside word/media")
+        self._media[key] = name
+        return mhtml_import.archive_url(self.archive_id, key)
+
+    def get_part(self, key):
+        """Bytes and content type of the image named key"""
+        name = self._media.get(key)
+        if name is None:
+            raise KeyError(key)
+        with self._lock:
+            data = self._zip.read(name)
+        return data, mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    def get_editor_html(self, inline=False):
+        """The converted document; with inline=True images are data URIs"""
+        if not inline:
+            return self.html
+        return mhtml_import.inline_archive_sources(self.html) if self._is_open() else self.html
+
+    def _is_open(self):
+        return self._zip.fp is not None
+
+    def close(self):
+        with self._lock:
+            self._zip.close()
+
+
+def docx_to_html(path):
+    """Editor HTML of a .docx file with its images embedded as data URIs"""
+    with zipfile.ZipFile(path) as archive:
+        def data_uri(name):
+            try:
+                data = archive.read(name)
+            except KeyError:
+                return ''
+            content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            return f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+        try:
+            return _convert(archive, data_uri)[0]
+        except ET.ParseError as e:
+            raise ValueError(f"Damaged Word document: {e}")
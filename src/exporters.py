@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# exporters.py - exporter registry and the multi-format Export dialog
+#
+# An export takes a single snapshot of the editor and hands it to every
+# requested exporter at once. Exporters that only need the snapshot run in a
+# shared thread pool; exporters that need the live WebView (PDF) run on the
+# main loop alongside them.
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from gi.repository import Gtk, GLib, Adw, Pango
+
+import conversion_cache
+import file_operations
+import mhtml_import
+import wwd_format
+from markdown_export import write_markdown
+from mhtml_export import write_mhtml
+from odt_export import write_odt
+from docx_export import write_docx
+
+EXPORT_WORKERS = max(2, min(4, os.cpu_count() or 1))
+
+_executor = None
+
+
+class DocumentSnapshot:
+    """Editor content captured once for all exporters"""
+
+    def __init__(self, html, text, title="Document"):
+        self.html = html
+        self.text = text
+        self.title = title
+
+    def portable_html(self):
+        """The HTML with images of opened MHTML archives embedded; call from a worker"""
+        return mhtml_import.inline_archive_sources(self.html)
+
+
+class Exporter:
+    """
+    A format the document can be exported to
+
+    convert(snapshot) returns the file contents, or a callable streaming them
+    into a binary file object, and runs in a worker thread.
+    Exporters that need the WebView give export(app, win, snapshot, path,
+    callback) instead, which runs on the main loop and calls callback(error)
+    with None on success.
+    """
+
+    def __init__(self, format_id, name, extension, convert=None, export=None):
+        self.format_id = format_id
+        self.name = name
+        self.extension = extension
+        self.convert = convert
+        self.export = export
+
+
+EXPORTERS = {}
+
+
+def register_exporter(exporter):
+    """Add an exporter to the registry, replacing any with the same id"""
+    EXPORTERS[exporter.format_id] = exporter
+
+
+def get_exporter_for_path(path):
+    """Return the exporter writing files with path's extension, or None"""
+    ext = os.path.splitext(path)[1].lower()
+    for exporter in EXPORTERS.values():
+        if exporter.extension == ext:
+            return exporter
+    return None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="webkitword-export")
+    return _executor
+
+
+def _export_pdf(app, win, snapshot, path, callback):
+    page_setup = getattr(win, 'page_setup', None) or app.default_page_setup
+
+    # Break pages where the editor shows them
+    def on_printed(error):
+        app.execute_js(win, "clearPrintPageBreaks();")
+        callback(error)
+
+    app.execute_js(win, "applyPrintPageBreaks();")
+    file_operations.print_webview_to_pdf(win.webview, path, page_setup, on_printed)
+
+
+register_exporter(Exporter(
+    "wwd", "WebkitWord Document", ".wwd",
+    convert=lambda snapshot: lambda output: wwd_format.write_wwd(
+        output, snapshot.html, snapshot.text, snapshot.title)))
+register_exporter(Exporter(
+    "html", "HTML Document", ".html",
+    convert=lambda snapshot: file_operations.wrap_html_document(snapshot.portable_html()).encode('utf-8')))
+register_exporter(Exporter(
+    "md", "Markdown", ".md",
+    convert=lambda snapshot: lambda output: write_markdown(snapshot.portable_html(), output)))
+register_exporter(Exporter(
+    "txt", "Plain Text", ".txt",
+    convert=lambda snapshot: snapshot.text.encode('utf-8')))
+register_exporter(Exporter(
+    "mhtml", "Web Archive", ".mht",
+    convert=lambda snapshot: lambda output: write_mhtml(
+        file_operations.wrap_html_document(snapshot.portable_html()), output, snapshot.title)))
+register_exporter(Exporter(
+    "odt", "OpenDocument Text", ".odt",
+    convert=lambda snapshot: lambda output: write_odt(snapshot.html, output, snapshot.title)))
+register_exporter(Exporter(
+    "docx", "Word Document", ".docx",
+    convert=lambda snapshot: lambda output: write_docx(snapshot.html, output, snapshot.title)))
+register_exporter(Exporter("pdf", "PDF Document", ".pdf", export=_export_pdf))
+
+
+def export_document(self, win, targets, progress_callback):
+    """
+    Export the editor content to several files at once
+
+    targets is a list of (format id, output path). progress_callback(format_id,
+    state, detail) runs on the main thread with state "running", "done" (detail:
+    bytes written and seconds) or "failed" (detail: error message).
+    """
+    def on_snapshot(webview, result, data):
+        try:
+            js_result = webview.evaluate_javascript_finish(result)
+            snapshot_data = json.loads(js_result.to_string())
+        except Exception as e:
+            for format_id, _ in targets:
+                progress_callback(format_id, "failed", f"Could not read the document: {e}")
+            return
+
+        title = os.path.splitext(os.path.basename(targets[0][1]))[0] if targets else "Document"
+        snapshot = DocumentSnapshot(snapshot_data.get('html', ''), snapshot_data.get('text', ''), title)
+        for format_id, path in targets:
+            self._run_exporter(win, EXPORTERS[format_id], snapshot, path, progress_callback)
+
+    win.webview.evaluate_javascript(file_operations.SNAPSHOT_JS, -1, None, None, None, on_snapshot, None)
+
+
+def _run_exporter(self, win, exporter, snapshot, path, progress_callback):
+    """Start one exporter on the snapshot"""
+    started = time.monotonic()
+    progress_callback(exporter.format_id, "running", None)
+
+    def report(error):
+        if error:
+            progress_callback(exporter.format_id, "failed", error)
+        else:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            progress_callback(exporter.format_id, "done", (size, time.monotonic() - started))
+        return False
+
+    if exporter.export:
+        exporter.export(self, win, snapshot, path, report)
+        return
+
+    def worker():
+        try:
+            file_operations.write_file_atomic(path, exporter.convert(snapshot))
+            error = None
+        except Exception as e:
+            error = str(e)
+        GLib.idle_add(report, error)
+
+    _get_executor().submit(worker)
+
+
+def show_export_dialog(self, win):
+    """Dialog to export the document to several formats at once"""
+    dialog = Adw.Dialog.new()
+    dialog.set_title("Export")
+    dialog.set_content_width(440)
+
+    content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=16)
+    content_box.set_margin_top(24)
+    content_box.set_margin_bottom(24)
+    content_box.set_margin_start(24)
+    content_box.set_margin_end(24)
+
+    # File name and location
+    folder = None
+    if win.current_file and win.current_file.get_path():
+        current_path = win.current_file.get_path()
+        base_name = os.path.splitext(os.path.basename(current_path))[0]
+        # A converted document is opened from the conversion cache; export
+        # next to the file the user opened instead
+        if conversion_cache.is_cache_path(current_path):
+            current_path = getattr(win, 'original_filepath', None) or current_path
+        if not conversion_cache.is_cache_path(current_path):
+            folder = os.path.dirname(current_path)
+    else:
+        base_name = "Untitled"
+    if folder is None:
+        folder = (GLib.get_user_special_dir(GLib.UserDirectory.DIRECTORY_DOCUMENTS) or
+                  GLib.get_home_dir())
+    # The folder chooser needs a real window as its parent
+    dialog_data = {"dialog": win, "current_folder": folder}
+
+    name_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+    name_label = Gtk.Label(label="Name:")
+    name_label.set_halign(Gtk.Align.START)
+    name_entry = Gtk.Entry()
+    name_entry.set_text(base_name)
+    name_entry.set_hexpand(True)
+    name_box.append(name_label)
+    name_box.append(name_entry)
+    content_box.append(name_box)
+
+    location_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
+    location_title = Gtk.Label(label="Folder:")
+    location_title.set_halign(Gtk.Align.START)
+    location_label = Gtk.Label(label=self._get_shortened_path(folder))
+    location_label.set_hexpand(True)
+    location_label.set_halign(Gtk.Align.START)
+    location_label.set_ellipsize(Pango.EllipsizeMode.START)
+    browse_button = Gtk.Button(label="Browse…")
+    dialog_data["location_label"] = location_label
+    browse_button.connect("clicked", lambda btn: self._on_browse_clicked(btn, dialog_data))
+    location_box.append(location_title)
+    location_box.append(location_label)
+    location_box.append(browse_button)
+    content_box.append(location_box)
+
+    formats_label = Gtk.Label()
+    formats_label.set_markup("<b>Formats</b>")
+    formats_label.set_halign(Gtk.Align.START)
+    formats_label.set_margin_top(8)
+    content_box.append(formats_label)
+
+    # One row per exporter: check box, spinner and status
+    rows = {}
+    for exporter in EXPORTERS.values():
+        row = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+        check = Gtk.CheckButton(label=f"{exporter.name} ({exporter.extension})")
+        check.set_active(exporter.format_id in getattr(win, 'export_formats', ("html", "pdf")))
+        check.set_hexpand(True)
+        spinner = Gtk.Spinner()
+        status = Gtk.Label()
+        status.add_css_class("dim-label")
+        status.add_css_class("caption")
+        row.append(check)
+        row.append(spinner)
+        row.append(status)
+        content_box.append(row)
+        rows[exporter.format_id] = (check, spinner, status)
+
+    button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+    button_box.set_halign(Gtk.Align.END)
+    button_box.set_margin_top(12)
+    close_button = Gtk.Button(label="Close")
+    close_button.connect("clicked", lambda btn: dialog.close())
+    export_button = Gtk.Button(label="Export")
+    export_button.add_css_class("suggested-action")
+    button_box.append(close_button)
+    button_box.append(export_button)
+    content_box.append(button_box)
+
+    def on_export(button):
+        name = name_entry.get_text().strip() or "Untitled"
+        selected = [format_id for format_id, (check, _, _) in rows.items() if check.get_active()]
+        if not selected:
+            return
+        win.export_formats = tuple(selected)
+        targets = [(format_id, os.path.join(dialog_data["current_folder"], name + EXPORTERS[format_id].extension))
+                   for format_id in selected]
+        existing = [path for format_id, path in targets if os.path.exists(path)]
+        if existing:
+            _confirm_overwrite(win, existing, lambda: start_export(name, selected, targets))
+        else:
+            start_export(name, selected, targets)
+
+    def start_export(name, selected, targets):
+        remaining = set(selected)
+        failures = []
+        export_button.set_sensitive(False)
+        for format_id, (check, spinner, status) in rows.items():
+            check.set_sensitive(False)
+            status.set_text("Waiting…" if format_id in remaining else "")
+
+        def on_progress(format_id, state, detail):
+            check, spinner, status = rows[format_id]
+            if state == "running":
+                spinner.start()
+                status.set_text("Exporting…")
+                return
+            spinner.stop()
+            remaining.discard(format_id)
+            if state == "done":
+                size, seconds = detail
+                status.set_text(f"{GLib.format_size(size)} in {seconds:.1f}s")
+            else:
+                failures.append(format_id)
+                status.set_text("Failed")
+                status.set_tooltip_text(detail)
+                print(f"Export to {format_id} failed: {detail}")
+            if not remaining:
+                export_button.set_sensitive(True)
+                for check, _, _ in rows.values():
+                    check.set_sensitive(True)
+                done = len(selected) - len(failures)
+                win.statusbar.set_text(f"Exported {name} to {done} of {len(selected)} formats")
+
+        self.export_document(win, targets, on_progress)
+
+    export_button.connect("clicked", on_export)
+
+    dialog.set_child(content_box)
+    dialog.present(win)
+
+
+def _confirm_overwrite(win, paths, on_confirmed):
+    """Ask before an export replaces existing files"""
+    dialog = Adw.Dialog.new()
+    dialog.set_title("Replace Files")
+    dialog.set_content_width(400)
+
+    content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=20)
+    content_box.set_margin_top(24)
+    content_box.set_margin_bottom(24)
+    content_box.set_margin_start(24)
+    content_box.set_margin_end(24)
+
+    warning_icon = Gtk.Image.new_from_icon_name("dialog-warning-symbolic")
+    warning_icon.set_pixel_size(48)
+    warning_icon.set_margin_bottom(12)
+    content_box.append(warning_icon)
+
+    count = len(paths)
+    message_label = Gtk.Label()
+    message_label.set_markup(f"<b>{count} file{'s' if count != 1 else ''} already "
+                             f"exist{'s' if count == 1 else ''}. Replace {'them' if count != 1 else 'it'}?</b>")
+    message_label.set_wrap(True)
+    message_label.set_max_width_chars(40)
+    content_box.append(message_label)
+
+    names = ", ".join(os.path.basename(path) for path in paths)
+    current_path = win.current_file.get_path() if win.current_file else None
+    if current_path and any(os.path.realpath(path) == os.path.realpath(current_path) for path in paths):
+        names += "\n\nThis includes the open document."
+    description_label = Gtk.Label(label=names)
+    description_label.set_wrap(True)
+    description_label.set_max_width_chars(40)
+    content_box.append(description_label)
+
+    button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=8)
+    button_box.set_halign(Gtk.Align.END)
+    button_box.set_margin_top(12)
+
+    def on_replace(button):
+        dialog.close()
+        on_confirmed()
+
+    cancel_button = Gtk.Button(label="Cancel")
+    cancel_button.connect("clicked", lambda btn: dialog.close())
+    button_box.append(cancel_button)
+
+    replace_button = Gtk.Button(label="Replace")
+    replace_button.add_css_class("destructive-action")
+    replace_button.connect("clicked", on_replace)
+    button_box.append(replace_button)
+
+    content_box.append(button_box)
+    dialog.set_child(content_box)
+    dialog.present(win)
@@ -2,12 +2,54 @@
 # file_operations.py - Enhanced with LibreOffice conversion support
 import os
 import re
+import base64
+import hashlib
+import json
+import io
 import subprocess
+import threading
 import tempfile
 import time
 import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from gi.repository import Gtk, GLib, Gio, WebKit, Pango, Adw, GObject
+from conversion_service import get_conversion_service, ConversionError, ServiceUnavailable
+import conversion_cache
+from markdown_export import write_markdown
+from mhtml_export import write_mhtml
+from odt_export import write_odt
+from docx_export import write_docx
+import docx_import
+import mhtml_import
+import text_document
+import wwd_format
+
+# Set WEBKITWORD_DEBUG=1 to get verbose per-item logging
+DEBUG = bool(os.environ.get("WEBKITWORD_DEBUG"))
+
+def _debug(message):
+    """Print a diagnostic message when debug logging is enabled"""
+    if DEBUG:
+        print(message)
+
+# Image references in converted HTML and the worker count used to embed them
+IMG_TAG_PATTERN = re.compile(r'<img[^>]+src="([^"]+)"[^>]*>')
+IMAGE_WORKERS = min(8, (os.cpu_count() or 1) + 4)
+_archive_executor = None
+
+# Text document batches waiting for the editor, and blocks read back per call when saving
+TEXT_STREAM_BATCHES = 2
+TEXT_SAVE_BLOCKS = 500
+
+# Put back off-screen image placeholders before serializing more than #editor
+RESTORE_LAZY_IMAGES_JS = "if (typeof restoreAllLazyImages === 'function') { restoreAllLazyImages(); } "
+
+# Editor HTML and text in one round trip, with real image sources
+SNAPSHOT_JS = (RESTORE_LAZY_IMAGES_JS +
+               "(function() { const editor = document.getElementById('editor'); "
+               "return JSON.stringify({html: editor.innerHTML, text: fullLayoutText(editor)}); })();")
 
 # Check if markdown package is available
 MARKDOWN_AVAILABLE = False
@@ -17,16 +59,11 @@ try:
 except ImportError:
     pass
 
-# Check if html2text package is available (for HTML to Markdown conversion)
-HTML2TEXT_AVAILABLE = False
-try:
-    import html2text
-    HTML2TEXT_AVAILABLE = True
-except ImportError:
-    pass
-
 # LibreOffice document formats
 LIBREOFFICE_INPUT_FORMATS = {
+    "WebkitWord Documents": [
+        {"extension": ".wwd", "name": "WebkitWord Document", "mime": wwd_format.MIMETYPE},
+    ],
     "Writer Documents": [
         {"extension": ".odt", "name": "OpenDocument Text", "mime": "application/vnd.oasis.opendocument.text"},
         {"extension": ".doc", "name": "Microsoft Word 97-2003", "mime": "application/msword"},
@@ -52,6 +89,7 @@ LIBREOFFICE_INPUT_FORMATS = {
 
 # Output formats supported by the editor
 OUTPUT_FORMATS = [
+    {"extension": ".wwd", "name": "WebkitWord Document", "mime": wwd_format.MIMETYPE},
     {"extension": ".odt", "name": "OpenDocument Text", "mime": "application/vnd.oasis.opendocument.text"},
     {"extension": ".html", "name": "HTML Document", "mime": "text/html"},
     {"extension": ".mht", "name": "MHTML Document", "mime": "message/rfc822"},
@@ -76,8 +114,17 @@ def is_libreoffice_available():
 # Cache the result to avoid repeated checks
 LIBREOFFICE_AVAILABLE = is_libreoffice_available()
 
-def show_loading_dialog(self, win, message="Loading document..."):
-    """Show a loading dialog with a progress spinner"""
+# Conversions started from the editor run at most this many at a time; the rest wait their turn
+MAX_CONCURRENT_CONVERSIONS = 2
+CONVERSION_TIMEOUT = 60
+
+def show_loading_dialog(self, win, message="Loading document...", cancellable=None):
+    """
+    Show a loading dialog with a progress spinner
+    
+    When a Gio.Cancellable is given the dialog gets a Cancel button that
+    cancels it. Progress text can be shown with dialog.detail_label.
+    """
     dialog = Adw.Dialog.new()
     dialog.set_content_width(300)
     
@@ -101,11 +148,44 @@ def show_loading_dialog(self, win, message="Loading document..."):
     spinner.set_margin_top(12)
     content_box.append(spinner)
     
+    # Latest progress line from the converter
+    detail_label = Gtk.Label()
+    detail_label.add_css_class("dim-label")
+    detail_label.add_css_class("caption")
+    detail_label.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+    detail_label.set_max_width_chars(40)
+    detail_label.set_visible(False)
+    content_box.append(detail_label)
+    dialog.detail_label = detail_label
+    
+    if cancellable:
+        cancel_button = Gtk.Button(label="Cancel")
+        cancel_button.set_halign(Gtk.Align.CENTER)
+        cancel_button.set_margin_top(6)
+        
+        def on_cancel(button):
+            button.set_sensitive(False)
+            loading_label.set_text("Cancelling...")
+            cancellable.cancel()
+        
+        cancel_button.connect("clicked", on_cancel)
+        content_box.append(cancel_button)
+        dialog.set_can_close(False)
+    
     dialog.set_child(content_box)
     dialog.present(win)
     
     return dialog
 
+def _close_loading_dialog(dialog):
+    """Close a loading dialog, including ones that were made uncloseable"""
+    if dialog:
+        try:
+            dialog.set_can_close(True)
+            dialog.close()
+        except Exception as e:
+            print(f"Warning: Could not close loading dialog: {e}")
+
 def get_all_supported_extensions():
     """Get a list of all supported file extensions"""
     extensions = []
@@ -119,20 +199,66 @@ def is_libreoffice_format(file_path):
     ext = os.path.splitext(file_path)[1].lower()
     
     # Web and plain text formats don't need LibreOffice
-    direct_formats = ['.html', '.htm', '.mht', '.mhtml', '.txt', '.md', '.markdown']
+    direct_formats = ['.wwd', '.html', '.htm', '.mht', '.mhtml', '.txt', '.md', '.markdown']
     if ext in direct_formats:
         return False
         
     # Check if it's a LibreOffice-convertible format
     return ext in get_all_supported_extensions()
 
-def convert_with_libreoffice(self, input_file, output_format="html"):
+def _get_conversion_format(output_format):
+    """LibreOffice --convert-to argument (output_format:output_filter) for a format"""
+    if output_format == "html":
+        return "html:HTML (StarWriter)"
+    elif output_format == "pdf":
+        return "pdf:writer_pdf_Export"
+    return output_format
+
+def _build_libreoffice_command(input_abs_path, conversion_format, temp_dir, profile_dir=None):
+    """Command line for a one-shot headless LibreOffice conversion"""
+    cmd = [
+        'libreoffice',
+        '--headless',
+        '--convert-to', conversion_format,
+        '--outdir', temp_dir,
+        input_abs_path
+    ]
+    if profile_dir:
+        cmd.insert(2, f"-env:UserInstallation=file://{os.path.abspath(profile_dir)}")
+    return cmd
+
+def _find_converted_file(temp_dir, output_format):
+    """Return the non-empty file LibreOffice wrote to temp_dir, or None"""
+    # Find the converted file - it could be named differently than we expect
+    converted_files = [f for f in os.listdir(temp_dir) if f.endswith(f".{output_format}")]
+    
+    if not converted_files:
+        print(f"No {output_format} files found in {temp_dir}. Directory contents: {os.listdir(temp_dir)}")
+        return None
+        
+    # Use the first matching file found
+    output_file = os.path.join(temp_dir, converted_files[0])
+    
+    print(f"Found converted file: {output_file}")
+    
+    if os.path.getsize(output_file) == 0:
+        print(f"LibreOffice created an empty output file: {output_file}")
+        return None
+        
+    return output_file
+
+def convert_with_libreoffice(self, input_file, output_format="html", profile_dir=None):
     """
     Convert a document using LibreOffice in headless mode with improved image handling
     
+    This blocks until the conversion is done; the editor uses
+    convert_with_libreoffice_async instead.
+    
     Args:
         input_file: Path to the input file
         output_format: Format to convert to (default: html)
+        profile_dir: Private LibreOffice user profile to run a one-shot instance
+            with, so parallel conversions do not wait on the shared profile lock
         
     Returns:
         Tuple of (path to the converted file, directory containing image files) or (None, None) if conversion failed
@@ -153,27 +279,25 @@ def convert_with_libreoffice(self, input_file, output_format="html"):
         
         # Get the absolute path of the input file
         input_abs_path = os.path.abspath(input_file)
+        conversion_format = _get_conversion_format(output_format)
         
-        # Prepare the command - specify the actual output filename
-        base_name = os.path.splitext(os.path.basename(input_file))[0]
-        
-        # Use the correct command format for LibreOffice
-        # The format should be: output_format:output_filter
-        if output_format == "html":
-            conversion_format = "html:HTML (StarWriter)"
-        elif output_format == "pdf":
-            conversion_format = "pdf:writer_pdf_Export"
-        else:
-            conversion_format = output_format
-        
-        cmd = [
-            'libreoffice',
-            '--headless',
-            '--convert-to', conversion_format,
-            '--outdir', temp_dir,
-            input_abs_path
-        ]
-    
+        # Prefer the persistent office instance, which skips the cold start
+        service = get_conversion_service() if profile_dir is None else None
+        if service and service.available:
+            try:
+                output_file = service.convert(input_abs_path, temp_dir, conversion_format)
+                if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+                    print(f"Found converted file: {output_file}")
+                    return output_file, temp_dir
+                print(f"Conversion service created no usable output: {output_file}")
+                return None, None
+            except ConversionError as e:
+                print(f"LibreOffice conversion failed: {e}")
+                return None, None
+            except ServiceUnavailable as e:
+                print(f"Conversion service unavailable, running LibreOffice directly: {e}")
+
+        cmd = _build_libreoffice_command(input_abs_path, conversion_format, temp_dir, profile_dir)
         print(f"Running conversion command: {' '.join(cmd)}")
         
         # Run the conversion process
@@ -182,38 +306,20 @@ def convert_with_libreoffice(self, input_file, output_format="html"):
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            timeout=60  # 60 second timeout
+            timeout=CONVERSION_TIMEOUT
         )
         
         # Debug output
-        print(f"LibreOffice stdout: {process.stdout}")
-        print(f"LibreOffice stderr: {process.stderr}")
+        _debug(f"LibreOffice stdout: {process.stdout}")
+        _debug(f"LibreOffice stderr: {process.stderr}")
         
         if process.returncode != 0:
             print(f"LibreOffice conversion failed with return code {process.returncode}: {process.stderr}")
             return None, None
             
-        # Find the converted file - it could be named differently than we expect
-        converted_files = [f for f in os.listdir(temp_dir) if f.endswith(f".{output_format}")]
-        
-        if not converted_files:
-            print(f"No {output_format} files found in {temp_dir}. Directory contents: {os.listdir(temp_dir)}")
+        output_file = _find_converted_file(temp_dir, output_format)
+        if not output_file:
             return None, None
-            
-        # Use the first matching file found
-        output_file = os.path.join(temp_dir, converted_files[0])
-        
-        print(f"Found converted file: {output_file}")
-        
-        # Check if the file actually exists and has content
-        if not os.path.exists(output_file):
-            print(f"LibreOffice did not create output file: {output_file}")
-            return None, None
-            
-        if os.path.getsize(output_file) == 0:
-            print(f"LibreOffice created an empty output file: {output_file}")
-            return None, None
-            
         return output_file, temp_dir
         
     except subprocess.TimeoutExpired:
@@ -223,9 +329,201 @@ def convert_with_libreoffice(self, input_file, output_format="html"):
         print(f"Error during LibreOffice conversion: {e}")
         return None, None
 
+_active_conversions = 0
+_pending_conversions = deque()
+_free_profile_slots = list(range(MAX_CONCURRENT_CONVERSIONS))
+
+def _run_limited_conversion(start):
+    """Call start(release) now or once a conversion slot is free (main thread only)"""
+    global _active_conversions
+    if _active_conversions >= MAX_CONCURRENT_CONVERSIONS:
+        _pending_conversions.append(start)
+        return
+    _active_conversions += 1
+    released = []
+
+    def release():
+        global _active_conversions
+        if released:
+            return
+        released.append(True)
+        _active_conversions -= 1
+        if _pending_conversions:
+            _run_limited_conversion(_pending_conversions.popleft())
+
+    start(release)
+
+def _get_profile_slot_dir(slot):
+    """Persistent LibreOffice profile for one concurrent one-shot conversion"""
+    return os.path.join(GLib.get_user_cache_dir(), 'webkitword', 'office-profiles', f'slot-{slot}')
+
+def convert_with_libreoffice_async(self, input_file, output_format, cancellable, callback, progress_callback=None):
+    """
+    Convert a document without blocking the main loop
+    
+    Uses the persistent conversion service when available and otherwise a
+    Gio.Subprocess running LibreOffice, whose output is passed line by line to
+    progress_callback. Cancelling the cancellable stops the conversion.
+    
+    callback(output_file, temp_dir, error) is called once on the main thread;
+    error is None on success, "cancelled" after cancellation or a message.
+    """
+    if not LIBREOFFICE_AVAILABLE:
+        callback(None, None, "LibreOffice is not available for document conversion")
+        return
+    file_ext = os.path.splitext(input_file)[1].lower()
+    if file_ext == '.pdf' and output_format != "pdf":
+        callback(None, None, "PDF import is disabled")
+        return
+
+    input_abs_path = os.path.abspath(input_file)
+    conversion_format = _get_conversion_format(output_format)
+
+    def start(release):
+        if cancellable.is_cancelled():
+            release()
+            callback(None, None, "cancelled")
+            return
+
+        temp_dir = tempfile.mkdtemp()
+        finished = []
+
+        def finish(output_file, error):
+            if finished:
+                return
+            finished.append(True)
+            release()
+            if error:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                callback(None, None, error)
+            else:
+                callback(output_file, temp_dir, None)
+
+        service = get_conversion_service()
+        if service.available:
+            _convert_with_service(service, input_abs_path, temp_dir, conversion_format,
+                                  cancellable, finish,
+                                  lambda: _convert_with_subprocess(input_abs_path, temp_dir, output_format,
+                                                                   conversion_format, cancellable, finish,
+                                                                   progress_callback))
+        else:
+            _convert_with_subprocess(input_abs_path, temp_dir, output_format, conversion_format,
+                                     cancellable, finish, progress_callback)
+
+    _run_limited_conversion(start)
+
+def _convert_with_service(service, input_abs_path, temp_dir, conversion_format, cancellable, finish, fallback):
+    """Run a conversion on the persistent service from a worker thread"""
+    # The office cannot abandon a document halfway, so cancelling only drops the result.
+    # Gio.Cancellable shadows connect()/disconnect(), so use the GObject ones for the signal
+    handler_id = GObject.Object.connect(cancellable, "cancelled",
+                                        lambda c: GLib.idle_add(lambda: finish(None, "cancelled") and False))
+
+    def worker():
+        try:
+            output_file = service.convert(input_abs_path, temp_dir, conversion_format)
+            if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+                result = (output_file, None)
+            else:
+                result = (None, "LibreOffice created no usable output")
+        except ConversionError as e:
+            result = (None, f"LibreOffice conversion failed: {e}")
+        except ServiceUnavailable as e:
+            print(f"Conversion service unavailable, running LibreOffice directly: {e}")
+            result = None
+
+        def deliver():
+            GObject.Object.disconnect(cancellable, handler_id)
+            if cancellable.is_cancelled():
+                finish(None, "cancelled")
+                # The office may have written output after the cancel cleaned up
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            elif result is None:
+                fallback()
+            else:
+                finish(*result)
+            return False
+
+        GLib.idle_add(deliver)
+
+    GLib.Thread.new(None, worker)
+
+def _convert_with_subprocess(input_abs_path, temp_dir, output_format, conversion_format,
+                             cancellable, finish, progress_callback):
+    """Run a one-shot LibreOffice conversion as a Gio.Subprocess"""
+    slot = _free_profile_slots.pop() if _free_profile_slots else None
+    profile_dir = _get_profile_slot_dir(slot) if slot is not None else None
+    cmd = _build_libreoffice_command(input_abs_path, conversion_format, temp_dir, profile_dir)
+    print(f"Running conversion command: {' '.join(cmd)}")
+
+    def done(output_file, error):
+        if slot is not None:
+            _free_profile_slots.append(slot)
+        finish(output_file, error)
+
+    try:
+        process = Gio.Subprocess.new(cmd, Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_PIPE)
+    except GLib.Error as e:
+        done(None, f"Could not start LibreOffice: {e.message}")
+        return
+
+    # Stream converter output as it arrives instead of buffering it all
+    def read_lines(stream, label):
+        def on_line(source, result):
+            try:
+                line, _ = source.read_line_finish_utf8(result)
+            except GLib.Error:
+                return
+            if line is None:
+                return
+            _debug(f"LibreOffice {label}: {line}")
+            if progress_callback and line.strip():
+                progress_callback(line.strip())
+            source.read_line_async(GLib.PRIORITY_DEFAULT, None, on_line)
+        Gio.DataInputStream.new(stream).read_line_async(GLib.PRIORITY_DEFAULT, None, on_line)
+
+    read_lines(process.get_stdout_pipe(), "stdout")
+    read_lines(process.get_stderr_pipe(), "stderr")
+
+    cancel_id = GObject.Object.connect(cancellable, "cancelled", lambda c: process.force_exit())
+    timed_out = []
+
+    def on_timeout():
+        timed_out.append(True)
+        process.force_exit()
+        return False
+
+    timeout_id = GLib.timeout_add_seconds(CONVERSION_TIMEOUT, on_timeout)
+
+    def on_exit(proc, result):
+        GObject.Object.disconnect(cancellable, cancel_id)
+        if not timed_out:
+            GLib.source_remove(timeout_id)
+        try:
+            proc.wait_finish(result)
+        except GLib.Error as e:
+            done(None, f"LibreOffice conversion failed: {e.message}")
+            return
+        if cancellable.is_cancelled():
+            done(None, "cancelled")
+        elif timed_out:
+            done(None, "LibreOffice conversion timed out")
+        elif not proc.get_successful():
+            done(None, f"LibreOffice conversion failed with status {proc.get_status()}")
+        else:
+            output_file = _find_converted_file(temp_dir, output_format)
+            done(output_file, None if output_file else "LibreOffice created no usable output")
+
+    # Not passing the cancellable here: the process is killed on cancel and we wait for it to exit
+    process.wait_async(None, on_exit)
+
 # Open operations
 def on_open_clicked(self, win, button):
     """Show open file dialog and decide whether to open in current or new window"""
+    # Warm up the office while the user picks a file
+    if LIBREOFFICE_AVAILABLE:
+        get_conversion_service().start()
+
     dialog = Gtk.FileDialog()
     dialog.set_title("Open Document")
     
@@ -350,6 +648,258 @@ def _simple_markdown_to_html(content):
     html = '\n'.join(processed_paragraphs)
     return html
 
+def read_text_file(filepath):
+    """Read a text document, detecting its encoding when chardet is available"""
+    encoding = 'utf-8'  # Default encoding
+    try:
+        import chardet
+        with open(filepath, 'rb') as raw_file:
+            raw_content = raw_file.read()
+            detected = chardet.detect(raw_content)
+            if detected['confidence'] > 0.7:
+                encoding = detected['encoding']
+    except ImportError:
+        pass  # Fallback to utf-8 if chardet not available
+        
+    # Now read the file with the detected encoding
+    try:
+        with open(filepath, 'r', encoding=encoding) as f:
+            return f.read()
+    except UnicodeDecodeError:
+        # If there's a decode error, try a fallback encoding
+        with open(filepath, 'r', encoding='latin-1') as f:
+            return f.read()
+
+def extract_body(html_content):
+    """Return the contents of <body>, or the HTML unchanged if there is none"""
+    body_match = re.search(r'<body[^>]*>(.*?)</body>', html_content, re.DOTALL | re.IGNORECASE)
+    if body_match:
+        return body_match.group(1).strip()
+    return html_content
+
+def content_to_editor_html(content, file_ext):
+    """Convert the text of a directly supported document into editor HTML"""
+    if file_ext in ['.mht', '.mhtml']:
+        # Handle MHTML files - extract the HTML content
+        try:
+            import email
+            message = email.message_from_string(content)
+            for part in message.walk():
+                if part.get_content_type() == 'text/html':
+                    content = part.get_payload(decode=True).decode(part.get_content_charset() or 'utf-8')
+                    break
+        except ImportError:
+            # Fallback to regex extraction if email module not ideal
+            body_match = re.search(r'Content-Type: text/html.*?charset=["\']?([\w-]+)["\']?.*?(?:\r?\n){2}(.*?)(?:\r?\n){1,2}--', 
+                                  content, re.DOTALL | re.IGNORECASE)
+            if body_match:
+                charset, html_content = body_match.groups()
+                content = html_content
+                
+        # Extract body content from the HTML
+        content = extract_body(content)
+            
+    elif file_ext in ['.html', '.htm']:
+        # Handle HTML content
+        content = extract_body(content)
+            
+    elif file_ext in ['.md', '.markdown']:
+        # Convert markdown to HTML
+        if MARKDOWN_AVAILABLE:
+            try:
+                # Get available extensions
+                available_extensions = []
+                for ext in ['tables', 'fenced_code', 'codehilite', 'nl2br', 'sane_lists', 'smarty', 'attr_list']:
+                    try:
+                        # Test if extension can be loaded
+                        markdown.markdown("test", extensions=[ext])
+                        available_extensions.append(ext)
+                    except (ImportError, ValueError):
+                        pass
+                
+                # Convert markdown to HTML
+                content = markdown.markdown(content, extensions=available_extensions)
+            except Exception as e:
+                print(f"Error converting markdown: {e}")
+                # Fallback to simple conversion
+                content = _simple_markdown_to_html(content)
+        else:
+            # Use simplified markdown conversion
+            content = _simple_markdown_to_html(content)
+    elif file_ext == '.txt':
+        # Convert plain text to HTML
+        content = content.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        content = f"<div>{content.replace(chr(10), '<br>')}</div>"
+    return content
+
+def find_converted_images_dir(output_dir):
+    """Return the directory holding a LibreOffice conversion's images, or None"""
+    # Look for an 'images' subfolder that LibreOffice might have created
+    images_folder = os.path.join(output_dir, 'images')
+    if os.path.isdir(images_folder):
+        return images_folder
+    # Check for any image files in the main output directory
+    image_files = [f for f in os.listdir(output_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
+    if image_files:
+        return output_dir
+    return None
+
+def wrap_html_document(body_content):
+    """Wrap editor content in the standalone HTML document written on save"""
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <title>HTML Document</title>
+    <meta charset="utf-8">
+</head>
+<body>
+{body_content}
+</body>
+</html>"""
+
+def write_file_atomic(path, data):
+    """
+    Replace path with data so readers never see a partial file
+    
+    The bytes go to a temporary file in the same directory, which is fsynced and
+    renamed over the target. Symlinks are followed and the target's permissions
+    are kept. data may also be a callable that streams the contents into the
+    binary file object it is given.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o666 & ~_get_umask())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    # Persist the rename itself
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+def _get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def _get_save_executor(win):
+    """Single worker per window, so its saves land on disk in the order they were made"""
+    if getattr(win, 'save_executor', None) is None:
+        win.save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webkitword-save")
+    return win.save_executor
+
+def write_document_async(self, win, file, data, callback=None, label="Saved", streamed=False, writer=None):
+    """
+    Write bytes to a Gio.File in a worker thread
+    
+    Local files are replaced atomically with write_file_atomic; other locations
+    go through Gio's replace_contents, which is atomic as well. When the bytes
+    match the last save of the same file the write is skipped.
+    
+    data may also be a callable returning the bytes, to build them in the worker.
+    With streamed=True it is instead a callable writing the contents to a binary
+    file object, for formats too large to build in memory; those writes are
+    never skipped. Formats that update an existing file themselves pass
+    writer(path) instead of data, returning the number of bytes written; they
+    can only be saved to local files. callback(success, error_message) runs on the main thread once the write is done.
+    """
+    path = file.get_path()
+    uri = file.get_uri()
+    change_count = getattr(win, 'change_count', 0)
+    last_saved = getattr(win, 'last_saved_hash', None)
+    
+    def worker():
+        started = time.monotonic()
+        payload = None
+        digest = None
+        skipped = False
+        error = None
+        size = 0
+        # Any failure, including a bug in a writer, must still reach finish()
+        # so the callback runs and callers waiting on the save go on
+        try:
+            if not streamed and writer is None:
+                payload = data() if callable(data) else data
+                digest = hashlib.sha256(payload).hexdigest()
+                size = len(payload)
+            skipped = (digest is not None and last_saved == (uri, digest) and
+                       (os.path.exists(path) if path else file.query_exists(None)))
+            if not skipped:
+                if writer is not None:
+                    if not path:
+                        raise ValueError("This format can only be saved to a local file")
+                    size = writer(path)
+                elif path:
+                    write_file_atomic(path, payload if payload is not None else data)
+                    size = os.path.getsize(path)
+                else:
+                    if payload is None:
+                        buffer = io.BytesIO()
+                        data(buffer)
+                        payload = buffer.getvalue()
+                        size = len(payload)
+                    file.replace_contents(payload, None, False, Gio.FileCreateFlags.REPLACE_DESTINATION, None)
+        except GLib.Error as e:
+            error = e.message
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        elapsed = time.monotonic() - started
+        
+        def finish():
+            name = file.get_basename()
+            if error:
+                print(f"Error writing file: {error}")
+                win.statusbar.set_text(f"Error writing file: {error}")
+            else:
+                win.last_saved_hash = (uri, digest) if digest else None
+                win.current_file = file
+                # Edits made while the write was in flight still need saving
+                if getattr(win, 'change_count', 0) == change_count:
+                    win.modified = False
+                    self.mark_journal_saved(win)
+                self.update_window_title(win)
+                if skipped:
+                    win.statusbar.set_text(f"{label}: {name} (unchanged)")
+                else:
+                    win.statusbar.set_text(f"{label}: {name} ({GLib.format_size(size)} in {elapsed:.2f}s)")
+            if callback:
+                callback(error is None, error)
+            return False
+        
+        GLib.idle_add(finish)
+    
+    _get_save_executor(win).submit(worker)
+
+def save_html_content(self, win, editor_content, file, callback=None, label="Saved"):
+    """Wrap editor content in an HTML document and write it in the background"""
+    # Images still served from an opened MHTML archive are embedded in the worker
+    self.write_document_async(
+        win, file,
+        lambda: wrap_html_document(mhtml_import.inline_archive_sources(editor_content)).encode('utf-8'),
+        callback, label)
+
 # Save operations
 def on_save_clicked(self, win, button):
     """Handle save button click by redirecting to Save As for converted documents"""
@@ -366,8 +916,14 @@ def on_save_clicked(self, win, button):
         file_ext = os.path.splitext(file_path)[1].lower()
         
         # Save based on file extension
-        if file_ext in ['.mht', '.mhtml']:
+        if file_ext == '.wwd':
+            self.save_as_wwd(win, win.current_file)
+        elif file_ext in ['.mht', '.mhtml']:
             self.save_as_mhtml(win, win.current_file)
+        elif file_ext == '.odt':
+            self.save_as_odt(win, win.current_file)
+        elif file_ext == '.docx':
+            self.save_as_docx(win, win.current_file)
         elif file_ext in ['.html', '.htm']:
             self.save_as_html(win, win.current_file)
         elif file_ext in ['.md', '.markdown']:
@@ -390,6 +946,10 @@ def show_save_dialog(self, win, is_save_as=False):
     save_dialog.set_title("Save Document")
     
     # Create filters
+    wwd_filter = Gtk.FileFilter()
+    wwd_filter.set_name("WebkitWord Documents (*.wwd)")
+    wwd_filter.add_pattern("*.wwd")
+    
     html_filter = Gtk.FileFilter()
     html_filter.set_name("HTML Files (*.html)")
     html_filter.add_pattern("*.html")
@@ -404,6 +964,14 @@ def show_save_dialog(self, win, is_save_as=False):
     text_filter.set_name("Text Files (*.txt)")
     text_filter.add_pattern("*.txt")
     
+    odt_filter = Gtk.FileFilter()
+    odt_filter.set_name("OpenDocument Text (*.odt)")
+    odt_filter.add_pattern("*.odt")
+    
+    docx_filter = Gtk.FileFilter()
+    docx_filter.set_name("Word Documents (*.docx)")
+    docx_filter.add_pattern("*.docx")
+    
     rtf_filter = Gtk.FileFilter()
     rtf_filter.set_name("Rich Text Files (*.rtf)")
     rtf_filter.add_pattern("*.rtf")
@@ -416,8 +984,11 @@ def show_save_dialog(self, win, is_save_as=False):
     filters = Gio.ListStore.new(Gtk.FileFilter)
     # Add MHT first for converted documents so it's the default
     filters.append(mht_filter)
+    filters.append(wwd_filter)
     filters.append(html_filter)
     filters.append(text_filter)
+    filters.append(odt_filter)
+    filters.append(docx_filter)
     filters.append(rtf_filter)
     filters.append(all_filter)
     
@@ -473,8 +1044,14 @@ def _on_save_dialog_response(self, dialog, result, win):
             # Save based on file extension
             file_ext = os.path.splitext(file_path)[1].lower()
             
-            if file_ext in ['.mht', '.mhtml']:
+            if file_ext == '.wwd':
+                self.save_as_wwd(win, file)
+            elif file_ext in ['.mht', '.mhtml']:
                 self.save_as_mhtml(win, file)
+            elif file_ext == '.odt':
+                self.save_as_odt(win, file)
+            elif file_ext == '.docx':
+                self.save_as_docx(win, file)
             elif file_ext in ['.html', '.htm']:
                 self.save_as_html(win, file)
             elif file_ext in ['.md', '.markdown']:
@@ -539,11 +1116,9 @@ def _create_custom_save_dialog(self, win, initial_name="", current_format=None):
         {"extension": ".pdf", "name": "PDF Document", "mime": "application/pdf"},
     ]
     
-    # Add markdown if html2text is available
-    if HTML2TEXT_AVAILABLE:
-        formats.append(
-            {"extension": ".md", "name": "Markdown Document", "mime": "text/markdown"}
-        )
+    formats.append(
+        {"extension": ".md", "name": "Markdown Document", "mime": "text/markdown"}
+    )
     
     # Parse initial name
     basename = initial_name
@@ -656,8 +1231,14 @@ def _on_dialog_response(self, dialog, response_id, dialog_data, win):
             # Determine file type and call appropriate save method
             file_ext = os.path.splitext(filepath)[1].lower()
             
-            if file_ext in ['.mht', '.mhtml']:
+            if file_ext == '.wwd':
+                self.save_as_wwd(win, file)
+            elif file_ext in ['.mht', '.mhtml']:
                 self.save_as_mhtml(win, file)
+            elif file_ext == '.odt':
+                self.save_as_odt(win, file)
+            elif file_ext == '.docx':
+                self.save_as_docx(win, file)
             elif file_ext in ['.html', '.htm']:
                 self.save_as_html(win, file)
             elif file_ext in ['.md', '.markdown']:
@@ -703,63 +1284,119 @@ def _get_file_path_from_dialog(self, dialog_data):
     # Build full path
     return os.path.join(dialog_data["current_folder"], filename + extension)
 
+def save_as_wwd(self, win, file):
+    """Save the document in the native .wwd format"""
+    win.webview.evaluate_javascript(
+        SNAPSHOT_JS, -1, None, None, None,
+        lambda webview, result, data: self._on_get_wwd_content(win, webview, result, file),
+        None
+    )
+    win.statusbar.set_text(f"Saving document: {file.get_path()}")
+
+def _on_get_wwd_content(self, win, webview, result, file):
+    """Write the editor snapshot into the .wwd archive in the save worker"""
+    try:
+        js_result = webview.evaluate_javascript_finish(result)
+        snapshot = json.loads(js_result.to_string())
+    except Exception as e:
+        print(f"Error getting editor content: {e}")
+        win.statusbar.set_text(f"Error saving document: {e}")
+        return
+    
+    title = os.path.splitext(file.get_basename())[0]
+    source = win.current_file.get_path() if win.current_file else None
+    base_dir = os.path.dirname(source) if source else None
+    self.write_document_async(
+        win, file, None,
+        writer=lambda path: wwd_format.save_wwd(path, snapshot['html'], snapshot['text'], title, base_dir))
+
 def save_as_mhtml(self, win, file):
-    """Save document as MHTML using WebKit's save method"""
+    """Save the editor content and its images as an MHTML archive"""
+    # Off-screen images must be archived with their real sources
+    win.webview.evaluate_javascript(
+        RESTORE_LAZY_IMAGES_JS + "document.getElementById('editor').innerHTML",
+        -1, None, None, None,
+        lambda webview, result, data: self._on_get_mhtml_content(win, webview, result, file),
+        None
+    )
+    win.statusbar.set_text(f"Saving MHTML file: {file.get_path()}")
+
+def _on_get_mhtml_content(self, win, webview, result, file):
+    """Stream the editor HTML into an MHTML archive in the save worker"""
     try:
-        # Get the file URI
-        file_uri = file.get_uri()
-        
-        # Check which WebKit version and methods are available
-        if hasattr(win.webview, 'save_to_file'):
-            # WebKit 6.0+ method
-            win.webview.save_to_file(file, WebKit.SaveMode.MHTML, None, 
-                                  lambda webview, result: self.save_webkit_callback(win, file, result))
-        elif hasattr(win.webview, 'save'):
-            # Older WebKit method
-            win.webview.save(WebKit.SaveMode.MHTML, None,  # No cancellable
-                          lambda webview, result: self.save_webkit_callback(win, file, result))
-        else:
-            # Fallback for even older WebKit versions
-            print("WebKit save methods not available, falling back to HTML")
-            self.save_as_html(win, file)
-            return
-            
-        win.statusbar.set_text(f"Saving MHTML file: {file.get_path()}")
+        js_result = webview.evaluate_javascript_finish(result)
+        editor_content = js_result.to_string() if js_result else ""
     except Exception as e:
-        print(f"Error saving as MHTML: {e}")
+        print(f"Error getting editor content: {e}")
         win.statusbar.set_text(f"Error saving MHTML: {e}")
-        # Fallback to manual saving
-        self.save_as_html(win, file)
+        return
+    
+    title = os.path.splitext(file.get_basename())[0]
+    # Relative image paths are relative to the document they came from
+    source = win.current_file.get_path() if win.current_file else None
+    base_dir = os.path.dirname(source) if source else None
+    self.write_document_async(
+        win, file,
+        lambda output: write_mhtml(
+            wrap_html_document(mhtml_import.inline_archive_sources(editor_content)), output, title, base_dir),
+        streamed=True)
+
+def save_as_odt(self, win, file):
+    """Save the editor content as an OpenDocument Text file"""
+    win.webview.evaluate_javascript(
+        RESTORE_LAZY_IMAGES_JS + "document.getElementById('editor').innerHTML",
+        -1, None, None, None,
+        lambda webview, result, data: self._on_get_odt_content(win, webview, result, file),
+        None
+    )
+    win.statusbar.set_text(f"Saving ODT file: {file.get_path()}")
 
-def save_webkit_callback(self, win, file, result):
-    """Handle WebKit save result"""
+def _on_get_odt_content(self, win, webview, result, file):
+    """Stream the editor HTML into an ODT package in the save worker"""
     try:
-        # Check if this is a WebKit 6.0+ result with get_web_error
-        if hasattr(result, 'get_web_error'):
-            error = result.get_web_error()
-            if error is None:
-                # Successful WebKit save
-                win.current_file = file
-                win.modified = False
-                self.update_window_title(win)
-                win.statusbar.set_text(f"Saved: {file.get_path()}")
-            else:
-                # WebKit save failed
-                print(f"WebKit save error: {error.get_message()}")
-                win.statusbar.set_text(f"Error: {error.get_message()}")
-                # Fallback to manual saving
-                self.save_as_html(win, file)
-        else:
-            # For older WebKit versions without detailed error info
-            # Just assume success and update the UI
-            win.current_file = file
-            win.modified = False
-            self.update_window_title(win)
-            win.statusbar.set_text(f"Saved: {file.get_path()}")
+        js_result = webview.evaluate_javascript_finish(result)
+        editor_content = js_result.to_string() if js_result else ""
     except Exception as e:
-        print(f"Error in WebKit save callback: {e}")
-        # Fallback to manual saving
-        self.save_as_html(win, file)
+        print(f"Error getting editor content: {e}")
+        win.statusbar.set_text(f"Error saving ODT: {e}")
+        return
+    
+    title = os.path.splitext(file.get_basename())[0]
+    source = win.current_file.get_path() if win.current_file else None
+    base_dir = os.path.dirname(source) if source else None
+    self.write_document_async(
+        win, file,
+        lambda output: write_odt(editor_content, output, title, base_dir),
+        streamed=True)
+
+def save_as_docx(self, win, file):
+    """Save the editor content as a Word document"""
+    win.webview.evaluate_javascript(
+        RESTORE_LAZY_IMAGES_JS + "document.getElementById('editor').innerHTML",
+        -1, None, None, None,
+        lambda webview, result, data: self._on_get_docx_content(win, webview, result, file),
+        None
+    )
+    win.statusbar.set_text(f"Saving DOCX file: {file.get_path()}")
+
+def _on_get_docx_content(self, win, webview, result, file):
+    """Stream the editor HTML into a DOCX package in the save worker"""
+    try:
+        js_result = webview.evaluate_javascript_finish(result)
+        editor_content = js_result.to_string() if js_result else ""
+    except Exception as e:
+        print(f"Error getting editor content: {e}")
+        win.statusbar.set_text(f"Error saving DOCX: {e}")
+        return
+    
+    title = os.path.splitext(file.get_basename())[0]
+    source = win.current_file.get_path() if win.current_file else None
+    base_dir = os.path.dirname(source) if source else None
+    self.write_document_async(
+        win, file,
+        lambda output: write_docx(editor_content, output, title, base_dir,
+                                  page=getattr(win, 'docx_page', None)),
+        streamed=True)
 
 def save_as_html(self, win, file):
     """Save document as HTML by extracting just the editor content"""
@@ -781,7 +1418,7 @@ def save_as_html_fallback(self, win, file):
     try:
         # Create basic HTML content with the current content
         win.webview.evaluate_javascript(
-            "document.body.innerHTML",
+            RESTORE_LAZY_IMAGES_JS + "document.body.innerHTML",
             -1, None, None, None,
             lambda webview, result, data: self.save_html_body_callback(win, webview, result, file),
             None
@@ -802,42 +1439,8 @@ def save_html_body_callback(self, win, webview, result, file):
             else:
                 body_content = js_result.to_string()
             
-            # Create a complete HTML document
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>HTML Document</title>
-    <meta charset="utf-8">
-</head>
-<body>
-{body_content}
-</body>
-</html>"""
-
-            # Convert the string to bytes
-            content_bytes = html_content.encode('utf-8')
-            
-            # Use the simpler replace_contents method
-            try:
-                success, etag = file.replace_contents(
-                    content_bytes,
-                    None,  # etag
-                    False,  # make_backup
-                    Gio.FileCreateFlags.REPLACE_DESTINATION,
-                    None   # cancellable
-                )
-                
-                if success:
-                    win.current_file = file
-                    win.modified = False
-                    self.update_window_title(win)
-                    win.statusbar.set_text(f"Saved: {file.get_path()}")
-                else:
-                    win.statusbar.set_text("File save was not successful")
-                    
-            except GLib.Error as e:
-                print(f"Error writing file: {e.message}")
-                win.statusbar.set_text(f"Error writing file: {e.message}")
+            # Write the complete HTML document in the background
+            self.save_html_content(win, body_content, file)
                 
         else:
             print("Failed to get HTML content from webview")
@@ -848,14 +1451,68 @@ def save_html_body_callback(self, win, webview, result, file):
 
 def save_as_text(self, win, file):
     """Save document as plain text by extracting text content from the webview"""
+    if getattr(win, 'plain_text_mode', False):
+        self.save_text_blocks(win, file)
+        return
     win.webview.evaluate_javascript(
-        "document.body.innerText || document.body.textContent",
+        "fullLayoutText(document.body) || document.body.textContent",
         -1, None, None, None,
         lambda webview, result, data: self.save_text_callback(win, webview, result, file),
         None
     )
     win.statusbar.set_text(f"Saving text file: {file.get_path()}")
 
+def save_text_blocks(self, win, file):
+    """
+    Save a plain-text document block by block
+
+    The block texts are fetched TEXT_SAVE_BLOCKS at a time and written one by
+    one, in the encoding and with the line breaks of the file that was opened,
+    so the document is never joined into one string. Edits made while fetching start it over.
+    """
+    if getattr(win, 'text_stream', None) is not None:
+        win.statusbar.set_text("The document is still loading; save it once it has opened")
+        return
+    layout = getattr(win, 'text_layout', None)
+    newline = layout.newline if layout else '\n'
+    final_newline = layout.final_newline if layout else True
+    encoding = layout.encoding if layout else 'utf-8'
+    batches = []
+    change_count = getattr(win, 'change_count', 0)
+    
+    def fetch(start):
+        win.webview.evaluate_javascript(
+            f"getTextBlocks({start}, {TEXT_SAVE_BLOCKS});",
+            -1, None, None, None, on_blocks, start)
+    
+    def on_blocks(webview, result, start):
+        nonlocal change_count
+        try:
+            js_result = webview.evaluate_javascript_finish(result)
+            blocks = json.loads(js_result.to_string())
+        except (GLib.Error, ValueError) as e:
+            message = e.message if isinstance(e, GLib.Error) else str(e)
+            print(f"Error reading text for save: {message}")
+            win.statusbar.set_text(f"Error saving text: {message}")
+            return
+        if getattr(win, 'change_count', 0) != change_count:
+            change_count = getattr(win, 'change_count', 0)
+            batches.clear()
+            fetch(0)
+            return
+        batches.append(blocks['texts'])
+        if start + TEXT_SAVE_BLOCKS < blocks['total']:
+            fetch(start + TEXT_SAVE_BLOCKS)
+            return
+        self.write_document_async(
+            win, file,
+            lambda output: text_document.write_text_blocks(
+                output, batches, newline, final_newline, encoding),
+            streamed=True)
+    
+    win.statusbar.set_text(f"Saving text file: {file.get_path()}")
+    fetch(0)
+
 def save_text_callback(self, win, webview, result, file):
     """Process text content from webview and save to file"""
     try:
@@ -864,28 +1521,15 @@ def save_text_callback(self, win, webview, result, file):
             text_content = js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else js_result.to_string()
             
             # Replace the file with the new content
-            file.replace_contents_async(
-                text_content.encode('utf-8'),
-                None,
-                False,
-                Gio.FileCreateFlags.REPLACE_DESTINATION,
-                None,
-                lambda file, result: self.save_completion_callback(win, file, result)
-            )
+            self.write_document_async(win, file, text_content.encode('utf-8'))
     except Exception as e:
         print(f"Error processing text for save: {e}")
         win.statusbar.set_text(f"Error saving text: {e}")
 
 def save_as_markdown(self, win, file):
-    """Save document as Markdown using html2text if available"""
-    if not HTML2TEXT_AVAILABLE:
-        win.statusbar.set_text("html2text library not available for Markdown conversion")
-        # Fallback to HTML
-        self.save_as_html(win, file)
-        return
-        
+    """Save document as Markdown converted from the editor content"""
     win.webview.evaluate_javascript(
-        "document.documentElement.outerHTML",
+        "document.getElementById('editor').innerHTML",
         -1, None, None, None,
         lambda webview, result, data: self.save_markdown_callback(win, webview, result, file),
         None
@@ -893,36 +1537,20 @@ def save_as_markdown(self, win, file):
     win.statusbar.set_text(f"Saving Markdown file: {file.get_path()}")
 
 def save_markdown_callback(self, win, webview, result, file):
-    """Convert HTML to Markdown and save to file"""
+    """Convert editor HTML to Markdown and save to file"""
     try:
         js_result = webview.evaluate_javascript_finish(result)
-        if js_result and HTML2TEXT_AVAILABLE:
+        if js_result:
             html_content = js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else js_result.to_string()
             
-            # Convert HTML to Markdown
-            h2t = html2text.HTML2Text()
-            h2t.unicode_snob = True        # Use Unicode
-            h2t.body_width = 0             # Don't wrap lines
-            h2t.ignore_links = False       # Preserve links
-            h2t.ignore_images = False      # Preserve images
-            h2t.ignore_tables = False      # Try to handle tables
-            
-            markdown_content = h2t.handle(html_content)
-            
-            # Replace the file with the new content
-            file.replace_contents_async(
-                markdown_content.encode('utf-8'),
-                None,
-                False,
-                Gio.FileCreateFlags.REPLACE_DESTINATION,
-                None,
-                lambda file, result: self.save_completion_callback(win, file, result)
-            )
+            # Convert in the save worker, writing each block as it is done
+            self.write_document_async(
+                win, file,
+                lambda output: write_markdown(mhtml_import.inline_archive_sources(html_content), output),
+                streamed=True)
     except Exception as e:
         print(f"Error converting to Markdown for save: {e}")
         win.statusbar.set_text(f"Error saving Markdown: {e}")
-        # Fallback to HTML
-        self.save_as_html(win, file)
 
 def save_completion_callback(self, win, file, result):
     """Handle save completion"""
@@ -984,47 +1612,13 @@ def _on_get_html_content(self, win, webview, result, file):
             else:
                 editor_content = js_result.to_string()
             
-            # Wrap the content in a proper HTML document
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>HTML Document</title>
-    <meta charset="utf-8">
-</head>
-<body>
-{editor_content}
-</body>
-</html>"""
-
-            # Convert the string to bytes
-            content_bytes = html_content.encode('utf-8')
+            def on_saved(success, error):
+                # Once saved as HTML, the document no longer refers to a cached conversion
+                if success and getattr(win, 'is_converted_file', False):
+                    win.is_converted_file = False
             
-            # Use the synchronous replace_contents method
-            try:
-                success, etag = file.replace_contents(
-                    content_bytes,
-                    None,  # etag
-                    False,  # make_backup
-                    Gio.FileCreateFlags.REPLACE_DESTINATION,
-                    None   # cancellable
-                )
-                
-                if success:
-                    win.current_file = file
-                    win.modified = False
-                    
-                    # If this was a converted file, update the status
-                    if hasattr(win, 'is_converted_file') and win.is_converted_file:
-                        win.is_converted_file = False
-                        
-                    self.update_window_title(win)
-                    win.statusbar.set_text(f"Saved: {file.get_path()}")
-                else:
-                    win.statusbar.set_text("File save was not successful")
-                    
-            except GLib.Error as e:
-                print(f"Error writing file: {e.message if hasattr(e, 'message') else str(e)}")
-                win.statusbar.set_text(f"Error writing file: {str(e)}")
+            # Write the wrapped HTML document in the background
+            self.save_html_content(win, editor_content, file, on_saved)
                 
     except Exception as e:
         print(f"Error processing HTML for save: {e}")
@@ -1046,11 +1640,18 @@ def load_file(self, win, filepath):
         # Store the original file path format for reference
         win.original_format = os.path.splitext(filepath)[1].lower()
         win.original_filepath = filepath
+        win.docx_page = None
+        # Stop streaming a text document that is still coming in
+        win.text_stream = None
+        win.plain_text_mode = False
         
         # Show loading dialog for potentially slow conversions
         loading_dialog = None
-        if is_libreoffice_format(filepath) and win.original_format not in ['.html', '.htm', '.txt', '.md', '.markdown']:
-            loading_dialog = self.show_loading_dialog(win)
+        cancellable = None
+        # Word documents are read natively first, which takes no time worth a dialog
+        if is_libreoffice_format(filepath) and win.original_format not in ['.html', '.htm', '.txt', '.md', '.markdown', '.docx']:
+            cancellable = Gio.Cancellable()
+            loading_dialog = self.show_loading_dialog(win, cancellable=cancellable)
         
         # Process the file based on its format
         file_ext = os.path.splitext(filepath)[1].lower()
@@ -1059,11 +1660,7 @@ def load_file(self, win, filepath):
         def continue_loading(html_content=None, converted_path=None, image_dir=None):
             try:
                 # Close loading dialog if it was shown
-                if loading_dialog:
-                    try:
-                        loading_dialog.close()
-                    except Exception as e:
-                        print(f"Warning: Could not close loading dialog: {e}")
+                _close_loading_dialog(loading_dialog)
                 
                 # Initialize content variable
                 content = ""
@@ -1072,104 +1669,21 @@ def load_file(self, win, filepath):
                 if html_content:
                     content = html_content
                 else:
-                    # Try to detect file encoding
-                    encoding = 'utf-8'  # Default encoding
-                    try:
-                        import chardet
-                        with open(filepath, 'rb') as raw_file:
-                            raw_content = raw_file.read()
-                            detected = chardet.detect(raw_content)
-                            if detected['confidence'] > 0.7:
-                                encoding = detected['encoding']
-                    except ImportError:
-                        pass  # Fallback to utf-8 if chardet not available
-                        
-                    # Now read the file with the detected encoding
-                    try:
-                        with open(filepath, 'r', encoding=encoding) as f:
-                            content = f.read()
-                    except UnicodeDecodeError:
-                        # If there's a decode error, try a fallback encoding
-                        with open(filepath, 'r', encoding='latin-1') as f:
-                            content = f.read()
-                
-                # Process content based on file type
-                if file_ext in ['.mht', '.mhtml']:
-                    # Handle MHTML files - extract the HTML content
-                    try:
-                        import email
-                        message = email.message_from_string(content)
-                        for part in message.walk():
-                            if part.get_content_type() == 'text/html':
-                                content = part.get_payload(decode=True).decode(part.get_content_charset() or 'utf-8')
-                                break
-                    except ImportError:
-                        # Fallback to regex extraction if email module not ideal
-                        body_match = re.search(r'Content-Type: text/html.*?charset=["\']?([\w-]+)["\']?.*?(?:\r?\n){2}(.*?)(?:\r?\n){1,2}--', 
-                                              content, re.DOTALL | re.IGNORECASE)
-                        if body_match:
-                            charset, html_content = body_match.groups()
-                            content = html_content
-                            
-                    # Extract body content from the HTML
-                    body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
-                    if body_match:
-                        content = body_match.group(1).strip()
-                        
-                elif file_ext in ['.html', '.htm']:
-                    # Handle HTML content
-                    body_match = re.search(r'<body[^>]*>(.*?)</body>', content, re.DOTALL | re.IGNORECASE)
-                    if body_match:
-                        content = body_match.group(1).strip()
-                        
-                elif file_ext in ['.md', '.markdown']:
-                    # Convert markdown to HTML
-                    if MARKDOWN_AVAILABLE:
-                        try:
-                            # Get available extensions
-                            available_extensions = []
-                            for ext in ['tables', 'fenced_code', 'codehilite', 'nl2br', 'sane_lists', 'smarty', 'attr_list']:
-                                try:
-                                    # Test if extension can be loaded
-                                    markdown.markdown("test", extensions=[ext])
-                                    available_extensions.append(ext)
-                                except (ImportError, ValueError):
-                                    pass
-                            
-                            # Convert markdown to HTML
-                            content = markdown.markdown(content, extensions=available_extensions)
-                        except Exception as e:
-                            print(f"Error converting markdown: {e}")
-                            # Fallback to simple conversion
-                            content = self._simple_markdown_to_html(content)
-                    else:
-                        # Use simplified markdown conversion
-                        content = self._simple_markdown_to_html(content)
-                elif file_ext == '.txt':
-                    # Convert plain text to HTML
-                    content = content.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-                    content = f"<div>{content.replace(chr(10), '<br>')}</div>"
+                    content = content_to_editor_html(read_text_file(filepath), file_ext)
                 
                 # Process image references for converted LibreOffice documents
                 if converted_path and image_dir and os.path.exists(image_dir):
-                    # Look for an 'images' subfolder that LibreOffice might have created
-                    images_folder = os.path.join(image_dir, 'images')
-                    if os.path.exists(images_folder) and os.path.isdir(images_folder):
-                        print(f"Found images folder: {images_folder}")
-                        # Store the image directory for reference
-                        win.image_dir = images_folder
+                    images_folder = find_converted_images_dir(image_dir)
+                    if images_folder:
+                        print(f"Found images in: {images_folder}")
+                        # Store the image directory for cleanup, unless the cache owns it
+                        if not conversion_cache.is_cache_path(images_folder):
+                            win.image_dir = images_folder
                         
                         # Process the image references in the content
                         content = self._process_image_references(content, images_folder)
                     else:
-                        # Check for any image files in the main output directory
-                        image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-                        if image_files:
-                            print(f"Found {len(image_files)} image files in output directory")
-                            win.image_dir = image_dir
-                            content = self._process_image_references(content, image_dir)
-                        else:
-                            print(f"No images folder or image files found in {image_dir}")
+                        print(f"No images folder or image files found in {image_dir}")
                 
                 # Ensure content is properly wrapped in a div if not already
                 if not (content.strip().startswith('<div') or content.strip().startswith('<p') or 
@@ -1219,70 +1733,376 @@ def load_file(self, win, filepath):
                         
             except Exception as e:
                 # Close loading dialog if it was shown
-                if loading_dialog:
-                    try:
-                        loading_dialog.close()
-                    except:
-                        pass
+                _close_loading_dialog(loading_dialog)
                 print(f"Error processing file content: {str(e)}")
                 win.statusbar.set_text(f"Error processing file: {str(e)}")
                 self.show_error_dialog(f"Error processing file: {e}")
         
         # Check if file needs LibreOffice conversion
         if is_libreoffice_format(filepath) and file_ext not in ['.html', '.htm', '.txt', '.md', '.markdown']:
-            # Start the conversion in a separate thread to keep UI responsive
-            def convert_thread():
-                try:
-                    # Convert the file to HTML using LibreOffice
-                    converted_file, image_dir = self.convert_with_libreoffice(filepath, "html")
-                    
-                    if converted_file:
-                        # Read the converted HTML file
-                        try:
-                            with open(converted_file, 'r', encoding='utf-8') as f:
-                                html_content = f.read()
-                                
-                            # Extract body content
-                            body_match = re.search(r'<body[^>]*>(.*?)</body>', html_content, re.DOTALL | re.IGNORECASE)
-                            if body_match:
-                                html_content = body_match.group(1).strip()
-
+            base_name = os.path.splitext(os.path.basename(filepath))[0]
+            
+            def conversion_failed(message):
+                _close_loading_dialog(loading_dialog)
+                win.statusbar.set_text(message)
+                self.show_error_dialog(win, message)
+                return False
+            
+            def show_progress(line):
+                if loading_dialog:
+                    loading_dialog.detail_label.set_text(line)
+                    loading_dialog.detail_label.set_visible(True)
+            
+            def on_converted(converted_file, temp_dir, error, cache_key):
+                if error == "cancelled":
+                    _close_loading_dialog(loading_dialog)
+                    win.statusbar.set_text(f"Opening {os.path.basename(filepath)} cancelled")
+                    return
+                if error:
+                    print(error)
+                    conversion_failed("Failed to convert document with LibreOffice. Please check if LibreOffice is installed correctly.")
+                    return
+                
+                # Reading the result and filling the cache touch the disk; keep them off the main loop
+                def finish_thread():
+                    try:
+                        with open(converted_file, 'r', encoding='utf-8') as f:
+                            html_content = extract_body(f.read())
+                        
+                        output_file, image_dir = converted_file, temp_dir
+                        # Move the result into the cache so the temp dir can go
+                        if cache_key:
+                            try:
+                                output_file, image_dir = conversion_cache.store(
+                                    cache_key, base_name, html_content, temp_dir)
+                                shutil.rmtree(temp_dir, ignore_errors=True)
+                            except OSError as e:
+                                print(f"Could not cache conversion: {e}")
+                        
+                        def deliver():
+                            if cancellable.is_cancelled():
+                                _close_loading_dialog(loading_dialog)
+                                win.statusbar.set_text(f"Opening {os.path.basename(filepath)} cancelled")
+                                return False
                             # Mark this as a converted file
                             win.is_converted_file = True
-                                                        
-                            # Schedule continuing in the main thread with the HTML content
-                            GLib.idle_add(lambda: continue_loading(html_content, converted_file, image_dir))
-                        except Exception as e:
-                            print(f"Error reading converted file: {e}")
-                            GLib.idle_add(lambda: self.show_error_dialog(f"Error reading converted file: {e}"))
-                            GLib.idle_add(lambda: loading_dialog.close() if loading_dialog else None)
+                            continue_loading(html_content, output_file, image_dir)
+                            return False
+                        
+                        GLib.idle_add(deliver)
+                    except Exception as e:
+                        message = f"Error reading converted file: {e}"
+                        print(message)
+                        GLib.idle_add(lambda: conversion_failed(message))
+                
+                GLib.Thread.new(None, finish_thread)
+            
+            # Hashing the document for the cache lookup reads it in full, so do it in a thread
+            def lookup_thread():
+                cache_key = None
+                try:
+                    cache_key = conversion_cache.compute_cache_key(filepath)
+                    cached = conversion_cache.lookup(cache_key, base_name)
+                except OSError as e:
+                    print(f"Conversion cache unavailable: {e}")
+                    cached = None
+                
+                if cached:
+                    html_content, cached_file, entry_dir = cached
+                    print(f"Using cached conversion: {entry_dir}")
+                    
+                    def deliver_cached():
+                        if cancellable.is_cancelled():
+                            _close_loading_dialog(loading_dialog)
+                            return False
+                        win.is_converted_file = True
+                        continue_loading(html_content, cached_file, entry_dir)
+                        return False
+                    
+                    GLib.idle_add(deliver_cached)
+                    return
+                
+                # Convert the file to HTML using LibreOffice without blocking the UI
+                GLib.idle_add(lambda: self.convert_with_libreoffice_async(
+                    filepath, "html", cancellable,
+                    lambda converted_file, temp_dir, error: on_converted(converted_file, temp_dir, error, cache_key),
+                    show_progress) and False)
+            
+            def start_libreoffice():
+                nonlocal loading_dialog, cancellable
+                if cancellable is None:
+                    cancellable = Gio.Cancellable()
+                    loading_dialog = self.show_loading_dialog(win, cancellable=cancellable)
+                GLib.Thread.new(None, lookup_thread)
+                return False
+            
+            if file_ext == '.docx':
+                # Documents within the supported subset open without LibreOffice
+                def native_thread():
+                    try:
+                        archive = mhtml_import.open_archive(filepath, docx_import.DocxArchive)
+                    except (OSError, ValueError) as e:
+                        print(f"Opening {os.path.basename(filepath)} with LibreOffice: {e}")
+                        GLib.idle_add(start_libreoffice)
+                        return
+                    
+                    def deliver():
+                        # Save goes to Save As, as for LibreOffice conversions:
+                        # the editor writes a new document, not the original
+                        win.is_converted_file = True
+                        # Saving as .docx keeps the document's page layout
+                        win.docx_page = archive.page
+                        self.set_window_archive(win, archive.archive_id)
+                        continue_loading(archive.html or "<p><br></p>")
+                        return False
+                    
+                    GLib.idle_add(deliver)
+                
+                GLib.Thread.new(None, native_thread)
+            else:
+                start_libreoffice()
+        elif file_ext == '.txt':
+            self.load_text_document(win, filepath)
+        elif file_ext in ['.wwd', '.mht', '.mhtml']:
+            # Index the archive off the main thread; its images are decoded on request
+            def index_thread():
+                try:
+                    if file_ext == '.wwd':
+                        archive = mhtml_import.open_archive(filepath, wwd_format.WwdArchive)
+                        html_content = archive.get_editor_html()
                     else:
-                        # Conversion failed
-                        GLib.idle_add(lambda: self.show_error_dialog("Failed to convert document with LibreOffice. Please check if LibreOffice is installed correctly."))
-                        GLib.idle_add(lambda: loading_dialog.close() if loading_dialog else None)
-                except Exception as e:
-                    print(f"Error in conversion thread: {e}")
-                    GLib.idle_add(lambda: self.show_error_dialog(f"Conversion error: {e}"))
-                    GLib.idle_add(lambda: loading_dialog.close() if loading_dialog else None)
+                        archive = mhtml_import.open_archive(filepath)
+                        html_content = archive.rewrite_sources(extract_body(archive.get_html()))
+                except (OSError, ValueError, KeyError) as e:
+                    message = f"Error opening {os.path.basename(filepath)}: {e}"
+                    print(message)
+                    
+                    def report():
+                        win.statusbar.set_text(message)
+                        self.show_error_dialog(win, message)
+                        return False
+                    
+                    GLib.idle_add(report)
+                    return
                 
-                return False  # Don't repeat
+                def deliver():
+                    self.set_window_archive(win, archive.archive_id)
+                    continue_loading(html_content or "<p><br></p>")
+                    return False
+                
+                GLib.idle_add(deliver)
             
-            # Start the conversion thread
-            GLib.idle_add(lambda: GLib.Thread.new(None, convert_thread) and False)
+            GLib.Thread.new(None, index_thread)
         else:
             # Continue with normal loading for directly supported formats
             continue_loading()
             
     except Exception as e:
-        if loading_dialog:
-            try:
-                loading_dialog.close()
-            except:
-                pass
+        _close_loading_dialog(loading_dialog)
         print(f"Error loading file: {str(e)}")
         win.statusbar.set_text(f"Error loading file: {str(e)}")
         self.show_error_dialog(f"Error loading file: {e}")
 
+def load_text_document(self, win, filepath):
+    """
+    Open a text file in plain-text mode, streaming it into the editor in blocks
+
+    A reader thread turns the file into blocks (see text_document) and hands
+    them over in batches; at most TEXT_STREAM_BATCHES batches wait for the
+    editor at a time, so a large file never sits in memory as a whole.
+    """
+    name = os.path.basename(filepath)
+    stream = object()
+    win.text_stream = stream
+    win.plain_text_mode = True
+    win.is_converted_file = False
+    win.current_file = Gio.File.new_for_path(filepath)
+    win.modified = False
+    self.update_window_title(win)
+    win.statusbar.set_text(f"Opening {name}...")
+    slots = threading.Semaphore(TEXT_STREAM_BATCHES)
+    
+    def stale():
+        return getattr(win, 'text_stream', None) is not stream
+    
+    def on_batch_added(webview, result, data):
+        try:
+            webview.evaluate_javascript_finish(result)
+        except GLib.Error as e:
+            print(f"Error adding text to the editor: {e.message}")
+            if not stale():
+                win.text_stream = None
+                win.statusbar.set_text(f"Error opening {name}: {e.message}")
+        slots.release()
+    
+    def deliver(function, html, lines):
+        if stale():
+            slots.release()
+            return False
+        win.webview.evaluate_javascript(
+            f"{function}({json.dumps(html, ensure_ascii=False)});",
+            -1, None, None, None, on_batch_added, None)
+        win.statusbar.set_text(f"Opening {name}... {lines:,} lines")
+        return False
+    
+    def finish(reader, error):
+        if stale():
+            return False
+        win.text_stream = None
+        if error:
+            win.statusbar.set_text(f"Error opening {name}: {error}")
+            self.show_error_dialog(win, f"Error opening {name}: {error}")
+            return False
+        win.text_layout = reader
+        win.statusbar.set_text(f"Opened {name} ({reader.line_count:,} lines)")
+        return False
+    
+    def reader_thread():
+        reader = None
+        error = None
+        try:
+            reader = text_document.TextBlockReader(filepath)
+            function = "setTextContent"
+            for html in reader.batches():
+                # Wait for the editor to take earlier batches, unless the stream was dropped
+                while not slots.acquire(timeout=1):
+                    if stale():
+                        return
+                if stale():
+                    return
+                GLib.idle_add(deliver, function, html, reader.line_count)
+                function = "appendTextBlocks"
+        except (OSError, UnicodeError, LookupError) as e:
+            error = str(e)
+        GLib.idle_add(finish, reader, error)
+    
+    def start():
+        if not stale():
+            GLib.Thread.new(None, reader_thread)
+        return False
+    
+    # A new window may still be loading the editor
+    if win.webview.get_estimated_load_progress() == 1.0:
+        start()
+    else:
+        def on_load_changed(webview, event):
+            if event == WebKit.LoadEvent.FINISHED:
+                webview.disconnect_by_func(on_load_changed)
+                start()
+        win.webview.connect("load-changed", on_load_changed)
+
+def plain_text_js(self):
+    """JavaScript for plain-text documents edited as blocks of lines"""
+    return """
+    // Set while the editor holds a text document: the editor takes plain text
+    // only, and undo is left to the browser instead of innerHTML snapshots
+    window.plainTextMode = false;
+
+    function setPlainTextMode(enabled) {
+        const editor = document.getElementById('editor');
+        window.plainTextMode = enabled;
+        editor.classList.toggle('plain-text-mode', enabled);
+        editor.setAttribute('contenteditable', enabled ? 'plaintext-only' : 'true');
+    }
+
+    function setTextContent(html) {
+        const editor = document.getElementById('editor');
+        setPlainTextMode(true);
+        editor.innerHTML = html;
+        window.lastContent = '';
+        window.undoStack = [''];
+        window.redoStack = [];
+        editor.focus();
+    }
+
+    function appendTextBlocks(html) {
+        document.getElementById('editor').insertAdjacentHTML('beforeend', html);
+    }
+
+    // Text of one block; a line break at its very end does not start a line
+    function textBlockText(node) {
+        let text;
+        if (node.nodeType === Node.TEXT_NODE) {
+            text = node.data;
+        } else if (node.nodeType !== Node.ELEMENT_NODE) {
+            return null;
+        } else if (!node.querySelector('br')) {
+            text = node.textContent;
+        } else {
+            const parts = [];
+            const walker = document.createTreeWalker(node, NodeFilter.SHOW_ELEMENT | NodeFilter.SHOW_TEXT);
+            while (walker.nextNode()) {
+                const current = walker.currentNode;
+                if (current.nodeType === Node.TEXT_NODE) {
+                    parts.push(current.data);
+                } else if (current.nodeName === 'BR') {
+                    parts.push('\\n');
+                }
+            }
+            text = parts.join('');
+        }
+        return text.endsWith('\\n') ? text.slice(0, -1) : text;
+    }
+
+    function getTextBlocks(start, count) {
+        const nodes = document.getElementById('editor').childNodes;
+        const end = Math.min(nodes.length, start + count);
+        const texts = [];
+        for (let i = start; i < end; i++) {
+            const text = textBlockText(nodes[i]);
+            if (text !== null) texts.push(text);
+        }
+        return JSON.stringify({ total: nodes.length, texts: texts });
+    }
+    """
+
+def register_archive_scheme(self):
+    """Serve the parts of opened MHTML archives to the editor"""
+    context = WebKit.WebContext.get_default()
+    context.register_uri_scheme(mhtml_import.ARCHIVE_SCHEME, self._on_archive_uri_request)
+    security_manager = context.get_security_manager()
+    security_manager.register_uri_scheme_as_secure(mhtml_import.ARCHIVE_SCHEME)
+    security_manager.register_uri_scheme_as_cors_enabled(mhtml_import.ARCHIVE_SCHEME)
+    self.archive_scheme_registered = True
+
+def _on_archive_uri_request(self, request):
+    """Decode one archive part in a worker and hand it to WebKit"""
+    uri = request.get_uri()
+    
+    def worker():
+        try:
+            data, content_type = mhtml_import.read_archive_url(uri)
+            error = None
+        except (KeyError, ValueError, OSError) as e:
+            data, content_type, error = None, None, f"Archive part not available: {e}"
+        
+        def finish():
+            if error:
+                request.finish_error(GLib.Error.new_literal(
+                    Gio.io_error_quark(), error, Gio.IOErrorEnum.NOT_FOUND))
+            else:
+                stream = Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(data))
+                request.finish(stream, len(data), content_type)
+            return False
+        
+        GLib.idle_add(finish)
+    
+    _get_archive_executor().submit(worker)
+
+def _get_archive_executor():
+    """Worker pool decoding archive parts, shared by all windows"""
+    global _archive_executor
+    if _archive_executor is None:
+        _archive_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="webkitword-archive")
+    return _archive_executor
+
+def set_window_archive(self, win, archive_id):
+    """Make win hold the archive its images come from, releasing any previous one"""
+    previous = getattr(win, 'archive_id', None)
+    win.archive_id = archive_id
+    if previous:
+        mhtml_import.release_archive(previous)
+
 def show_conversion_notification(self, win, original_path, html_path):
     """Show a notification that the file was converted"""
     original_ext = os.path.splitext(os.path.basename(original_path))[1].upper()
@@ -1355,94 +2175,89 @@ def update_window_title(self, win):
     win.set_title(title)
 
 def _process_image_references(self, html_content, image_dir):
-    """Process image references in HTML content converted from LibreOffice documents"""
+    """Process image references in HTML content converted from LibreOffice documents
+
+    The image directory is indexed once, every referenced file is read and
+    base64-encoded in a thread pool, and the results are applied in a single
+    re.sub pass over the HTML.
+    """
     try:
         import urllib.parse  # Add this import for URL decoding
-        print(f"Processing image references from directory: {image_dir}")
-        
-        # Find all image tags in the HTML
-        image_tags = re.findall(r'<img[^>]+src="([^"]+)"[^>]*>', html_content)
-        print(f"Found {len(image_tags)} image references in HTML")
-        
-        # List all files in the image directory
-        image_files = os.listdir(image_dir)
-        print(f"Found {len(image_files)} files in image directory: {image_files}")
-        
-        # Function to process an image tag
-        def process_image_ref(match):
-            img_tag = match.group(0)
-            src = match.group(1)
-            
-            print(f"Processing image reference: {src}")
-            
-            # Skip already processed or external images
-            if src.startswith(('http://', 'https://', 'data:')):
-                print(f"Skipping external image: {src}")
-                return img_tag
-            
+        _debug(f"Processing image references from directory: {image_dir}")
+
+        # Find all unique image sources in the HTML
+        sources = set(IMG_TAG_PATTERN.findall(html_content))
+        _debug(f"Found {len(sources)} unique image references in HTML")
+        if not sources:
+            return html_content
+
+        # Index the image directory once instead of scanning it per reference
+        image_files = sorted(os.listdir(image_dir))
+        file_index = {name.lower(): name for name in image_files}
+        _debug(f"Found {len(image_files)} files in image directory")
+
+        def resolve_image(src):
+            """Map an image src to a file in image_dir, or None"""
             # URL decode the source - this is key to handling LibreOffice's encoding
             decoded_src = urllib.parse.unquote(src)
-            print(f"Decoded source: {decoded_src}")
-                
-            # If the src is relative, try to find the image in the image directory
             img_path = os.path.join(image_dir, decoded_src)
-            if not os.path.exists(img_path):
-                # Try removing any directory prefix
-                img_path = os.path.join(image_dir, os.path.basename(decoded_src))
-                
-            print(f"Looking for image at: {img_path}")
-            
-            if os.path.exists(img_path):
-                print(f"Found image at: {img_path}")
-                
-                # Convert the image to a data URL to embed it directly
+            if os.path.isfile(img_path):
+                return img_path
+
+            # Try removing any directory prefix
+            name = os.path.basename(decoded_src)
+            if name.lower() in file_index:
+                return os.path.join(image_dir, file_index[name.lower()])
+
+            # Look for any image file with a similar name pattern
+            base_name = os.path.splitext(name)[0].lower()
+            if base_name:
+                for file_name in image_files:
+                    if base_name in file_name.lower():
+                        return os.path.join(image_dir, file_name)
+            return None
+
+        # Resolve every reference; several sources may share one file
+        resolved = {}
+        for src in sources:
+            # Skip already processed or external images
+            if src.startswith(('http://', 'https://', 'data:')):
+                continue
+            img_path = resolve_image(src)
+            if img_path:
+                resolved[src] = img_path
+            else:
+                _debug(f"No matching image found for {src}")
+
+        def encode_image(img_path):
+            with open(img_path, 'rb') as img_file:
+                img_data = base64.b64encode(img_file.read()).decode('ascii')
+            return f"data:{_get_mime_type(self, img_path)};base64,{img_data}"
+
+        # Read and encode each distinct file once, in parallel
+        data_urls = {}
+        unique_paths = set(resolved.values())
+        with ThreadPoolExecutor(max_workers=min(IMAGE_WORKERS, len(unique_paths) or 1)) as executor:
+            futures = {path: executor.submit(encode_image, path) for path in unique_paths}
+            for path, future in futures.items():
                 try:
-                    with open(img_path, 'rb') as img_file:
-                        import base64
-                        img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                        mime_type = self._get_mime_type(img_path)
-                        data_url = f"data:{mime_type};base64,{img_data}"
-                        
-                        # Replace the src attribute with the data URL
-                        new_tag = img_tag.replace(f'src="{src}"', f'src="{data_url}"')
-                        print(f"Converted image to data URL")
-                        return new_tag
+                    data_urls[path] = future.result()
                 except Exception as e:
-                    print(f"Error creating data URL for image {img_path}: {e}")
-            else:
-                # Search for any image file with a similar name pattern
-                base_name = os.path.splitext(os.path.basename(decoded_src))[0].lower()
-                print(f"Image not found, searching for similar names with base: {base_name}")
-                
-                for file in image_files:
-                    if base_name in file.lower():
-                        img_path = os.path.join(image_dir, file)
-                        print(f"Found potential match: {img_path}")
-                        
-                        try:
-                            with open(img_path, 'rb') as img_file:
-                                import base64
-                                img_data = base64.b64encode(img_file.read()).decode('utf-8')
-                                mime_type = self._get_mime_type(img_path)
-                                data_url = f"data:{mime_type};base64,{img_data}"
-                                
-                                # Replace the src attribute with the data URL
-                                new_tag = img_tag.replace(f'src="{src}"', f'src="{data_url}"')
-                                print(f"Used similar image as data URL")
-                                return new_tag
-                        except Exception as e:
-                            print(f"Error creating data URL for similar image {img_path}: {e}")
-                            break
-                
-                print(f"No matching image found for {src}")
-                    
-            # If we couldn't process the image, return the original tag
-            return img_tag
-        
-        # Find and process all image tags
-        processed_html = re.sub(r'<img[^>]+src="([^"]+)"[^>]*>', process_image_ref, html_content)
-        
-        return processed_html
+                    print(f"Error creating data URL for image {path}: {e}")
+
+        replacements = {src: data_urls[path] for src, path in resolved.items() if path in data_urls}
+        _debug(f"Embedded {len(replacements)} of {len(sources)} image references")
+
+        def apply_replacement(match):
+            src = match.group(1)
+            data_url = replacements.get(src)
+            if data_url is None:
+                # If we couldn't process the image, return the original tag
+                return match.group(0)
+            return match.group(0).replace(f'src="{src}"', f'src="{data_url}"', 1)
+
+        # Apply all precomputed replacements in a single pass
+        return IMG_TAG_PATTERN.sub(apply_replacement, html_content)
     except Exception as e:
         print(f"Error processing image references: {e}")
         return html_content
@@ -1628,82 +2443,149 @@ def show_page_setup_dialog(self, win, file):
     dialog.set_child(content_box)
     dialog.present(win)                 
 
+def print_webview_to_pdf(webview, output_path, page_setup, callback, cancellable=None, progress_callback=None):
+    """
+    Print a WebView's page to a PDF file without a dialog
+    
+    The PDF is written to a temporary file next to output_path and renamed
+    into place once printing has finished, so a failed or cancelled export
+    never leaves a truncated file behind. WebKit cannot abort a print job, so
+    cancelling discards the result when it arrives.
+    
+    callback(error) runs on the main thread when done, with None on success,
+    "cancelled" or an error message. progress_callback(bytes_written), if
+    given, is called periodically while the PDF is being written.
+    Returns the WebKit.PrintOperation.
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=".pdf", dir=directory)
+    os.close(fd)
+    
+    print_settings = Gtk.PrintSettings.new()
+    print_settings.set(Gtk.PRINT_SETTINGS_OUTPUT_FILE_FORMAT, "pdf")
+    print_settings.set(Gtk.PRINT_SETTINGS_OUTPUT_URI, Gio.File.new_for_path(temp_path).get_uri())
+    print_settings.set(Gtk.PRINT_SETTINGS_PRINTER, "Print to File")
+    
+    print_operation = WebKit.PrintOperation.new(webview)
+    print_operation.set_print_settings(print_settings)
+    print_operation.set_page_setup(page_setup)
+    
+    errors = []
+    reported = []
+    
+    def report(error):
+        if reported:
+            return
+        reported.append(True)
+        if progress_source:
+            GLib.source_remove(progress_source[0])
+        callback(error)
+    
+    def poll_progress():
+        try:
+            progress_callback(os.path.getsize(temp_path))
+        except OSError:
+            pass
+        return True
+    
+    progress_source = [GLib.timeout_add(250, poll_progress)] if progress_callback else []
+    
+    if cancellable:
+        GObject.Object.connect(cancellable, "cancelled", lambda c: report("cancelled"))
+    
+    # "failed" is followed by "finished", so report once from "finished"
+    def on_failed(operation, error):
+        errors.append(error.message if hasattr(error, 'message') else str(error))
+    
+    def on_finished(operation):
+        if cancellable and cancellable.is_cancelled():
+            error = "cancelled"
+        elif errors:
+            error = errors[0]
+        elif not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+            error = "No PDF was written"
+        else:
+            error = None
+        
+        if error:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        else:
+            try:
+                os.replace(temp_path, output_path)
+            except OSError as e:
+                error = str(e)
+        report(error)
+    
+    print_operation.connect("failed", on_failed)
+    print_operation.connect("finished", on_finished)
+    try:
+        print_operation.print_()
+    except Exception:
+        if progress_source:
+            GLib.source_remove(progress_source.pop())
+        os.unlink(temp_path)
+        raise
+    return print_operation
+
 def _generate_pdf_with_settings(self, win, file, paper_size_name, orientation, 
                                top_margin, right_margin, bottom_margin, left_margin):
     """Generate PDF with specified page settings"""
+    output_path = file.get_path()
+    
+    # Create page setup with specified settings
+    page_setup = Gtk.PageSetup.new()
+    page_setup.set_paper_size(Gtk.PaperSize.new(paper_size_name))
+    page_setup.set_orientation(orientation)
+    page_setup.set_top_margin(top_margin, Gtk.Unit.POINTS)
+    page_setup.set_right_margin(right_margin, Gtk.Unit.POINTS)
+    page_setup.set_bottom_margin(bottom_margin, Gtk.Unit.POINTS)
+    page_setup.set_left_margin(left_margin, Gtk.Unit.POINTS)
+    
     # Show a loading dialog since PDF conversion can take time
-    loading_dialog = self.show_loading_dialog(win, "Saving document as PDF...")
+    cancellable = Gio.Cancellable()
+    loading_dialog = self.show_loading_dialog(win, "Saving document as PDF...", cancellable)
+    started = time.monotonic()
+    
+    def on_progress(bytes_written):
+        loading_dialog.detail_label.set_text(
+            f"{GLib.format_size(bytes_written)} written ({time.monotonic() - started:.0f}s)")
+        loading_dialog.detail_label.set_visible(True)
+    
+    def on_done(error):
+        if error is None:
+            self._on_pdf_print_finished(win, file, loading_dialog)
+        elif error == "cancelled":
+            _close_loading_dialog(loading_dialog)
+            win.statusbar.set_text("PDF export cancelled")
+        else:
+            self._on_pdf_print_failed(win, error, loading_dialog)
     
-    # Get the file path for the PDF output
-    output_path = file.get_path()
+    def start_printing(webview, result, data):
+        try:
+            print_webview_to_pdf(win.webview, output_path, page_setup, on_done, cancellable, on_progress)
+        except Exception as e:
+            self._on_pdf_print_failed(win, e, loading_dialog)
     
-    try:
-        # Create print settings for PDF output
-        print_settings = Gtk.PrintSettings.new()
-        
-        # Configure settings - using WebKit 6.0 style 
-        print_settings.set(Gtk.PRINT_SETTINGS_OUTPUT_FILE_FORMAT, "pdf")
-        print_settings.set(Gtk.PRINT_SETTINGS_OUTPUT_URI, f"file://{output_path}")
-        print_settings.set(Gtk.PRINT_SETTINGS_PRINTER, "Print to File")
-        
-        # Create page setup with specified settings
-        page_setup = Gtk.PageSetup.new()
-        
-        # Set paper size
-        paper_size = Gtk.PaperSize.new(paper_size_name)
-        page_setup.set_paper_size(paper_size)
-        
-        # Set orientation
-        page_setup.set_orientation(orientation)
-        
-        # Set margins
-        page_setup.set_top_margin(top_margin, Gtk.Unit.POINTS)
-        page_setup.set_right_margin(right_margin, Gtk.Unit.POINTS)
-        page_setup.set_bottom_margin(bottom_margin, Gtk.Unit.POINTS)
-        page_setup.set_left_margin(left_margin, Gtk.Unit.POINTS)
-        
-        # In WebKit 6.0, we can use the PrintOperation more directly
-        print_operation = WebKit.PrintOperation.new(win.webview)
-        print_operation.set_print_settings(print_settings)
-        print_operation.set_page_setup(page_setup)
-        
-        # For headless printing (no dialog), we use the print method directly
-        result = print_operation.print_()
-        
-        # Success handling doesn't need a callback with this approach
-        if loading_dialog:
-            loading_dialog.close()
-            
-        # Update file info - the PDF is now saved
-        win.current_file = file
-        win.modified = False
-        self.update_window_title(win)
-        win.statusbar.set_text(f"PDF saved to: {output_path}")
-        
-        return True
-        
-    except Exception as e:
-        # Handle any errors
-        if loading_dialog:
-            loading_dialog.close()
-        
-        print(f"Error saving PDF: {e}")
-        win.statusbar.set_text(f"Error saving PDF: {e}")
-        self.show_error_dialog(f"Failed to save PDF: {e}")
-        return False
+    # Put back off-screen images so they are printed
+    win.webview.evaluate_javascript(RESTORE_LAZY_IMAGES_JS, -1, None, None, None, start_printing, None)
+    win.statusbar.set_text(f"Saving PDF: {output_path}")
+    return True
 
 def _on_pdf_print_finished(self, win, file, loading_dialog):
     """Handle successful PDF print operation"""
     try:
         # Close loading dialog
-        if loading_dialog:
-            loading_dialog.close()
+        _close_loading_dialog(loading_dialog)
         
         # Update file info and UI
         win.current_file = file
         win.modified = False
         self.update_window_title(win)
-        win.statusbar.set_text(f"PDF saved successfully: {file.get_path()}")
+        size = os.path.getsize(file.get_path())
+        win.statusbar.set_text(f"PDF saved: {file.get_path()} ({GLib.format_size(size)})")
         
     except Exception as e:
         print(f"Error handling PDF print completion: {e}")
@@ -1713,14 +2595,13 @@ def _on_pdf_print_failed(self, win, error, loading_dialog):
     """Handle failed PDF print operation"""
     try:
         # Close loading dialog
-        if loading_dialog:
-            loading_dialog.close()
+        _close_loading_dialog(loading_dialog)
         
         # Show error message
         error_message = error.message if hasattr(error, 'message') else str(error)
         print(f"PDF print failed: {error_message}")
         win.statusbar.set_text(f"Error saving PDF: {error_message}")
-        self.show_error_dialog(f"Failed to save PDF: {error_message}")
+        self.show_error_dialog(win, f"Failed to save PDF: {error_message}")
         
     except Exception as e:
         print(f"Error handling PDF print failure: {e}")
@@ -1760,9 +2641,7 @@ def show_format_selection_dialog(self, win):
         {"id": "txt", "name": "Plain Text (.txt)", "description": "Simple text without formatting"},
     ]
     
-    # Add markdown if available
-    if HTML2TEXT_AVAILABLE:
-        formats.append({"id": "md", "name": "Markdown (.md)", "description": "Markup language with simple syntax"})
+    formats.append({"id": "md", "name": "Markdown (.md)", "description": "Markup language with simple syntax"})
     
     for fmt in formats:
         # Create box for each option with name and description
@@ -1849,7 +2728,7 @@ def _on_format_selection_response(self, win, dialog):
     elif selected_format == "txt":
         # For TXT format
         self.show_text_save_dialog(win)
-    elif selected_format == "md" and HTML2TEXT_AVAILABLE:
+    elif selected_format == "md":
         # For Markdown format
         self.show_markdown_save_dialog(win)
     else:
@@ -1965,8 +2844,8 @@ def _open_system_save_dialog(self, win, initial_name, selected_format):
         pdf_filter.add_pattern("*.pdf")
         filters.append(pdf_filter)
     
-    # Add markdown if available and not already selected
-    if HTML2TEXT_AVAILABLE and selected_format['extension'] != '.md':
+    # Add markdown if not already selected
+    if selected_format['extension'] != '.md':
         md_filter = Gtk.FileFilter()
         md_filter.set_name("Markdown Document (*.md)")
         md_filter.add_pattern("*.md")
@@ -2015,8 +2894,14 @@ def _handle_system_save_dialog_response(self, dialog, result, win):
             # Save based on file extension
             file_ext = os.path.splitext(file_path)[1].lower()
             
-            if file_ext in ['.mht', '.mhtml']:
+            if file_ext == '.wwd':
+                self.save_as_wwd(win, file)
+            elif file_ext in ['.mht', '.mhtml']:
                 self.save_as_mhtml(win, file)
+            elif file_ext == '.odt':
+                self.save_as_odt(win, file)
+            elif file_ext == '.docx':
+                self.save_as_docx(win, file)
             elif file_ext in ['.html', '.htm']:
                 self.save_as_html(win, file)
             elif file_ext in ['.md', '.markdown']:
@@ -1079,18 +1079,8 @@ def on_font_size_changed(self, win, dropdown):
             
             // If text is selected
             if (!range.collapsed) {{
-                // Use execCommand to apply the font size
-                document.execCommand('fontSize', false, '7');
-                
-                // Find all font elements with size=7 and set the correct size
-                const fontElements = editor.querySelectorAll('font[size="7"]');
-                for (const font of fontElements) {{
-                    font.removeAttribute('size');
-                    font.style.fontSize = '{size_pt}pt';
-                }}
-                
-                // Clean up redundant nested font tags
-                cleanupEditorTags();
+                // Size the selection and clean up the blocks around it
+                applyFontSize('{size_pt}pt');
                 
                 // Record undo state
                 saveState();
@@ -1126,23 +1116,13 @@ def on_font_size_changed(self, win, dropdown):
                                 range.setStart(range.startContainer, range.startOffset - 1);
                                 
                                 // Apply font size
-                                document.execCommand('fontSize', false, '7');
-                                
-                                // Update the font elements
-                                const fontElements = editor.querySelectorAll('font[size="7"]');
-                                for (const font of fontElements) {{
-                                    font.removeAttribute('size');
-                                    font.style.fontSize = fontSize;
-                                }}
+                                applyFontSize(fontSize);
                                 
                                 // Restore cursor position
                                 range.collapse(false);
                                 sel.removeAllRanges();
                                 sel.addRange(range);
                                 
-                                // Clean up tags
-                                cleanupEditorTags();
-                                
                                 // Record state
                                 saveState();
                                 window.lastContent = editor.innerHTML;
@@ -1163,60 +1143,6 @@ def on_font_size_changed(self, win, dropdown):
             }}
         }}
         
-        // Combined function to clean up tags
-        function cleanupEditorTags() {{
-            // Clean up redundant nested font tags
-            function cleanupNestedFontTags() {{
-                const fontTags = editor.querySelectorAll('font');
-                
-                // Process each font tag
-                for (let i = 0; i < fontTags.length; i++) {{
-                    const font = fontTags[i];
-                    
-                    // Check if this font tag has nested font tags
-                    const nestedFonts = font.querySelectorAll('font');
-                    
-                    for (let j = 0; j < nestedFonts.length; j++) {{
-                        const nestedFont = nestedFonts[j];
-                        
-                        // If nested font has no attributes, replace it with its contents
-                        if (!nestedFont.hasAttribute('style') && 
-                            !nestedFont.hasAttribute('face') && 
-                            !nestedFont.hasAttribute('color') &&
-                            !nestedFont.hasAttribute('size')) {{
-                            
-                            const fragment = document.createDocumentFragment();
-                            while (nestedFont.firstChild) {{
-                                fragment.appendChild(nestedFont.firstChild);
-                            }}
-                            
-                            nestedFont.parentNode.replaceChild(fragment, nestedFont);
-                        }}
-                    }}
-                }}
-            }}
-            
-            // Clean up empty tags
-            function cleanupEmptyTags() {{
-                // Find all font and span elements
-                const elements = [...editor.querySelectorAll('font'), ...editor.querySelectorAll('span')];
-                
-                // Process in reverse to handle nested elements
-                for (let i = elements.length - 1; i >= 0; i--) {{
-                    const el = elements[i];
-                    if (el.textContent.trim() === '') {{
-                        el.parentNode.removeChild(el);
-                    }}
-                }}
-            }}
-            
-            // Run the cleanup functions multiple times to handle nested cases
-            for (let i = 0; i < 2; i++) {{
-                cleanupNestedFontTags();
-                cleanupEmptyTags();
-            }}
-        }}
-        
         return true;
     }})();
     """
@@ -1224,74 +1150,115 @@ def on_font_size_changed(self, win, dropdown):
     # Execute the JavaScript code
     self.execute_js(win, js_code)
     
-    # Run another cleanup after a short delay to catch any remaining issues
-    GLib.timeout_add(100, lambda: self.cleanup_editor_tags(win))
-    
     win.statusbar.set_text(f"Applied font size: {size_pt}pt")
     win.webview.grab_focus()
 
 def cleanup_editor_tags(self, win):
-    """Clean up both empty tags and redundant nested font tags in the editor content"""
-    js_code = """
-    (function() {
-        // Get the editor
+    """Clean up empty tags and redundant nested font tags around the selection"""
+    self.execute_js(win, "cleanupEditorTags();")
+
+def formatting_cleanup_js(self):
+    """JavaScript that applies font sizes and tidies tags in the blocks of a range"""
+    return """
+    // Elements whose content is cleaned up together; inline formatting never
+    // needs to look further than the nearest of these around the selection
+    const FORMATTING_BLOCKS = 'p, div, li, h1, h2, h3, h4, h5, h6, pre, blockquote, td, th';
+
+    // The nearest block around node, or its top-level node if there is none
+    function formattingBlockOf(node, editor) {
+        let top = node;
+        let element = node.nodeType === Node.ELEMENT_NODE ? node : node.parentNode;
+        while (element && element !== editor) {
+            if (element.matches(FORMATTING_BLOCKS)) return element;
+            top = element;
+            element = element.parentNode;
+        }
+        return element === editor ? top : null;
+    }
+
+    // The blocks a range touches: its nearest common block, or the top-level
+    // nodes from its start to its end when it spans several of them
+    function formattingScope(range) {
         const editor = document.getElementById('editor');
-        
-        // Clean up redundant nested font tags
-        function cleanupNestedFontTags() {
-            const fontTags = editor.querySelectorAll('font');
-            
-            // Process each font tag
-            for (let i = 0; i < fontTags.length; i++) {
-                const font = fontTags[i];
-                
-                // Check if this font tag has nested font tags
-                const nestedFonts = font.querySelectorAll('font');
-                
-                for (let j = 0; j < nestedFonts.length; j++) {
-                    const nestedFont = nestedFonts[j];
-                    
-                    // If nested font has no attributes, replace it with its contents
-                    if (!nestedFont.hasAttribute('style') && 
-                        !nestedFont.hasAttribute('face') && 
-                        !nestedFont.hasAttribute('color') &&
-                        !nestedFont.hasAttribute('size')) {
-                        
-                        const fragment = document.createDocumentFragment();
-                        while (nestedFont.firstChild) {
-                            fragment.appendChild(nestedFont.firstChild);
-                        }
-                        
-                        nestedFont.parentNode.replaceChild(fragment, nestedFont);
-                    }
-                }
-            }
+        if (range.commonAncestorContainer !== editor) {
+            const block = formattingBlockOf(range.commonAncestorContainer, editor);
+            return block ? [block] : [];
         }
-        
-        // Clean up empty tags
-        function cleanupEmptyTags() {
-            // Find all font and span elements
-            const elements = [...editor.querySelectorAll('font'), ...editor.querySelectorAll('span')];
-            
-            // Process in reverse to handle nested elements
-            for (let i = elements.length - 1; i >= 0; i--) {
-                const el = elements[i];
-                if (el.textContent.trim() === '') {
-                    el.parentNode.removeChild(el);
-                }
-            }
+        function topLevel(node) {
+            while (node && node.parentNode !== editor) node = node.parentNode;
+            return node;
         }
-        
-        // Run the cleanup functions multiple times to handle nested cases
-        for (let i = 0; i < 3; i++) {
-            cleanupNestedFontTags();
-            cleanupEmptyTags();
+        let node = range.startContainer === editor ?
+            editor.childNodes[range.startOffset] : topLevel(range.startContainer);
+        const last = range.endContainer === editor ?
+            editor.childNodes[range.endOffset - 1] : topLevel(range.endContainer);
+        const roots = [];
+        if (!node || !last) return roots;
+        for (; node; node = node.nextSibling) {
+            roots.push(node);
+            if (node === last) break;
         }
-        
-        return true;
-    })();
+        return roots;
+    }
+
+    // Elements matching selector in root, including root itself
+    function formattingElementsIn(root, selector) {
+        if (root.nodeType !== Node.ELEMENT_NODE || !root.isConnected) return [];
+        const found = Array.from(root.querySelectorAll(selector));
+        if (root.matches(selector)) found.unshift(root);
+        return found;
+    }
+
+    // Unwrap attribute-less fonts nested in another font and remove empty
+    // fonts and spans within roots, by default the blocks of the selection.
+    // Empty elements are visited innermost first, so one pass is enough
+    function cleanupEditorTags(roots) {
+        if (!roots) {
+            const selection = window.getSelection();
+            if (selection.rangeCount === 0) return;
+            roots = formattingScope(selection.getRangeAt(0));
+        }
+        roots.forEach(function(root) {
+            formattingElementsIn(root, 'font').forEach(function(font) {
+                if (font.hasAttribute('style') || font.hasAttribute('face') ||
+                    font.hasAttribute('color') || font.hasAttribute('size')) return;
+                if (!font.parentElement || !font.parentElement.closest('font')) return;
+                const fragment = document.createDocumentFragment();
+                while (font.firstChild) fragment.appendChild(font.firstChild);
+                font.parentNode.replaceChild(fragment, font);
+            });
+            formattingElementsIn(root, 'font, span').reverse().forEach(function(element) {
+                if (element.parentNode && element.textContent.trim() === '') {
+                    element.parentNode.removeChild(element);
+                }
+            });
+        });
+    }
+
+    // Set the font size of the selection, e.g. '12pt', and tidy the blocks
+    // around it. Returns the font elements that were given the size
+    function applyFontSize(size) {
+        const selection = window.getSelection();
+        if (selection.rangeCount === 0) return [];
+        // Blocks are taken before and after the command, in case it moved
+        // the selection
+        let roots = formattingScope(selection.getRangeAt(0));
+        document.execCommand('fontSize', false, '7');
+        if (selection.rangeCount > 0) roots = roots.concat(formattingScope(selection.getRangeAt(0)));
+        roots = Array.from(new Set(roots));
+
+        const fonts = [];
+        roots.forEach(function(root) {
+            formattingElementsIn(root, 'font[size="7"]').forEach(function(font) {
+                font.removeAttribute('size');
+                font.style.fontSize = size;
+                fonts.push(font);
+            });
+        });
+        cleanupEditorTags(roots);
+        return fonts.filter(function(font) { return font.isConnected; });
+    }
     """
-    self.execute_js(win, js_code)
     
 def create_color_button(self, color_hex):
     """Create a button with a color swatch"""
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# image_operations.py - display-size downsampling for inserted images
+import os
+import re
+import json
+import base64
+import shutil
+import hashlib
+import mimetypes
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GLib, GdkPixbuf
+
+# Raster formats that are resampled on insert; GIF (animation) and
+# SVG (vector) are always embedded as-is
+DOWNSAMPLE_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/bmp', 'image/tiff')
+JPEG_QUALITY = "85"
+
+# Ids handed to the editor are "<sha256><ext>", never a path
+ORIGINAL_ID_PATTERN = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,5})?$')
+
+
+def get_image_originals_dir():
+    """Directory holding full-resolution copies of downsampled images"""
+    path = os.path.join(GLib.get_user_cache_dir(), 'webkitword', 'originals')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def store_original_image(image_path):
+    """Copy an image into the originals store and return its id"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    ext = os.path.splitext(image_path)[1].lower()
+    original_id = digest.hexdigest() + ext
+    stored_path = os.path.join(get_image_originals_dir(), original_id)
+    if not os.path.exists(stored_path):
+        shutil.copyfile(image_path, stored_path)
+    return original_id
+
+
+def get_original_image_path(original_id):
+    """Return the stored original for an id, or None if it is unknown"""
+    if not original_id or not ORIGINAL_ID_PATTERN.match(original_id):
+        return None
+    stored_path = os.path.join(get_image_originals_dir(), original_id)
+    return stored_path if os.path.exists(stored_path) else None
+
+
+def downsample_image(image_path, target_width):
+    """
+    Resample an image to target_width pixels and recompress it
+
+    Returns:
+        Tuple of (mime type, encoded bytes), or None if the original should be kept
+        (unsupported format, already small enough, or recompression did not help)
+    """
+    mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+    if mime_type not in DOWNSAMPLE_MIME_TYPES or target_width <= 0:
+        return None
+
+    file_format, width, height = GdkPixbuf.Pixbuf.get_file_info(image_path)
+    if file_format is None or width <= target_width:
+        return None
+
+    # Decode straight at the target size instead of loading the full bitmap first
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(image_path, target_width, -1, True)
+    pixbuf = pixbuf.apply_embedded_orientation() or pixbuf
+
+    if pixbuf.get_has_alpha():
+        success, data = pixbuf.save_to_bufferv("png", [], [])
+        new_mime = "image/png"
+    else:
+        success, data = pixbuf.save_to_bufferv("jpeg", ["quality"], [JPEG_QUALITY])
+        new_mime = "image/jpeg"
+
+    if not success or len(data) >= os.path.getsize(image_path):
+        return None
+    return new_mime, bytes(data)
+
+
+def _image_data_url(image_path, target_width):
+    """Build a data URL for image_path, downsampled to target_width when worthwhile"""
+    resampled = None
+    try:
+        resampled = downsample_image(image_path, target_width)
+    except GLib.Error as e:
+        print(f"Could not downsample {image_path}: {e.message}")
+
+    if resampled:
+        mime_type, data = resampled
+    else:
+        mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        with open(image_path, "rb") as image_file:
+            data = image_file.read()
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}", resampled is not None
+
+
+def get_image_target_width(self, win, width):
+    """Pixel width an image needs to look sharp at the given CSS width"""
+    try:
+        scale = max(1, win.get_scale_factor())
+    except Exception:
+        scale = 1
+    return int(width) * scale
+
+
+def prepare_image_for_insert(self, win, image_path, width, callback):
+    """
+    Encode an image for insertion in a worker thread
+
+    The image is resampled to the display width when win.downsample_images is
+    set, and the original is kept in the originals store so it can be restored
+    at a larger size later. callback(img_src, original_id) runs on the main
+    thread; original_id is None when the full image was embedded.
+    """
+    target_width = self.get_image_target_width(win, width)
+    downsample = getattr(win, 'downsample_images', False)
+
+    def worker():
+        original_id = None
+        try:
+            if downsample:
+                img_src, resampled = _image_data_url(image_path, target_width)
+                if resampled:
+                    original_id = store_original_image(image_path)
+            else:
+                img_src, _ = _image_data_url(image_path, 0)
+        except Exception as e:
+            message = str(e)
+            print(f"Error preparing image {image_path}: {message}")
+            GLib.idle_add(lambda: win.statusbar.set_text(f"Error inserting image: {message}") and False)
+            return
+        GLib.idle_add(lambda: callback(img_src, original_id) and False)
+
+    win.statusbar.set_text("Preparing image...")
+    GLib.Thread.new(None, worker)
+
+
+def on_image_resample_requested(self, win, manager, result):
+    """Re-encode an enlarged image from its stored original"""
+    try:
+        if hasattr(result, 'get_js_value'):
+            message = result.get_js_value().to_string()
+        else:
+            message = result.to_string()
+        request = json.loads(message)
+        original_id = request.get('id')
+        target_width = int(request.get('width', 0))
+    except Exception as e:
+        print(f"Invalid image resample request: {e}")
+        return
+
+    original_path = get_original_image_path(original_id)
+    if not original_path or target_width <= 0:
+        return
+
+    def worker():
+        try:
+            img_src, _ = _image_data_url(original_path, target_width)
+        except Exception as e:
+            print(f"Error resampling image {original_id}: {e}")
+            return
+        js_code = f"replaceImageSource('{original_id}', '{img_src}', {target_width});"
+        GLib.idle_add(lambda: self.execute_js(win, js_code) and False)
+
+    GLib.Thread.new(None, worker)
+
+
+def image_resample_js(self):
+    """JavaScript to request a sharper copy when a downsampled image is enlarged"""
+    return """
+    function replaceImageSource(originalId, src, renderedWidth) {
+        const images = document.querySelectorAll('img[data-original-id="' + originalId + '"]');
+        images.forEach(function(img) {
+            img.src = src;
+            img.setAttribute('data-rendered-width', renderedWidth);
+        });
+        if (images.length) {
+            try {
+                window.webkit.messageHandlers.contentChanged.postMessage('changed');
+            } catch(e) {
+                console.log("Could not notify about content change:", e);
+            }
+        }
+    }
+
+    function checkImageResolution(table) {
+        if (!table || !table.classList.contains('image-table')) return;
+        const img = table.querySelector('img[data-original-id]');
+        if (!img) return;
+        const needed = Math.round(img.clientWidth * (window.devicePixelRatio || 1));
+        const rendered = parseInt(img.getAttribute('data-rendered-width') || '0');
+        // Leave some slack so small nudges do not trigger a re-encode
+        if (needed > rendered * 1.1) {
+            try {
+                window.webkit.messageHandlers.imageResample.postMessage(JSON.stringify({
+                    id: img.getAttribute('data-original-id'),
+                    width: needed
+                }));
+            } catch(e) {
+                console.log("Could not request image resample:", e);
+            }
+        }
+    }
+
+    document.addEventListener('mouseup', function() {
+        if (typeof activeTable !== 'undefined' && activeTable) {
+            checkImageResolution(activeTable);
+        }
+    });
+    """
+
+
+def lazy_images_js(self):
+    """JavaScript for asynchronous image decoding and off-screen placeholders"""
+    return """
+    // Images further than this from the viewport are swapped for a placeholder,
+    // and restored once they come back within the (smaller) restore margin
+    const LAZY_UNLOAD_MARGIN = '4000px 0px';
+    const LAZY_RESTORE_MARGIN = '1500px 0px';
+    const LAZY_MIN_SRC_LENGTH = 4096;
+
+    window.lazyImageSources = new Map();  // placeholder img -> real src
+
+    function lazyPlaceholderFor(img) {
+        const width = Math.max(1, img.naturalWidth || img.clientWidth || 1);
+        const height = Math.max(1, img.naturalHeight || img.clientHeight || 1);
+        return 'data:image/svg+xml,' + encodeURIComponent(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="' + width + '" height="' + height + '"/>');
+    }
+
+    function unloadLazyImage(img) {
+        if (window.lazyImageSources.has(img) || !img.complete || !img.naturalWidth) return;
+        const src = img.getAttribute('src') || '';
+        if (src.startsWith('data:') && src.length < LAZY_MIN_SRC_LENGTH) return;
+        window.lazyImageSources.set(img, src);
+        img.setAttribute('data-lazy-placeholder', '');
+        img.setAttribute('src', lazyPlaceholderFor(img));
+    }
+
+    function restoreLazyImage(img) {
+        const src = window.lazyImageSources.get(img);
+        if (src === undefined) return;
+        window.lazyImageSources.delete(img);
+        img.removeAttribute('data-lazy-placeholder');
+        img.setAttribute('src', src);
+    }
+
+    function restoreAllLazyImages() {
+        Array.from(window.lazyImageSources.keys()).forEach(restoreLazyImage);
+    }
+
+    function setupLazyImages(editor) {
+        const unloadObserver = new IntersectionObserver(function(entries) {
+            entries.forEach(function(entry) {
+                if (!entry.isIntersecting) unloadLazyImage(entry.target);
+            });
+        }, { rootMargin: LAZY_UNLOAD_MARGIN });
+
+        const restoreObserver = new IntersectionObserver(function(entries) {
+            entries.forEach(function(entry) {
+                if (entry.isIntersecting) restoreLazyImage(entry.target);
+            });
+        }, { rootMargin: LAZY_RESTORE_MARGIN });
+
+        function trackImage(img) {
+            if (img.getAttribute('decoding') !== 'async') img.setAttribute('decoding', 'async');
+            if (img.getAttribute('loading') !== 'lazy') img.setAttribute('loading', 'lazy');
+            unloadObserver.observe(img);
+            restoreObserver.observe(img);
+        }
+
+        function untrackImage(img) {
+            unloadObserver.unobserve(img);
+            restoreObserver.unobserve(img);
+            window.lazyImageSources.delete(img);
+        }
+
+        function forEachImage(node, callback) {
+            if (node.nodeType !== 1) return;
+            if (node.tagName === 'IMG') {
+                callback(node);
+            } else {
+                node.querySelectorAll('img').forEach(callback);
+            }
+        }
+
+        // Only the added and removed subtrees are visited, never the whole document
+        new MutationObserver(function(mutations) {
+            mutations.forEach(function(mutation) {
+                mutation.removedNodes.forEach(function(node) { forEachImage(node, untrackImage); });
+                mutation.addedNodes.forEach(function(node) {
+                    if (node.isConnected) forEachImage(node, trackImage);
+                });
+            });
+        }).observe(editor, { childList: true, subtree: true });
+
+        editor.querySelectorAll('img').forEach(trackImage);
+
+        // Serialization always sees the real sources, so saving, autosave and
+        // undo snapshots are unaffected by placeholders
+        const nativeInnerHTML = Object.getOwnPropertyDescriptor(Element.prototype, 'innerHTML');
+        Object.defineProperty(editor, 'innerHTML', {
+            configurable: true,
+            get: function() {
+                if (window.lazyImageSources.size === 0) {
+                    return nativeInnerHTML.get.call(this);
+                }
+                const clone = this.cloneNode(true);
+                const live = this.querySelectorAll('img[data-lazy-placeholder]');
+                const copies = clone.querySelectorAll('img[data-lazy-placeholder]');
+                copies.forEach(function(copy, index) {
+                    const src = window.lazyImageSources.get(live[index]);
+                    if (src !== undefined) copy.setAttribute('src', src);
+                    copy.removeAttribute('data-lazy-placeholder');
+                });
+                return nativeInnerHTML.get.call(clone);
+            },
+            set: function(html) {
+                window.lazyImageSources.clear();
+                nativeInnerHTML.set.call(this, html);
+            }
+        });
+    }
+    """
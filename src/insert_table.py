@@ -1012,6 +1012,7 @@ def table_event_handlers_js(self):
         if (window.undoStack.length > 100) {
             window.undoStack.shift();
         }
+        if (typeof normalizerSaved === 'function') normalizerSaved();
     }
     
     // Function to handle dark mode changes
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# markdown_export.py - streaming HTML to Markdown conversion of editor content
+#
+# MarkdownConverter is an html.parser.HTMLParser that understands the markup
+# the editor produces: <div>/<p> paragraphs, headings, lists, blockquotes,
+# <pre> code blocks, editor tables (GitHub-style pipe tables), image tables
+# (image plus caption) and text boxes, and the <font>/<span style> runs left by
+# execCommand. Each block is written out as soon as it is complete, and input
+# can be fed in chunks, so memory use is bounded by the largest block or table
+# rather than by the document. write_markdown streams it into a file as the
+# save and export paths need; html_to_markdown returns it as one string.
+import io
+import re
+from html.parser import HTMLParser
+
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'header', 'footer', 'nav', 'aside', 'main',
+    'figure', 'figcaption', 'center', 'address', 'dl', 'dt', 'dd', 'caption',
+}
+HEADING_TAGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+VOID_TAGS = {
+    'br', 'img', 'hr', 'input', 'meta', 'link', 'col', 'area', 'base', 'embed',
+    'source', 'track', 'wbr', 'param',
+}
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'template', 'noscript', 'button', 'select', 'textarea'}
+# Editor chrome that ends up inside the content
+SKIP_CLASSES = {'table-handle', 'table-drag-handle'}
+# Tables that are layout rather than data: their cells are written as blocks
+LAYOUT_TABLE_CLASSES = {'image-table', 'text-box-table'}
+
+INLINE_ESCAPE = re.compile(r'([\\`*_\[\]<>])')
+LINE_START_ESCAPE = re.compile(r'^(\s*)(#{1,6}(?=\s|$)|[-+*](?=\s)|>|=+\s*$|-{3,}\s*$)')
+ORDERED_START_ESCAPE = re.compile(r'^(\s*\d+)([.)])(?=\s|$)')
+WHITESPACE = re.compile(r'[ \t\n\r\f\v]+')
+LANGUAGE_CLASS = re.compile(r'(?:^|\s)(?:language|lang)-([\w+#.-]+)')
+
+
+def _style_markers(style):
+    """Markdown markers for the inline CSS the editor writes on spans"""
+    declarations = {}
+    for declaration in style.split(';'):
+        name, _, value = declaration.partition(':')
+        declarations[name.strip().lower()] = value.strip().lower()
+
+    markers = []
+    weight = declarations.get('font-weight', '')
+    if weight in ('bold', 'bolder') or (weight.isdigit() and int(weight) >= 600):
+        markers.append('**')
+    if declarations.get('font-style') in ('italic', 'oblique'):
+        markers.append('*')
+    decoration = declarations.get('text-decoration', '') + ' ' + declarations.get('text-decoration-line', '')
+    if 'line-through' in decoration:
+        markers.append('~~')
+    if 'underline' in decoration:
+        markers.append('<u>')
+    vertical_align = declarations.get('vertical-align')
+    if vertical_align == 'sub':
+        markers.append('<sub>')
+    elif vertical_align == 'super':
+        markers.append('<sup>')
+    return markers
+
+
+TAG_MARKERS = {
+    'b': '**', 'strong': '**',
+    'i': '*', 'em': '*', 'cite': '*', 'var': '*',
+    's': '~~', 'strike': '~~', 'del': '~~',
+    'u': '<u>', 'ins': '<u>',
+    'sub': '<sub>', 'sup': '<sup>',
+}
+
+
+def _closing(marker):
+    return '</' + marker[1:] if marker.startswith('<') else marker
+
+
+class MarkdownConverter(HTMLParser):
+    """
+    Convert editor HTML to Markdown, passing each finished block to write()
+
+    Call feed() with as many chunks as needed and close() at the end.
+    """
+
+    def __init__(self, write):
+        super().__init__(convert_charrefs=True)
+        self._write = write
+        self._stack = []          # open elements: (tag, closing action)
+        self._skip_depth = 0
+        self._parts = []          # inline Markdown of the current block
+        self._active = {}         # markers already open, to avoid doubled emphasis
+        self._quote_depth = 0
+        self._lists = []          # [ordered, next number]
+        self._pending_item = None
+        self._pre = None          # raw text of the open <pre>
+        self._pre_language = ''
+        self._code = None         # raw text of the open inline <code>
+        self._table = None        # rows of the open data table
+        self._nested_tables = 0
+        self._last_kind = None
+        self._last_quote_depth = 0
+
+    # Output
+
+    def _emit(self, text, kind):
+        if self._last_kind is None:
+            separator = ''
+        elif kind == 'li' and self._last_kind == 'li':
+            separator = '\n'
+        elif self._quote_depth and self._quote_depth == self._last_quote_depth:
+            # Keep consecutive paragraphs inside one blockquote
+            separator = '\n' + ('> ' * self._quote_depth).rstrip() + '\n'
+        else:
+            separator = '\n\n'
+        self._write(separator + text)
+        self._last_kind = kind
+        self._last_quote_depth = self._quote_depth
+
+    def _prefix_lines(self, lines, kind='p'):
+        """Apply blockquote and list prefixes to the lines of a block"""
+        quote = '> ' * self._quote_depth
+        indent = '   ' * max(0, len(self._lists) - 1)
+        if self._pending_item is not None:
+            first = indent + self._pending_item
+            rest = indent + ' ' * len(self._pending_item)
+            self._pending_item = None
+            kind = 'li'
+        elif self._lists:
+            first = rest = indent + '   '
+            kind = 'li' if kind == 'p' else kind
+        else:
+            first = rest = ''
+        result = [(quote + first + lines[0]).rstrip()]
+        result.extend((quote + rest + line).rstrip() if line else quote.rstrip() for line in lines[1:])
+        return '\n'.join(result), kind
+
+    def _flush_block(self, heading=0):
+        """End the current block, writing it unless it is empty"""
+        if self._table is not None:
+            # Inside a data table cell blocks become line breaks
+            if self._parts and self._parts[-1] != '<br>':
+                self._parts.append('<br>')
+            return
+
+        text = ''.join(self._parts).strip()
+        self._parts = []
+        if not text:
+            return
+        lines = [line.strip() for line in text.split('\n')]
+        if heading:
+            lines = ['#' * heading + ' ' + ' '.join(lines)]
+        else:
+            lines = [ORDERED_START_ESCAPE.sub(r'\1\\\2', LINE_START_ESCAPE.sub(r'\1\\\2', line))
+                     for line in lines]
+            # Lines within a block come from <br>; a plain newline would only
+            # be a soft break, so end them with a backslash hard break
+            lines = [line + '\\' for line in lines[:-1]] + lines[-1:]
+        block, kind = self._prefix_lines(lines)
+        self._emit(block, 'h' if heading else kind)
+
+    # Inline content
+
+    def _append_text(self, text):
+        if self._table is not None:
+            text = text.replace('|', '\\|')
+        if text.startswith(' '):
+            previous = self._parts[-1] if self._parts else ''
+            if not previous or previous.endswith((' ', '\n')) or previous == '<br>':
+                text = text.lstrip(' ')
+            elif self._stack and self._stack[-1][1] and self._stack[-1][1][0] == 'markers' \
+                    and self._stack[-1][1][2] == len(self._parts):
+                # Keep the space outside a marker that was just opened
+                self._parts.insert(len(self._parts) - len(self._stack[-1][1][1]), ' ')
+                text = text.lstrip(' ')
+        if text:
+            self._parts.append(text)
+
+    def _open_markers(self, markers):
+        opened = []
+        for marker in markers:
+            if self._active.get(marker):
+                continue
+            self._active[marker] = 1
+            self._parts.append(marker)
+            opened.append(marker)
+        return ('markers', opened, len(self._parts))
+
+    def _close_markers(self, opened, open_end):
+        for marker in opened:
+            self._active[marker] = 0
+        if not opened:
+            return
+        if len(self._parts) == open_end:
+            # Nothing inside: drop the markers again
+            del self._parts[len(self._parts) - len(opened):]
+            return
+        trailing = ''
+        if self._parts and self._parts[-1].endswith(' '):
+            self._parts[-1] = self._parts[-1].rstrip(' ')
+            trailing = ' '
+        for marker in reversed(opened):
+            self._parts.append(_closing(marker))
+        if trailing:
+            self._parts.append(trailing)
+
+    # Parser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._skip_depth += 1
+            return
+        classes = set((attrs.get('class') or '').split())
+        if tag in SKIP_TAGS or classes & SKIP_CLASSES:
+            if tag not in VOID_TAGS:
+                self._skip_depth = 1
+            return
+
+        if self._pre is not None:
+            if tag == 'br':
+                self._pre.append('\n')
+            elif tag == 'code' and not self._pre_language:
+                self._pre_language = self._language(attrs)
+            if tag not in VOID_TAGS:
+                self._stack.append((tag, None))
+            return
+
+        action = None
+        if tag == 'br':
+            if self._table is not None:
+                self._parts.append('<br>')
+            elif self._parts:
+                self._parts.append('\n')
+        elif tag == 'img':
+            self._image(attrs)
+        elif tag == 'hr':
+            self._flush_block()
+            if self._table is None:
+                block, kind = self._prefix_lines(['---'])
+                self._emit(block, kind)
+        elif tag in HEADING_TAGS:
+            self._flush_block()
+            action = ('heading', HEADING_TAGS[tag])
+        elif tag in BLOCK_TAGS:
+            self._flush_block()
+            action = ('block',)
+        elif tag in ('ul', 'ol'):
+            self._flush_block()
+            start = attrs.get('start', '1')
+            self._lists.append([tag == 'ol', int(start) if start.isdigit() else 1])
+            action = ('list',)
+        elif tag == 'li':
+            self._flush_block()
+            if self._lists:
+                ordered, number = self._lists[-1]
+                self._pending_item = f"{number}. " if ordered else "- "
+                self._lists[-1][1] += 1
+            action = ('block',)
+        elif tag == 'blockquote':
+            self._flush_block()
+            self._quote_depth += 1
+            action = ('quote',)
+        elif tag == 'pre':
+            self._flush_block()
+            self._pre = []
+            self._pre_language = self._language(attrs)
+            action = ('pre',)
+        elif tag == 'code':
+            self._code = []
+            action = ('code',)
+        elif tag == 'a':
+            href = attrs.get('href')
+            if href and not href.startswith('javascript:'):
+                self._parts.append('[')
+                action = ('link', href, len(self._parts))
+        elif tag == 'table':
+            action = self._start_table(classes)
+        elif tag in ('tr', 'td', 'th'):
+            action = self._table_part(tag)
+        elif tag in TAG_MARKERS:
+            action = self._open_markers([TAG_MARKERS[tag]])
+        elif tag in ('span', 'font'):
+            # <font> face/size/color have no Markdown form; only the text is kept
+            action = self._open_markers(_style_markers(attrs.get('style') or ''))
+
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, action))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        # Close everything up to the matching element, like a browser would
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            open_tag, action = self._stack.pop()
+            self._end_element(open_tag, action)
+
+    def _end_element(self, tag, action):
+        if action is None:
+            return
+        kind = action[0]
+        if kind == 'heading':
+            if self._table is None:
+                self._flush_block(heading=action[1])
+            else:
+                self._flush_block()
+        elif kind == 'block':
+            self._flush_block()
+            if tag == 'li':
+                self._pending_item = None
+        elif kind == 'list':
+            self._flush_block()
+            self._lists.pop()
+        elif kind == 'quote':
+            self._flush_block()
+            self._quote_depth -= 1
+        elif kind == 'pre':
+            self._end_pre()
+        elif kind == 'code':
+            self._end_code()
+        elif kind == 'link':
+            _, href, open_end = action
+            if len(self._parts) == open_end:
+                self._parts.pop()
+            else:
+                self._parts.append(f"]({href.replace(' ', '%20').replace(')', '%29')})")
+        elif kind == 'markers':
+            self._close_markers(action[1], action[2])
+        elif kind == 'table':
+            self._end_table()
+        elif kind == 'nested-table':
+            self._nested_tables -= 1
+        elif kind in ('layout-table', 'layout-cell'):
+            self._flush_block()
+        elif kind == 'row':
+            pass
+        elif kind == 'cell':
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._pre is not None:
+            self._pre.append(data)
+            return
+        if self._code is not None:
+            self._code.append(data)
+            return
+        text = WHITESPACE.sub(' ', data)
+        if text.strip():
+            text = INLINE_ESCAPE.sub(r'\\\1', text)
+        self._append_text(text)
+
+    def close(self):
+        super().close()
+        while self._stack:
+            tag, action = self._stack.pop()
+            self._end_element(tag, action)
+        self._flush_block()
+        if self._last_kind is not None:
+            self._write('\n')
+
+    # Elements with their own handling
+
+    @staticmethod
+    def _language(attrs):
+        match = LANGUAGE_CLASS.search(attrs.get('class') or '')
+        return match.group(1) if match else ''
+
+    def _image(self, attrs):
+        src = attrs.get('src') or ''
+        if not src or attrs.get('data-lazy-placeholder') is not None:
+            return
+        alt = INLINE_ESCAPE.sub(r'\\\1', attrs.get('alt') or '')
+        title = attrs.get('title')
+        title = f' "{title}"' if title else ''
+        self._parts.append(f"![{alt}]({src.replace(' ', '%20')}{title})")
+
+    def _end_pre(self):
+        text = ''.join(self._pre)
+        self._pre = None
+        if text.startswith('\n'):
+            text = text[1:]
+        text = text.rstrip('\n')
+        if self._table is not None:
+            # Code inside a data table cell can only be inline
+            self._parts.append(self._inline_code(text.replace('\n', ' ')))
+            return
+        fence = '```'
+        while fence in text:
+            fence += '`'
+        lines = [fence + self._pre_language] + text.split('\n') + [fence]
+        block, kind = self._prefix_lines(lines, kind='pre')
+        self._emit(block, kind)
+
+    @staticmethod
+    def _inline_code(text):
+        if not text:
+            return ''
+        fence = '`'
+        while fence in text:
+            fence += '`'
+        padding = ' ' if text.startswith('`') or text.endswith('`') else ''
+        return f"{fence}{padding}{text}{padding}{fence}"
+
+    def _end_code(self):
+        text = WHITESPACE.sub(' ', ''.join(self._code))
+        self._code = None
+        if self._table is not None:
+            text = text.replace('|', '\\|')
+        self._parts.append(self._inline_code(text))
+
+    # Tables
+
+    def _start_table(self, classes):
+        if self._table is not None:
+            # Nested table: its cells run together inside the outer cell
+            self._nested_tables += 1
+            return ('nested-table',)
+        self._flush_block()
+        if classes & LAYOUT_TABLE_CLASSES:
+            return ('layout-table',)
+        self._table = {'rows': [], 'header': False}
+        return ('table',)
+
+    def _in_layout_table(self):
+        return any(action and action[0] == 'layout-table' for _, action in self._stack)
+
+    def _table_part(self, tag):
+        if self._table is None:
+            if self._in_layout_table() and tag in ('td', 'th'):
+                self._flush_block()
+                return ('layout-cell',)
+            return None
+        if self._nested_tables:
+            if tag in ('td', 'th') and self._parts and not self._parts[-1].endswith(' '):
+                self._parts.append(' ')
+            return None
+        if tag == 'tr':
+            self._table['rows'].append([])
+            return ('row',)
+        if not self._table['rows']:
+            self._table['rows'].append([])
+        if tag == 'th' and len(self._table['rows']) == 1:
+            self._table['header'] = True
+        self._parts = []
+        return ('cell',)
+
+    def _end_cell(self):
+        text = ''.join(self._parts).strip()
+        while text.startswith('<br>'):
+            text = text[4:].strip()
+        while text.endswith('<br>'):
+            text = text[:-4].strip()
+        self._parts = []
+        self._table['rows'][-1].append(text)
+
+    def _end_table(self):
+        rows = [row for row in self._table['rows'] if row]
+        self._table = None
+        self._parts = []
+        if not rows:
+            return
+        columns = max(len(row) for row in rows)
+        rows = [row + [''] * (columns - len(row)) for row in rows]
+        lines = ['| ' + ' | '.join(rows[0]) + ' |',
+                 '|' + '|'.join(['---'] * columns) + '|']
+        lines.extend('| ' + ' | '.join(row) + ' |' for row in rows[1:])
+        block, kind = self._prefix_lines(lines, kind='table')
+        self._emit(block, kind)
+
+
+def html_to_markdown(html_content):
+    """Markdown for an HTML fragment"""
+    parts = []
+    converter = MarkdownConverter(parts.append)
+    converter.feed(html_content)
+    converter.close()
+    return ''.join(parts)
+
+
+def write_markdown(html_content, output, chunk_size=64 * 1024):
+    """Convert HTML to Markdown, writing it as UTF-8 to the binary file object output as it goes"""
+    text = io.TextIOWrapper(output, encoding='utf-8', newline='\n')
+    try:
+        converter = MarkdownConverter(text.write)
+        for start in range(0, len(html_content), chunk_size):
+            converter.feed(html_content[start:start + chunk_size])
+        converter.close()
+        text.flush()
+    finally:
+        # Leave output open for the caller
+        text.detach()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# mhtml_export.py - MHTML archives of editor content
+#
+# The archive is a multipart/related message whose root part is the saved
+# HTML document. Every distinct image the HTML references
+# follows it exactly once, as a base64 part addressed by a cid: Content-Location
+# that the rewritten <img src> points at. Browsers (Chrome, Edge) resolve those
+# references from the archive.
+#
+# Parts are written one after the other to a binary file object. Images are
+# encoded straight from their data URI or file in slices, so no decoded copy
+# of an image is ever held in memory.
+import os
+import re
+import uuid
+import base64
+import hashlib
+import quopri
+import mimetypes
+import email.utils
+import email.header
+from urllib.parse import unquote, unquote_to_bytes, urlparse
+
+IMG_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+DATA_URI_PATTERN = re.compile(r'data:([^;,]*)((?:;[^;,]*)*),', re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Bytes read per slice of an image file; a multiple of 57 so every slice
+# encodes to whole 76 character base64 lines
+FILE_SLICE_SIZE = 57 * 1024
+
+# Characters of an existing base64 payload written per line
+BASE64_LINE_LENGTH = 76
+
+CRLF = b"\r\n"
+
+
+class _ImagePart:
+    """One image of the archive and where its bytes come from"""
+
+    def __init__(self, location, content_type, payload=None, path=None, data=None):
+        self.location = location
+        self.content_type = content_type
+        # Exactly one of: base64 text, file path, raw bytes
+        self.payload = payload
+        self.path = path
+        self.data = data
+
+
+def _location_for(key, content_type):
+    digest = hashlib.sha1(key.encode('utf-8', 'surrogatepass')).hexdigest()
+    extension = mimetypes.guess_extension(content_type) or ""
+    return f"cid:image-{digest}{extension}@webkitword"
+
+
+def _resolve_image(src, base_dir):
+    """
+    Describe an image source as (dedup key, content type, part kwargs)
+
+    Returns None for sources that are left as they are (remote URLs).
+    """
+    if src.startswith('data:'):
+        match = DATA_URI_PATTERN.match(src)
+        if not match:
+            return None
+        content_type = match.group(1) or "application/octet-stream"
+        payload = src[match.end():]
+        if ';base64' in match.group(2).lower():
+            payload = WHITESPACE_PATTERN.sub('', payload)
+            return payload, content_type, {"payload": payload}
+        return payload, content_type, {"data": unquote_to_bytes(payload)}
+
+    parsed = urlparse(src)
+    if parsed.scheme == 'file':
+        path = unquote(parsed.path)
+    elif not parsed.scheme:
+        path = unquote(src)
+        if not os.path.isabs(path):
+            if not base_dir:
+                return None
+            path = os.path.join(base_dir, path)
+    else:
+        return None
+    if not os.path.isfile(path):
+        return None
+    path = os.path.realpath(path)
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return path, content_type, {"path": path}
+
+
+def collect_images(html, base_dir=None):
+    """
+    Point every local or inline image of html at an archive part
+
+    Returns:
+        Tuple of (rewritten HTML, list of _ImagePart), each distinct image once
+    """
+    parts = {}
+
+    def replace(match):
+        src = match.group(3)
+        resolved = _resolve_image(src, base_dir)
+        if resolved is None:
+            return match.group(0)
+        key, content_type, source = resolved
+        part = parts.get(key)
+        if part is None:
+            part = _ImagePart(_location_for(key, content_type), content_type, **source)
+            parts[key] = part
+        return f'{match.group(1)}{match.group(2)}{part.location}{match.group(2)}'
+
+    html = IMG_SRC_PATTERN.sub(replace, html)
+    return html, list(parts.values())
+
+
+def _write_headers(output, headers):
+    for name, value in headers:
+        output.write(f"{name}: {value}".encode('utf-8') + CRLF)
+    output.write(CRLF)
+
+
+def _write_image(output, part):
+    if part.payload is not None:
+        payload = part.payload
+        for start in range(0, len(payload), BASE64_LINE_LENGTH):
+            output.write(payload[start:start + BASE64_LINE_LENGTH].encode('ascii') + CRLF)
+    elif part.path is not None:
+        with open(part.path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_SLICE_SIZE)
+                if not chunk:
+                    break
+                output.write(base64.encodebytes(chunk).replace(b"\n", CRLF))
+    else:
+        output.write(base64.encodebytes(part.data).replace(b"\n", CRLF))
+
+
+def write_mhtml(document, output, title="Document", base_dir=None):
+    """
+    Write an HTML document and its images to a binary file object as MHTML
+
+    Relative image paths are resolved against base_dir. Returns the number of
+    image parts written.
+    """
+    document, images = collect_images(document.replace("\r\n", "\n"), base_dir)
+    boundary = f"----=_NextPart_{uuid.uuid4().hex}"
+    safe_title = re.sub(r'[\r\n]+', ' ', title)
+    root_location = "file:///" + (re.sub(r'[^\w.-]+', '_', safe_title, flags=re.ASCII) or "document") + ".html"
+
+    _write_headers(output, [
+        ("From", "<Saved by WebkitWord>"),
+        ("Subject", safe_title if safe_title.isascii() else email.header.Header(safe_title, 'utf-8').encode()),
+        ("Date", email.utils.formatdate(localtime=True)),
+        ("MIME-Version", "1.0"),
+        ("Content-Type", f'multipart/related; type="text/html"; boundary="{boundary}"'),
+    ])
+    output.write(b"This is a multi-part message in MIME format." + CRLF + CRLF)
+
+    output.write(f"--{boundary}".encode('ascii') + CRLF)
+    _write_headers(output, [
+        ("Content-Type", 'text/html; charset="utf-8"'),
+        ("Content-Transfer-Encoding", "quoted-printable"),
+        ("Content-Location", root_location),
+    ])
+    output.write(quopri.encodestring(document.encode('utf-8')).replace(b"\n", CRLF))
+    output.write(CRLF)
+
+    for part in images:
+        output.write(CRLF + f"--{boundary}".encode('ascii') + CRLF)
+        _write_headers(output, [
+            ("Content-Type", part.content_type),
+            ("Content-Transfer-Encoding", "base64"),
+            ("Content-Location", part.location),
+        ])
+        _write_image(output, part)
+
+    output.write(CRLF + f"--{boundary}--".encode('ascii') + CRLF)
+    return len(images)
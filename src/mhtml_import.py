@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# mhtml_import.py - lazily decoded MHTML archives
+#
+# Opening an archive makes one pass over the file that records where each
+# MIME part's headers and body are, without decoding anything. Large files are
+# memory-mapped rather than read. The root HTML part is decoded for the editor
+# and its images are pointed at
+#
+#   webkitword-archive://<archive id>/<part key>
+#
+# which the editor's URI scheme handler serves by decoding that one part on
+# request. The archive id is derived from the file's path, size and mtime, so
+# reopening the same file (as crash recovery does) gives the same URLs.
+#
+# Open archives live in a process-wide registry with a reference count per
+# window using them. Other archive types (.wwd documents) share the registry:
+# they need an archive_id, get_part(key) and close(). Before content leaves
+# the editor, inline_archive_sources turns archive URLs back into data URIs.
+import os
+import re
+import mmap
+import base64
+import hashlib
+import binascii
+import threading
+from html import unescape
+from urllib.parse import urljoin, unquote
+from email.parser import BytesHeaderParser
+from email import policy
+
+ARCHIVE_SCHEME = "webkitword-archive"
+
+# Files at least this large are memory-mapped instead of read into memory
+MMAP_MIN_SIZE = 1024 * 1024
+
+IMG_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])(.*?)\2', re.IGNORECASE | re.DOTALL)
+ARCHIVE_URL_PATTERN = re.compile(ARCHIVE_SCHEME + r'://([0-9a-f]+)/([\w.-]+)')
+
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+class ArchivePart:
+    """Location of one MIME part's body within the archive file"""
+
+    def __init__(self, index, headers, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.content_type = headers.get_content_type()
+        self.charset = headers.get_content_charset() or "utf-8"
+        self.encoding = (headers.get("Content-Transfer-Encoding") or "7bit").strip().lower()
+        self.location = (headers.get("Content-Location") or "").strip()
+        content_id = (headers.get("Content-ID") or "").strip()
+        self.content_id = content_id[1:-1] if content_id.startswith("<") and content_id.endswith(">") else content_id
+
+
+def _header_end(buffer, start, end):
+    """Offset where the body after the headers at start begins"""
+    # A part without headers starts with the blank line
+    for newline in (b"\r\n", b"\n"):
+        if buffer[start:start + len(newline)] == newline:
+            return start + len(newline)
+    crlf = buffer.find(b"\r\n\r\n", start, end)
+    lf = buffer.find(b"\n\n", start, end)
+    if crlf != -1 and (lf == -1 or crlf < lf):
+        return crlf + 4
+    if lf != -1:
+        return lf + 2
+    return end
+
+
+class MhtmlArchive:
+    """An MHTML file indexed in one pass; parts are decoded on demand"""
+
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        stat = os.stat(self.path)
+        self.archive_id = hashlib.sha1(
+            f"{self.path}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+        self._file = open(self.path, 'rb')
+        if stat.st_size >= MMAP_MIN_SIZE:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = self._file.read()
+        self.parts = []
+        self.root = None
+        self._by_location = {}
+        self._by_content_id = {}
+        self._index()
+
+    def _parse_headers(self, start, end):
+        return BytesHeaderParser(policy=policy.compat32).parsebytes(bytes(self._buffer[start:end]))
+
+    def _index(self):
+        buffer = self._buffer
+        body_start = _header_end(buffer, 0, len(buffer))
+        headers = self._parse_headers(0, body_start)
+        self.base_location = (headers.get("Content-Location") or "").strip()
+        if headers.get_content_maintype() == "multipart":
+            self._index_multipart(headers.get_param("boundary"), body_start, len(buffer))
+        else:
+            self._add_part(headers, body_start, len(buffer))
+
+        start_id = headers.get_param("start") if headers.get_content_maintype() == "multipart" else None
+        if start_id:
+            self.root = self._by_content_id.get(start_id.strip("<>"))
+        if self.root is None:
+            self.root = next((part for part in self.parts if part.content_type == "text/html"), None)
+        if self.root is not None and self.root.location:
+            self.base_location = urljoin(self.base_location, self.root.location)
+
+    def _index_multipart(self, boundary, start, end):
+        if not boundary:
+            return
+        buffer = self._buffer
+        delimiter = b"--" + boundary.encode('ascii', 'replace')
+        position = buffer.find(delimiter, start, end)
+        while position != -1:
+            after = position + len(delimiter)
+            if buffer[after:after + 2] == b"--":
+                break
+            line_end = buffer.find(b"\n", after, end)
+            if line_end == -1:
+                break
+            part_start = line_end + 1
+            # A delimiter only counts at the start of a line
+            next_position = buffer.find(b"\n" + delimiter, part_start, end)
+            part_end = next_position if next_position != -1 else end
+            if part_end > part_start and buffer[part_end - 1:part_end] == b"\r":
+                part_end -= 1
+            body_start = _header_end(buffer, part_start, part_end)
+            headers = self._parse_headers(part_start, body_start)
+            if headers.get_content_maintype() == "multipart":
+                self._index_multipart(headers.get_param("boundary"), body_start, part_end)
+            else:
+                self._add_part(headers, body_start, part_end)
+            position = next_position + 1 if next_position != -1 else -1
+
+    def _add_part(self, headers, start, end):
+        part = ArchivePart(len(self.parts), headers, start, end)
+        self.parts.append(part)
+        if part.content_id:
+            self._by_content_id.setdefault(part.content_id, part)
+        if part.location:
+            self._by_location.setdefault(part.location, part)
+            if part.location.startswith("cid:"):
+                self._by_content_id.setdefault(part.location[4:], part)
+
+    def read_part(self, part):
+        """Decoded body of a part"""
+        data = bytes(self._buffer[part.start:part.end])
+        if part.encoding == "base64":
+            return binascii.a2b_base64(data)
+        if part.encoding == "quoted-printable":
+            return binascii.a2b_qp(data)
+        return data
+
+    def get_html(self):
+        """The root HTML document, decoded"""
+        if self.root is None:
+            raise ValueError("The archive has no HTML part")
+        data = self.read_part(self.root)
+        try:
+            return data.decode(self.root.charset, errors='replace')
+        except LookupError:
+            return data.decode('utf-8', errors='replace')
+
+    def find_part(self, url):
+        """The part a URL in the root document refers to, or None"""
+        url = unescape(url).strip()
+        if url.startswith("cid:"):
+            return self._by_content_id.get(unquote(url[4:]))
+        part = self._by_location.get(url)
+        if part is None and self.base_location:
+            part = self._by_location.get(urljoin(self.base_location, url))
+        return part
+
+    def get_part(self, key):
+        """Decoded bytes and content type of the part with index key"""
+        index = int(key) if key.isdigit() else -1
+        if not 0 <= index < len(self.parts):
+            raise KeyError(key)
+        part = self.parts[index]
+        return self.read_part(part), part.content_type
+
+    def get_url(self, part):
+        return archive_url(self.archive_id, part.index)
+
+    def rewrite_sources(self, html, inline=False):
+        """
+        Point images of html that live in the archive at their parts
+
+        Sources become archive URLs, or data URIs with inline=True.
+        """
+        def replace(match):
+            part = self.find_part(match.group(3))
+            if part is None or part is self.root:
+                return match.group(0)
+            if inline:
+                data = base64.b64encode(self.read_part(part)).decode('ascii')
+                src = f"data:{part.content_type};base64,{data}"
+            else:
+                src = self.get_url(part)
+            return f'{match.group(1)}{match.group(2)}{src}{match.group(2)}'
+
+        return IMG_SRC_PATTERN.sub(replace, html)
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._buffer = b""
+        self._file.close()
+
+
+def archive_url(archive_id, key):
+    return f"{ARCHIVE_SCHEME}://{archive_id}/{key}"
+
+
+def open_archive(path, archive_class=MhtmlArchive):
+    """Open an archive, or take another reference to it if already open"""
+    archive = archive_class(path)
+    with _archives_lock:
+        entry = _archives.get(archive.archive_id)
+        if entry is not None:
+            entry[1] += 1
+            archive.close()
+            return entry[0]
+        _archives[archive.archive_id] = [archive, 1]
+    return archive
+
+
+def release_archive(archive_id):
+    """Drop a reference taken by open_archive, closing the archive after the last one"""
+    with _archives_lock:
+        entry = _archives.get(archive_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _archives[archive_id]
+    entry[0].close()
+
+
+def read_archive_url(url):
+    """
+    Resolve an archive URL
+
+    Returns:
+        Tuple of (decoded bytes, content type)
+    Raises:
+        KeyError if the archive is not open or has no such part
+    """
+    match = ARCHIVE_URL_PATTERN.match(url)
+    if not match:
+        raise KeyError(url)
+    with _archives_lock:
+        entry = _archives.get(match.group(1))
+    if entry is None:
+        raise KeyError(url)
+    return entry[0].get_part(match.group(2))
+
+
+def inline_archive_sources(html):
+    """Replace archive URLs in html with data URIs so it stands on its own"""
+    if ARCHIVE_SCHEME not in html:
+        return html
+
+    cache = {}
+
+    def replace(match):
+        url = match.group(0)
+        if url not in cache:
+            try:
+                data, content_type = read_archive_url(url)
+            except (KeyError, ValueError, OSError):
+                cache[url] = url
+            else:
+                cache[url] = f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+        return cache[url]
+
+    return ARCHIVE_URL_PATTERN.sub(replace, html)
@@ -0,0 +1,948 @@
+#!/usr/bin/env python3
+# odt_export.py - native OpenDocument Text export of editor content
+#
+# OdtConverter is an html.parser.HTMLParser, like MarkdownConverter, that maps
+# the markup the editor produces onto ODF: paragraphs and headings, nested
+# lists, blockquotes and <pre> blocks, editor tables (with their cell borders
+# and backgrounds), floating tables and text boxes (as frames holding a text
+# box), image tables (their cells become plain blocks), images (stored once
+# each under Pictures/) and the <font>/<span style> runs left by execCommand
+# (as automatic text styles).
+#
+# The body is written to a spooled temporary file as it is parsed and images
+# go into the archive as soon as they are met. content.xml is then put
+# together from the automatic styles collected on the way and the spooled
+# body, so memory use is bounded by the largest table rather than by the
+# document.
+import re
+import struct
+import hashlib
+import tempfile
+import mimetypes
+import zipfile
+from html.parser import HTMLParser
+from xml.sax.saxutils import escape, quoteattr
+
+from markdown_export import HEADING_TAGS, VOID_TAGS, SKIP_TAGS, SKIP_CLASSES, WHITESPACE
+from wwd_format import read_image
+
+MIMETYPE = "application/vnd.oasis.opendocument.text"
+
+# Spooled body stays in memory up to this size
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'header', 'footer', 'nav', 'aside', 'main',
+    'figure', 'figcaption', 'center', 'address', 'dl', 'dt', 'dd',
+}
+# Tables shown as a frame floating in the text
+FRAME_TABLE_CLASSES = {'floating-table', 'text-box', 'text-box-table'}
+# Tables that are layout rather than data: their cells are written as blocks
+LAYOUT_TABLE_CLASSES = {'image-table', 'text-box', 'text-box-table'}
+
+# Width of the text area of the A4 page in styles.xml
+TEXT_WIDTH_CM = 17.0
+PX_PER_CM = 96 / 2.54
+
+# <font size> 1-7 in points
+FONT_SIZES = {'1': '8pt', '2': '10pt', '3': '12pt', '4': '14pt', '5': '18pt', '6': '24pt', '7': '36pt'}
+KEYWORD_FONT_SIZES = {
+    'xx-small': '7pt', 'x-small': '7.5pt', 'small': '10pt', 'medium': '12pt',
+    'large': '13.5pt', 'x-large': '18pt', 'xx-large': '24pt', 'xxx-large': '36pt',
+}
+NAMED_COLORS = {
+    'black': '#000000', 'white': '#ffffff', 'red': '#ff0000', 'green': '#008000',
+    'blue': '#0000ff', 'yellow': '#ffff00', 'gray': '#808080', 'grey': '#808080',
+    'orange': '#ffa500', 'purple': '#800080', 'silver': '#c0c0c0', 'maroon': '#800000',
+    'navy': '#000080', 'teal': '#008080', 'olive': '#808000', 'lime': '#00ff00',
+    'aqua': '#00ffff', 'cyan': '#00ffff', 'fuchsia': '#ff00ff', 'magenta': '#ff00ff',
+}
+ALIGNMENTS = {'left': 'start', 'start': 'start', 'right': 'end', 'end': 'end',
+              'center': 'center', 'justify': 'justify'}
+
+TAG_PROPERTIES = {
+    'b': {'weight': 'bold'}, 'strong': {'weight': 'bold'},
+    'i': {'style': 'italic'}, 'em': {'style': 'italic'}, 'cite': {'style': 'italic'}, 'var': {'style': 'italic'},
+    'u': {'underline': True}, 'ins': {'underline': True},
+    's': {'strike': True}, 'strike': {'strike': True}, 'del': {'strike': True},
+    'sub': {'position': 'sub 58%'}, 'sup': {'position': 'super 58%'},
+    'code': {'family': 'Liberation Mono'}, 'kbd': {'family': 'Liberation Mono'},
+    'tt': {'family': 'Liberation Mono'}, 'samp': {'family': 'Liberation Mono'},
+}
+
+LENGTH_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*(px|pt|cm|mm|in)?\s*$')
+RGB_PATTERN = re.compile(r'rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)')
+BORDER_PATTERN = re.compile(r'(\d+(?:\.\d+)?)px\s+(solid|dashed|dotted|double)\s*(.*)')
+INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+SPACES = re.compile(r' {2,}')
+
+NAMESPACES = (
+    'xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+    'xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0" '
+    'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+    'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+    'xmlns:draw="urn:oasis:names:tc:opendocument:xmlns:drawing:1.0" '
+    'xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink" '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+    'xmlns:meta="urn:oasis:names:tc:opendocument:xmlns:meta:1.0" '
+    'xmlns:svg="urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0" '
+    'office:version="1.3"'
+)
+
+
+def _list_style(name, ordered):
+    levels = []
+    for level in range(1, 11):
+        indent = f'text:list-level-position-and-space-mode="label-alignment"><style:list-level-label-alignment ' \
+                 f'text:label-followed-by="listtab" fo:text-indent="-0.635cm" ' \
+                 f'fo:margin-left="{0.635 * (level + 1):.3f}cm"/></style:list-level-properties>'
+        if ordered:
+            levels.append(f'<text:list-level-style-number text:level="{level}" style:num-suffix="." '
+                          f'style:num-format="1"><style:list-level-properties {indent}'
+                          f'</text:list-level-style-number>')
+        else:
+            bullet = '•◦▪'[(level - 1) % 3]
+            levels.append(f'<text:list-level-style-bullet text:level="{level}" text:bullet-char="{bullet}">'
+                          f'<style:list-level-properties {indent}</text:list-level-style-bullet>')
+    return f'<text:list-style style:name="{name}">{"".join(levels)}</text:list-style>'
+
+
+LIST_STYLES = {False: 'L1', True: 'L2'}
+FIXED_AUTOMATIC_STYLES = (
+    _list_style(LIST_STYLES[False], False) + _list_style(LIST_STYLES[True], True) +
+    '<style:style style:name="fr_image" style:family="graphic">'
+    '<style:graphic-properties style:vertical-pos="top" style:vertical-rel="baseline"/></style:style>'
+)
+
+_HEADING_STYLES = ''.join(
+    f'<style:style style:name="Heading_20_{level}" style:display-name="Heading {level}" style:family="paragraph" '
+    f'style:parent-style-name="Heading" style:next-style-name="Standard" style:default-outline-level="{level}">'
+    f'<style:text-properties fo:font-size="{size}" fo:font-weight="bold"/></style:style>'
+    for level, size in ((1, '200%'), (2, '150%'), (3, '117%'), (4, '100%'), (5, '83%'), (6, '67%'))
+)
+
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    f'<office:document-styles {NAMESPACES}>'
+    '<office:styles>'
+    '<style:default-style style:family="paragraph">'
+    '<style:paragraph-properties fo:orphans="2" fo:widows="2"/>'
+    '<style:text-properties fo:font-family="\'Liberation Serif\'" fo:font-size="12pt" fo:language="en"/>'
+    '</style:default-style>'
+    '<style:style style:name="Standard" style:family="paragraph" style:class="text"/>'
+    '<style:style style:name="Text_20_body" style:display-name="Text body" style:family="paragraph" '
+    'style:parent-style-name="Standard" style:class="text">'
+    '<style:paragraph-properties fo:margin-top="0cm" fo:margin-bottom="0.247cm"/></style:style>'
+    '<style:style style:name="Heading" style:family="paragraph" style:parent-style-name="Standard" '
+    'style:next-style-name="Text_20_body" style:class="text">'
+    '<style:paragraph-properties fo:margin-top="0.423cm" fo:margin-bottom="0.212cm" fo:keep-with-next="always"/>'
+    '<style:text-properties fo:font-family="\'Liberation Sans\'"/></style:style>'
+    + _HEADING_STYLES +
+    '<style:style style:name="Quotations" style:family="paragraph" style:parent-style-name="Standard" '
+    'style:class="html"><style:paragraph-properties fo:margin-left="1cm" fo:margin-right="1cm" '
+    'fo:margin-bottom="0.247cm" fo:border-left="0.06pt solid #c0c0c0" fo:padding-left="0.2cm"/></style:style>'
+    '<style:style style:name="Preformatted_20_Text" style:display-name="Preformatted Text" '
+    'style:family="paragraph" style:parent-style-name="Standard" style:class="html">'
+    '<style:paragraph-properties fo:background-color="#f4f4f4" fo:padding="0.1cm"/>'
+    '<style:text-properties fo:font-family="\'Liberation Mono\'" fo:font-size="10pt"/></style:style>'
+    '<style:style style:name="Table_20_Contents" style:display-name="Table Contents" '
+    'style:family="paragraph" style:parent-style-name="Standard" style:class="extra"/>'
+    '<style:style style:name="Horizontal_20_Line" style:display-name="Horizontal Line" '
+    'style:family="paragraph" style:parent-style-name="Standard" style:class="html">'
+    '<style:paragraph-properties fo:margin-bottom="0.5cm" fo:padding="0cm" '
+    'fo:border-bottom="0.06pt solid #808080"/></style:style>'
+    '</office:styles>'
+    '<office:automatic-styles>'
+    '<style:page-layout style:name="pm1"><style:page-layout-properties fo:page-width="21.001cm" '
+    'fo:page-height="29.7cm" style:print-orientation="portrait" fo:margin-top="2cm" fo:margin-bottom="2cm" '
+    'fo:margin-left="2cm" fo:margin-right="2cm"/></style:page-layout>'
+    '</office:automatic-styles>'
+    '<office:master-styles><style:master-page style:name="Standard" style:page-layout-name="pm1"/>'
+    '</office:master-styles>'
+    '</office:document-styles>'
+)
+
+
+def parse_css(style):
+    declarations = {}
+    for declaration in (style or '').split(';'):
+        name, _, value = declaration.partition(':')
+        if value:
+            declarations[name.strip().lower()] = value.strip()
+    return declarations
+
+
+def css_length_cm(value):
+    """A CSS length in centimetres, or None for relative or unknown lengths"""
+    match = LENGTH_PATTERN.match(value or '')
+    if not match:
+        return None
+    number = float(match.group(1))
+    unit = match.group(2) or 'px'
+    return number * {'px': 1 / PX_PER_CM, 'pt': 2.54 / 72, 'cm': 1, 'mm': 0.1, 'in': 2.54}[unit]
+
+
+def css_color(value):
+    """A CSS color as #rrggbb, or None"""
+    value = (value or '').strip().lower()
+    if re.fullmatch(r'#[0-9a-f]{6}', value):
+        return value
+    if re.fullmatch(r'#[0-9a-f]{3}', value):
+        return '#' + ''.join(c * 2 for c in value[1:])
+    match = RGB_PATTERN.match(value)
+    if match:
+        if value.startswith('rgba') and re.search(r',\s*0(?:\.0*)?\s*\)$', value):
+            return None
+        return '#' + ''.join(f'{min(255, int(c)):02x}' for c in match.groups())
+    return NAMED_COLORS.get(value)
+
+
+def css_font_size(value):
+    value = (value or '').strip().lower()
+    if value in KEYWORD_FONT_SIZES:
+        return KEYWORD_FONT_SIZES[value]
+    match = LENGTH_PATTERN.match(value)
+    if not match:
+        return None
+    number = float(match.group(1))
+    unit = match.group(2) or 'px'
+    points = number * {'px': 0.75, 'pt': 1, 'cm': 72 / 2.54, 'mm': 72 / 25.4, 'in': 72}[unit]
+    return f'{points:g}pt'
+
+
+def span_properties(style):
+    """Text properties of the inline CSS the editor writes on spans"""
+    css = parse_css(style)
+    properties = {}
+    weight = css.get('font-weight', '').lower()
+    if weight in ('bold', 'bolder') or (weight.isdigit() and int(weight) >= 600):
+        properties['weight'] = 'bold'
+    elif weight in ('normal', 'lighter') or (weight.isdigit() and int(weight) < 600):
+        properties['weight'] = 'normal'
+    if css.get('font-style', '').lower() in ('italic', 'oblique'):
+        properties['style'] = 'italic'
+    decoration = (css.get('text-decoration', '') + ' ' + css.get('text-decoration-line', '')).lower()
+    if 'underline' in decoration:
+        properties['underline'] = True
+    if 'line-through' in decoration:
+        properties['strike'] = True
+    vertical_align = css.get('vertical-align', '').lower()
+    if vertical_align in ('sub', 'super'):
+        properties['position'] = f'{vertical_align} 58%'
+    size = css_font_size(css.get('font-size'))
+    if size:
+        properties['size'] = size
+    family = css.get('font-family')
+    if family:
+        properties['family'] = family.split(',')[0].strip().strip('"\'')
+    color = css_color(css.get('color'))
+    if color:
+        properties['color'] = color
+    background = css_color(css.get('background-color') or css.get('background'))
+    if background:
+        properties['background'] = background
+    return properties
+
+
+def font_properties(attrs):
+    properties = span_properties(attrs.get('style'))
+    if attrs.get('face'):
+        properties.setdefault('family', attrs['face'].split(',')[0].strip().strip('"\''))
+    if attrs.get('size') in FONT_SIZES:
+        properties.setdefault('size', FONT_SIZES[attrs['size']])
+    color = css_color(attrs.get('color'))
+    if color:
+        properties.setdefault('color', color)
+    return properties
+
+
+def _text_properties_xml(properties):
+    attributes = []
+    if properties.get('weight'):
+        attributes.append(f'fo:font-weight="{properties["weight"]}"')
+    if properties.get('style'):
+        attributes.append(f'fo:font-style="{properties["style"]}"')
+    if properties.get('underline'):
+        attributes.append('style:text-underline-style="solid" style:text-underline-width="auto" '
+                          'style:text-underline-color="font-color"')
+    if properties.get('strike'):
+        attributes.append('style:text-line-through-style="solid"')
+    if properties.get('position'):
+        attributes.append(f'style:text-position="{properties["position"]}"')
+    if properties.get('size'):
+        attributes.append(f'fo:font-size="{properties["size"]}"')
+    if properties.get('family'):
+        attributes.append(f'fo:font-family={quoteattr(properties["family"])}')
+    if properties.get('color'):
+        attributes.append(f'fo:color="{properties["color"]}"')
+    if properties.get('background'):
+        attributes.append(f'fo:background-color="{properties["background"]}"')
+    return f'<style:text-properties {" ".join(attributes)}/>' if attributes else ''
+
+
+def image_size(data):
+    """Pixel size of PNG, GIF or JPEG data, or None"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        return struct.unpack('<HH', data[6:10])
+    if data[:2] == b'\xff\xd8':
+        position = 2
+        while position + 9 < len(data):
+            if data[position] != 0xff:
+                position += 1
+                continue
+            marker = data[position + 1]
+            if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7:
+                position += 2
+                continue
+            length = struct.unpack('>H', data[position + 2:position + 4])[0]
+            if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                height, width = struct.unpack('>HH', data[position + 5:position + 9])
+                return width, height
+            position += 2 + length
+    return None
+
+
+def image_extent_cm(natural, width, height, max_width=TEXT_WIDTH_CM):
+    """
+    Display size of an image in centimetres
+
+    Missing dimensions follow from the natural pixel size (at 96 dpi) and its
+    aspect ratio; images wider than max_width are scaled down to fit.
+    """
+    if natural and natural[0] and natural[1]:
+        ratio = natural[1] / natural[0]
+        if width is None and height is None:
+            width = natural[0] / PX_PER_CM
+        if width is None:
+            width = height / ratio
+        if height is None:
+            height = width * ratio
+    width = width or 5.0
+    height = height or 5.0
+    if width > max_width:
+        height *= max_width / width
+        width = max_width
+    return width, height
+
+
+def xml_text(text):
+    return escape(INVALID_XML_CHARS.sub('', text))
+
+
+class OdtConverter(HTMLParser):
+    """
+    Convert editor HTML to the body of an ODF text document
+
+    Body XML is passed to write() as it is produced; add_picture(name, data,
+    media_type) stores an image in the package. After close(),
+    automatic_styles() returns the styles the body refers to.
+    """
+
+    def __init__(self, write, add_picture, base_dir=None):
+        super().__init__(convert_charrefs=True)
+        self._write = write
+        self._add_picture = add_picture
+        self._base_dir = base_dir
+        self._stack = []            # open elements: (tag, closing action)
+        self._skip_depth = 0
+        self._buffers = []          # output of the open tables, innermost last
+        self._blocks = []           # open blocks: {'level', 'align'}
+        self._para = None           # element name of the open paragraph
+        self._para_empty = True
+        self._pending_breaks = 0
+        self._last_space = True
+        self._inline = []           # text properties of the open inline elements
+        self._links = []
+        self._link_open = False
+        self._lists = []            # {'item_open', 'implicit'}
+        self._tables = []           # {'layout', 'columns', 'row_columns', 'row_open', 'cell_open', ...}
+        self._quote_depth = 0
+        self._pre_depth = 0
+        self._pictures = {}         # image digest -> name in the package
+        self._sources = {}          # src -> (name, pixel size), False if unreadable
+        self._styles = {}
+        self._style_xml = []
+        self._counters = {}
+
+    # Output
+
+    def _emit(self, xml):
+        if self._buffers:
+            self._buffers[-1].append(xml)
+        else:
+            self._write(xml)
+
+    def _style(self, family, prefix, body, parent=None):
+        """Name of the automatic style with these properties, defining it on first use"""
+        key = (family, parent, body)
+        name = self._styles.get(key)
+        if name is None:
+            name = self._next_name(prefix)
+            self._styles[key] = name
+            parent_attribute = f' style:parent-style-name="{parent}"' if parent else ''
+            self._style_xml.append(f'<style:style style:name="{name}" style:family="{family}"'
+                                   f'{parent_attribute}>{body}</style:style>')
+        return name
+
+    def _next_name(self, prefix):
+        self._counters[prefix] = self._counters.get(prefix, 0) + 1
+        return f"{prefix}{self._counters[prefix]}"
+
+    def automatic_styles(self):
+        return FIXED_AUTOMATIC_STYLES + ''.join(self._style_xml)
+
+    # Block structure
+
+    def _in_cell(self):
+        """Whether block content is allowed here (not between table rows)"""
+        return not self._tables or self._tables[-1]['layout'] or self._tables[-1]['cell_open']
+
+    def _ensure_item(self):
+        """Text cannot sit directly in a list, so give it an item"""
+        if self._lists and not self._lists[-1]['item_open'] and \
+                (not self._tables or self._tables[-1]['list_depth'] < len(self._lists)):
+            self._emit('<text:list-item>')
+            self._lists[-1]['item_open'] = True
+
+    def _paragraph_style(self, level):
+        if level:
+            base = f"Heading_20_{level}"
+        elif self._pre_depth:
+            base = "Preformatted_20_Text"
+        elif self._quote_depth:
+            base = "Quotations"
+        elif self._tables and not self._tables[-1]['layout'] and self._tables[-1]['cell_open']:
+            base = "Table_20_Contents"
+        else:
+            base = "Standard"
+        align = next((block['align'] for block in reversed(self._blocks) if block['align']), None)
+        if not align:
+            return base
+        return self._style("paragraph", "P", f'<style:paragraph-properties fo:text-align="{align}"/>', base)
+
+    def _ensure_paragraph(self):
+        """Open a paragraph for inline content; False where none is allowed"""
+        if self._para:
+            return True
+        if not self._in_cell():
+            return False
+        self._ensure_item()
+        block = self._blocks[-1] if self._blocks else None
+        level = block['level'] if block else 0
+        style = self._paragraph_style(level)
+        if level:
+            self._emit(f'<text:h text:style-name="{style}" text:outline-level="{level}">')
+            self._para = 'text:h'
+        else:
+            self._emit(f'<text:p text:style-name="{style}">')
+            self._para = 'text:p'
+        self._para_empty = True
+        self._pending_breaks = 0
+        self._last_space = True
+        return True
+
+    def _end_paragraph(self):
+        if not self._para:
+            return
+        self._close_link()
+        # A trailing <br> only ends the line, as in the browser
+        self._emit('<text:line-break/>' * max(0, self._pending_breaks - 1))
+        self._pending_breaks = 0
+        self._emit(f'</{self._para}>')
+        self._para = None
+
+    def _start_block(self, level=0, align=None):
+        self._end_paragraph()
+        self._blocks.append({'level': level, 'align': align})
+        return ('block',)
+
+    def _end_block(self):
+        self._end_paragraph()
+        self._blocks.pop()
+
+    # Inline content
+
+    def _flush_breaks(self):
+        if self._pending_breaks:
+            self._emit('<text:line-break/>' * self._pending_breaks)
+            self._pending_breaks = 0
+            self._last_space = True
+
+    def _text_style(self):
+        properties = {}
+        for item in self._inline:
+            properties.update(item)
+        body = _text_properties_xml(properties)
+        return self._style("text", "T", body) if body else None
+
+    def _open_link(self):
+        if self._links and self._links[-1] and not self._link_open:
+            self._emit(f'<text:a xlink:type="simple" xlink:href={quoteattr(self._links[-1])}>')
+            self._link_open = True
+
+    def _close_link(self):
+        if self._link_open:
+            self._emit('</text:a>')
+            self._link_open = False
+
+    def _append_text(self, text):
+        if self._pre_depth:
+            if not text or not self._ensure_paragraph():
+                return
+            xml = self._preformatted(text)
+        else:
+            text = WHITESPACE.sub(' ', text)
+            if not self._para and not text.strip():
+                return
+            if not self._ensure_paragraph():
+                return
+            if self._last_space:
+                text = text.lstrip(' ')
+            if not text:
+                return
+            self._last_space = text.endswith(' ')
+            xml = xml_text(text)
+        self._flush_breaks()
+        self._open_link()
+        style = self._text_style()
+        self._emit(f'<text:span text:style-name="{style}">{xml}</text:span>' if style else xml)
+        self._para_empty = False
+
+    def _preformatted(self, text):
+        parts = []
+        for index, line in enumerate(text.split('\n')):
+            if index:
+                parts.append('<text:line-break/>')
+            for tab_index, piece in enumerate(line.split('\t')):
+                if tab_index:
+                    parts.append('<text:tab/>')
+                piece = xml_text(piece)
+                piece = SPACES.sub(lambda m: ' ' + f'<text:s text:c="{len(m.group(0)) - 1}"/>', piece)
+                if piece.startswith(' '):
+                    piece = '<text:s/>' + piece[1:]
+                parts.append(piece)
+        return ''.join(parts)
+
+    # Parser callbacks
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict((name, value or '') for name, value in attrs)
+        if self._skip_depth:
+            if tag not in VOID_TAGS:
+                self._skip_depth += 1
+            return
+        classes = set(attrs.get('class', '').split())
+        if tag in SKIP_TAGS or classes & SKIP_CLASSES:
+            if tag not in VOID_TAGS:
+                self._skip_depth = 1
+            return
+
+        css = parse_css(attrs.get('style'))
+        align = ALIGNMENTS.get((css.get('text-align') or attrs.get('align') or '').lower())
+        action = None
+        if tag == 'br':
+            if self._ensure_paragraph():
+                self._pending_breaks += 1
+        elif tag == 'img':
+            self._image(attrs, css)
+        elif tag == 'hr':
+            self._end_paragraph()
+            if self._in_cell():
+                self._ensure_item()
+                self._emit('<text:p text:style-name="Horizontal_20_Line"/>')
+        elif tag in HEADING_TAGS:
+            action = self._start_block(HEADING_TAGS[tag], align)
+        elif tag in BLOCK_TAGS:
+            action = self._start_block(0, 'center' if tag == 'center' else align)
+        elif tag in ('ul', 'ol'):
+            action = self._start_list(tag == 'ol')
+        elif tag == 'li':
+            action = self._start_item(align)
+        elif tag == 'blockquote':
+            self._start_block(0, align)
+            self._quote_depth += 1
+            action = ('quote',)
+        elif tag == 'pre':
+            self._start_block(0, align)
+            self._pre_depth += 1
+            action = ('pre',)
+        elif tag == 'a':
+            href = attrs.get('href', '')
+            self._close_link()
+            self._links.append(href if href and not href.startswith('javascript:') else None)
+            action = ('link',)
+        elif tag == 'table':
+            action = self._start_table(attrs, css, classes)
+        elif tag == 'tr':
+            action = self._start_row()
+        elif tag in ('td', 'th'):
+            action = self._start_cell(tag, attrs, css, align)
+        elif tag in TAG_PROPERTIES or tag in ('span', 'font'):
+            if tag == 'font':
+                properties = font_properties(attrs)
+            else:
+                properties = dict(TAG_PROPERTIES.get(tag, {}))
+                properties.update(span_properties(attrs.get('style')))
+            self._inline.append(properties)
+            action = ('inline',)
+
+        if tag not in VOID_TAGS:
+            self._stack.append((tag, action))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        # Close everything up to the matching element, like a browser would
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            open_tag, action = self._stack.pop()
+            self._end_element(open_tag, action)
+
+    def _end_element(self, tag, action):
+        if action is None:
+            return
+        kind = action[0]
+        if kind == 'block':
+            self._end_block()
+        elif kind == 'quote':
+            self._end_block()
+            self._quote_depth -= 1
+        elif kind == 'pre':
+            self._end_block()
+            self._pre_depth -= 1
+        elif kind == 'inline':
+            self._inline.pop()
+        elif kind == 'link':
+            self._close_link()
+            self._links.pop()
+        elif kind == 'list':
+            self._end_list()
+        elif kind == 'item':
+            self._end_item()
+        elif kind == 'table':
+            self._end_table()
+        elif kind == 'frame':
+            self._end_table()
+            self._end_frame(action[1])
+        elif kind == 'row':
+            self._end_row()
+        elif kind == 'cell':
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self._append_text(data)
+
+    def close(self):
+        super().close()
+        while self._stack:
+            tag, action = self._stack.pop()
+            self._end_element(tag, action)
+        self._end_paragraph()
+
+    # Lists
+
+    def _start_list(self, ordered):
+        self._end_paragraph()
+        if not self._in_cell():
+            return None
+        # A list inside a list (without an <li>) still needs an item to live in
+        self._ensure_item()
+        self._emit(f'<text:list text:style-name="{LIST_STYLES[ordered]}">')
+        self._lists.append({'item_open': False})
+        return ('list',)
+
+    def _end_list(self):
+        self._end_paragraph()
+        if self._lists[-1]['item_open']:
+            self._emit('</text:list-item>')
+        self._emit('</text:list>')
+        self._lists.pop()
+
+    def _start_item(self, align):
+        if not self._lists or (self._tables and self._tables[-1]['list_depth'] >= len(self._lists)):
+            return self._start_block(0, align)
+        self._end_paragraph()
+        if self._lists[-1]['item_open']:
+            self._emit('</text:list-item>')
+        self._emit('<text:list-item>')
+        self._lists[-1]['item_open'] = True
+        self._blocks.append({'level': 0, 'align': align})
+        return ('item',)
+
+    def _end_item(self):
+        self._end_paragraph()
+        self._blocks.pop()
+        if self._lists and self._lists[-1]['item_open']:
+            self._emit('</text:list-item>')
+            self._lists[-1]['item_open'] = False
+
+    # Tables and frames
+
+    def _start_table(self, attrs, css, classes):
+        self._end_paragraph()
+        if not self._in_cell():
+            return None
+        self._ensure_item()
+        frame = None
+        if classes & FRAME_TABLE_CLASSES:
+            frame = self._start_frame(css, classes)
+        layout = bool(classes & LAYOUT_TABLE_CLASSES)
+        self._tables.append({
+            'layout': layout, 'columns': 0, 'row_columns': 0, 'row_open': False, 'cell_open': False,
+            'width': css_length_cm(css.get('width') or attrs.get('width')),
+            'list_depth': len(self._lists), 'blocks': len(self._blocks),
+        })
+        if not layout:
+            self._buffers.append([])
+        return ('frame', frame) if frame else ('table',)
+
+    def _start_row(self):
+        if not self._tables:
+            return None
+        table = self._tables[-1]
+        if table['layout']:
+            return None
+        if table['row_open']:
+            self._unwind('row')
+            self._end_row()
+        self._emit('<table:table-row>')
+        table['row_open'] = True
+        table['row_columns'] = 0
+        return ('row',)
+
+    def _end_row(self):
+        table = self._tables[-1]
+        if table['cell_open']:
+            self._end_cell()
+        if table['row_open']:
+            self._emit('</table:table-row>')
+            table['row_open'] = False
+            table['columns'] = max(table['columns'], table['row_columns'])
+
+    def _start_cell(self, tag, attrs, css, align):
+        if not self._tables:
+            return self._start_block(0, align)
+        table = self._tables[-1]
+        if table['layout']:
+            return self._start_block(0, align)
+        if table['cell_open']:
+            self._unwind('cell')
+            self._end_cell()
+        if not table['row_open']:
+            self._emit('<table:table-row>')
+            table['row_open'] = True
+            table['row_columns'] = 0
+        span = attrs.get('colspan', '1')
+        span = max(1, int(span)) if span.isdigit() else 1
+        span_attribute = f' table:number-columns-spanned="{span}"' if span > 1 else ''
+        self._emit(f'<table:table-cell table:style-name="{self._cell_style(css)}" '
+                   f'office:value-type="string"{span_attribute}>')
+        table['cell_open'] = True
+        table['cell_span'] = span
+        table['cell_header'] = tag == 'th'
+        table['row_columns'] += span
+        self._blocks.append({'level': 0, 'align': align})
+        if tag == 'th':
+            self._inline.append({'weight': 'bold'})
+        return ('cell',)
+
+    def _end_cell(self):
+        table = self._tables[-1]
+        if not table['cell_open']:
+            return
+        self._end_paragraph()
+        self._blocks.pop()
+        self._emit('</table:table-cell>' + '<table:covered-table-cell/>' * (table['cell_span'] - 1))
+        table['cell_open'] = False
+        if table['cell_header']:
+            self._inline.pop()
+
+    def _unwind(self, kind):
+        """End the open elements up to and including the innermost one of kind in this table"""
+        for index in range(len(self._stack) - 1, -1, -1):
+            action = self._stack[index][1]
+            if action and action[0] in ('table', 'frame'):
+                return
+            if action and action[0] == kind:
+                break
+        else:
+            return
+        while len(self._stack) > index:
+            tag, action = self._stack.pop()
+            self._end_element(tag, action)
+
+    def _cell_style(self, css):
+        properties = ['fo:padding="0.1cm"']
+        match = BORDER_PATTERN.match(css.get('border', '1px solid #000000'))
+        if match:
+            width = max(0.5, float(match.group(1)) * 0.75)
+            color = css_color(match.group(3)) or '#000000'
+            properties.append(f'fo:border="{width:g}pt {match.group(2)} {color}"')
+        elif css.get('border', '').strip() in ('none', '0', '0px'):
+            properties.append('fo:border="none"')
+        background = css_color(css.get('background-color'))
+        if background:
+            properties.append(f'fo:background-color="{background}"')
+        return self._style("table-cell", "Ce", f'<style:table-cell-properties {" ".join(properties)}/>')
+
+    def _end_table(self):
+        table = self._tables.pop()
+        if table['layout']:
+            self._end_paragraph()
+            del self._blocks[table['blocks']:]
+            return
+        self._tables.append(table)
+        self._end_row()
+        self._tables.pop()
+        rows = self._buffers.pop()
+        columns = max(1, table['columns'])
+        if table['width']:
+            width = min(table['width'], TEXT_WIDTH_CM)
+            properties = f'style:width="{width:.3f}cm" table:align="left"'
+        else:
+            properties = 'table:align="margins"'
+        style = self._style("table", "Ta", f'<style:table-properties {properties}/>')
+        name = self._next_name("Table")
+        self._emit(f'<table:table table:name="{name}" table:style-name="{style}">'
+                   f'<table:table-column table:number-columns-repeated="{columns}"/>')
+        self._emit(''.join(rows))
+        self._emit('</table:table>')
+
+    def _start_frame(self, css, classes):
+        """Open a frame anchored to a paragraph of its own; returns the state to restore"""
+        if 'right-align' in classes:
+            position = 'right'
+        elif 'center-align' in classes:
+            position = 'center'
+        else:
+            position = 'left'
+        wrap = 'none' if 'no-wrap' in classes or 'floating-table' not in classes else 'parallel'
+        style = self._style(
+            "graphic", "fr",
+            f'<style:graphic-properties style:wrap="{wrap}" style:horizontal-pos="{position}" '
+            f'style:horizontal-rel="paragraph" style:vertical-pos="top" style:vertical-rel="paragraph" '
+            f'fo:margin-right="0.2cm" fo:margin-bottom="0.2cm" fo:border="none" fo:padding="0cm"/>')
+        width = min(css_length_cm(css.get('width')) or TEXT_WIDTH_CM / 2, TEXT_WIDTH_CM)
+        self._emit(f'<text:p text:style-name="Standard"><draw:frame draw:style-name="{style}" '
+                   f'draw:name="{self._next_name("Frame")}" text:anchor-type="paragraph" '
+                   f'svg:width="{width:.3f}cm" draw:z-index="0"><draw:text-box fo:min-height="0.5cm">')
+        # The text box starts a fresh block context
+        state = (self._lists, self._quote_depth, self._pre_depth)
+        self._lists, self._quote_depth, self._pre_depth = [], 0, 0
+        return state
+
+    def _end_frame(self, state):
+        self._end_paragraph()
+        self._lists, self._quote_depth, self._pre_depth = state
+        self._emit('</draw:text-box></draw:frame></text:p>')
+
+    # Images
+
+    def _store_picture(self, src):
+        """Add the image behind src to the package; (name, pixel size) or False"""
+        try:
+            image = read_image(src, self._base_dir)
+        except (ValueError, OSError):
+            image = None
+        if image is None:
+            return False
+        data, media_type = image
+        digest = hashlib.sha1(data).hexdigest()
+        name = self._pictures.get(digest)
+        if name is None:
+            extension = mimetypes.guess_extension(media_type) or '.bin'
+            name = self._pictures[digest] = f"Pictures/{digest}{extension}"
+            self._add_picture(name, data, media_type)
+        return name, image_size(data)
+
+    def _image(self, attrs, css):
+        src = attrs.get('src', '')
+        if not src or attrs.get('data-lazy-placeholder') is not None:
+            return
+        picture = self._sources.get(src)
+        if picture is None:
+            picture = self._sources[src] = self._store_picture(src)
+        if picture is False:
+            if attrs.get('alt'):
+                self._append_text(attrs['alt'])
+            return
+        name, natural = picture
+
+        width, height = image_extent_cm(natural, css_length_cm(css.get('width') or attrs.get('width')),
+                                        css_length_cm(css.get('height') or attrs.get('height')))
+
+        if not self._ensure_paragraph():
+            return
+        self._flush_breaks()
+        self._close_link()
+        self._emit(f'<draw:frame draw:style-name="fr_image" draw:name="{self._next_name("Image")}" '
+                   f'text:anchor-type="as-char" svg:width="{width:.3f}cm" svg:height="{height:.3f}cm" '
+                   f'draw:z-index="0"><draw:image xlink:href="{name}" xlink:type="simple" '
+                   f'xlink:show="embed" xlink:actuate="onLoad"/></draw:frame>')
+        self._para_empty = False
+        self._last_space = False
+
+
+def write_odt(html_content, output, title="Document", base_dir=None, chunk_size=64 * 1024):
+    """Write editor HTML to a binary file object as an ODF text document"""
+    pictures = {}
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        # The mimetype comes first and uncompressed so the type can be sniffed
+        archive.writestr(zipfile.ZipInfo("mimetype"), MIMETYPE, compress_type=zipfile.ZIP_STORED)
+
+        def add_picture(name, data, media_type):
+            archive.writestr(zipfile.ZipInfo(name), data, compress_type=zipfile.ZIP_STORED)
+            pictures[name] = media_type
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+', encoding='utf-8') as body:
+            converter = OdtConverter(body.write, add_picture, base_dir)
+            for start in range(0, len(html_content), chunk_size):
+                converter.feed(html_content[start:start + chunk_size])
+            converter.close()
+            body.seek(0)
+            with archive.open("content.xml", 'w') as content:
+                content.write(('<?xml version="1.0" encoding="UTF-8"?>'
+                               f'<office:document-content {NAMESPACES}>'
+                               f'<office:automatic-styles>{converter.automatic_styles()}</office:automatic-styles>'
+                               '<office:body><office:text>').encode('utf-8'))
+                while True:
+                    chunk = body.read(chunk_size)
+                    if not chunk:
+                        break
+                    content.write(chunk.encode('utf-8'))
+                content.write(b'</office:text></office:body></office:document-content>')
+
+        archive.writestr("styles.xml", STYLES_XML)
+        archive.writestr("meta.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<office:document-meta {NAMESPACES}><office:meta>'
+            f'<meta:generator>WebkitWord</meta:generator><dc:title>{xml_text(title)}</dc:title>'
+            '</office:meta></office:document-meta>'))
+        entries = ''.join(f'<manifest:file-entry manifest:full-path="{name}" manifest:media-type="{media_type}"/>'
+                          for name, media_type in pictures.items())
+        archive.writestr("META-INF/manifest.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" '
+            'manifest:version="1.3">'
+            f'<manifest:file-entry manifest:full-path="/" manifest:version="1.3" manifest:media-type="{MIMETYPE}"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            '<manifest:file-entry manifest:full-path="styles.xml" manifest:media-type="text/xml"/>'
+            '<manifest:file-entry manifest:full-path="meta.xml" manifest:media-type="text/xml"/>'
+            f'{entries}</manifest:manifest>'))
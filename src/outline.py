@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# outline.py - heading outline of the document and its navigator sidebar
+#
+# The editor keeps an index of its headings in document order, updated from
+# MutationObserver records, and reports changes to it over the outlineChanged
+# message handler as a JSON list of splices:
+#
+#   {"i": 4, "d": 1, "a": [[2, "Results"]]}   entries[4:5] = [(2, "Results")]
+#   {"r": true, "a": [[1, "Intro"], ...]}     entries = a
+#
+# Each splice is applied to the window's Gtk.StringList as it comes, so the
+# work per edit follows the size of the edit, not of the document.
+import json
+from gi.repository import Gtk, Pango
+
+# Outline entries are stored as the heading level followed by its text, and
+# indented by this many pixels per level
+OUTLINE_INDENT = 12
+
+
+def create_outline_sidebar(self, win):
+    """Create the outline sidebar, hidden until toggled"""
+    win.outline_store = Gtk.StringList()
+
+    factory = Gtk.SignalListItemFactory()
+    factory.connect("setup", _on_outline_item_setup)
+    factory.connect("bind", _on_outline_item_bind)
+
+    list_view = Gtk.ListView(model=Gtk.NoSelection(model=win.outline_store), factory=factory)
+    list_view.set_single_click_activate(True)
+    list_view.add_css_class("navigation-sidebar")
+    list_view.connect("activate", lambda view, position: self.on_outline_activated(win, position))
+
+    scrolled = Gtk.ScrolledWindow()
+    scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+    scrolled.set_size_request(220, -1)
+    scrolled.set_vexpand(True)
+    scrolled.set_child(list_view)
+
+    win.outline_revealer = Gtk.Revealer()
+    win.outline_revealer.set_transition_type(Gtk.RevealerTransitionType.SLIDE_RIGHT)
+    win.outline_revealer.set_transition_duration(250)
+    win.outline_revealer.set_reveal_child(False)  # Hidden by default
+    win.outline_revealer.set_child(scrolled)
+    return win.outline_revealer
+
+
+def _on_outline_item_setup(factory, list_item):
+    label = Gtk.Label(xalign=0)
+    label.set_ellipsize(Pango.EllipsizeMode.END)
+    label.set_margin_top(4)
+    label.set_margin_bottom(4)
+    list_item.set_child(label)
+
+
+def _on_outline_item_bind(factory, list_item):
+    label = list_item.get_child()
+    entry = list_item.get_item().get_string()
+    level = int(entry[0])
+    label.set_text(entry[1:] or "(empty heading)")
+    label.set_margin_start(6 + (level - 1) * OUTLINE_INDENT)
+    label.set_css_classes(["heading"] if level == 1 else [])
+
+
+def on_outline_changed(self, win, manager, result):
+    """Apply the splices of an outline change message to the window's outline"""
+    store = getattr(win, 'outline_store', None)
+    if store is None:
+        return
+    try:
+        if hasattr(result, 'get_js_value'):
+            message = result.get_js_value().to_string()
+        else:
+            message = result.to_string()
+        changes = json.loads(message)
+    except Exception as e:
+        print(f"Invalid outline change: {e}")
+        return
+
+    for change in changes:
+        entries = [f"{level}{text}" for level, text in change['a']]
+        if change.get('r'):
+            store.splice(0, store.get_n_items(), entries)
+        else:
+            store.splice(change['i'], change['d'], entries)
+
+
+def on_outline_activated(self, win, position):
+    """Move the caret to a heading picked in the outline"""
+    self.execute_js(win, f"scrollToOutlineHeading({int(position)});")
+    win.webview.grab_focus()
+
+
+def toggle_outline(self, win, *args):
+    """Toggle the visibility of the outline sidebar"""
+    is_revealed = win.outline_revealer.get_reveal_child()
+    win.outline_revealer.set_reveal_child(not is_revealed)
+    status = "hidden" if is_revealed else "shown"
+    win.statusbar.set_text(f"Outline {status}")
+    win.webview.grab_focus()
+    return True
+
+
+def on_toggle_outline_action(self, action, param):
+    """Handle toggle outline action"""
+    active_win = self.get_active_window()
+    if active_win:
+        self.toggle_outline(active_win)
+
+
+def outline_js(self):
+    """JavaScript that keeps an index of the editor's headings"""
+    return """
+    const OUTLINE_HEADINGS = 'h1, h2, h3, h4, h5, h6';
+    // Spacing of the sort keys given to headings; see outlineInsert
+    const OUTLINE_KEY_STEP = 1024;
+
+    // Headings in document order, each with a sort key that only grows along
+    // the list, so a heading that has left the document can still be found
+    // by binary search
+    const outlineState = {
+        headings: [],
+        keys: new Map(),
+        texts: new Map(),
+        records: [],
+        pending: false
+    };
+
+    function outlineText(heading) {
+        return heading.textContent.replace(/\\s+/g, ' ').trim().slice(0, 200);
+    }
+
+    function outlineEntry(heading) {
+        return [Number(heading.tagName.charAt(1)), outlineState.texts.get(heading)];
+    }
+
+    function outlineHeadingsIn(node, found) {
+        if (node.nodeType !== Node.ELEMENT_NODE) return;
+        if (node.matches(OUTLINE_HEADINGS)) found.add(node);
+        node.querySelectorAll(OUTLINE_HEADINGS).forEach(function(heading) { found.add(heading); });
+    }
+
+    function outlinePost(changes) {
+        try {
+            window.webkit.messageHandlers.outlineChanged.postMessage(JSON.stringify(changes));
+        } catch (e) {
+            console.log("Could not send outline changes:", e);
+        }
+    }
+
+    function outlineIndexOfKey(key) {
+        const headings = outlineState.headings;
+        let low = 0;
+        let high = headings.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            if (outlineState.keys.get(headings[middle]) < key) low = middle + 1;
+            else high = middle;
+        }
+        return low;
+    }
+
+    function outlineReset(editor) {
+        outlineState.headings = Array.from(editor.querySelectorAll(OUTLINE_HEADINGS));
+        outlineState.keys = new Map();
+        outlineState.texts = new Map();
+        outlineState.headings.forEach(function(heading, index) {
+            outlineState.keys.set(heading, (index + 1) * OUTLINE_KEY_STEP);
+            outlineState.texts.set(heading, outlineText(heading));
+        });
+        return { r: true, a: outlineState.headings.map(outlineEntry) };
+    }
+
+    function outlineRemove(heading) {
+        const index = outlineIndexOfKey(outlineState.keys.get(heading));
+        outlineState.headings.splice(index, 1);
+        outlineState.keys.delete(heading);
+        outlineState.texts.delete(heading);
+        return { i: index, d: 1, a: [] };
+    }
+
+    // All headings in the list must be in the document for the search to work
+    function outlineInsert(heading) {
+        const headings = outlineState.headings;
+        let low = 0;
+        let high = headings.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            if (headings[middle].compareDocumentPosition(heading) & Node.DOCUMENT_POSITION_FOLLOWING) low = middle + 1;
+            else high = middle;
+        }
+        const before = low > 0 ? outlineState.keys.get(headings[low - 1]) : 0;
+        const after = low < headings.length ? outlineState.keys.get(headings[low]) : before + 2 * OUTLINE_KEY_STEP;
+        const key = (before + after) / 2;
+        headings.splice(low, 0, heading);
+        if (key <= before || key >= after) {
+            // No room left between the neighbours: space all keys out again
+            headings.forEach(function(current, index) {
+                outlineState.keys.set(current, (index + 1) * OUTLINE_KEY_STEP);
+            });
+        } else {
+            outlineState.keys.set(heading, key);
+        }
+        outlineState.texts.set(heading, outlineText(heading));
+        return { i: low, d: 0, a: [outlineEntry(heading)] };
+    }
+
+    function outlineProcessRecords() {
+        outlineState.pending = false;
+        const editor = document.getElementById('editor');
+        const records = outlineState.records;
+        outlineState.records = [];
+
+        const removed = new Set();
+        const added = new Set();
+        const touched = new Set();
+        records.forEach(function(record) {
+            record.removedNodes.forEach(function(node) { outlineHeadingsIn(node, removed); });
+            record.addedNodes.forEach(function(node) { outlineHeadingsIn(node, added); });
+            const target = record.target.nodeType === Node.ELEMENT_NODE ? record.target : record.target.parentElement;
+            const heading = target && target.closest(OUTLINE_HEADINGS);
+            if (heading) touched.add(heading);
+        });
+
+        const changes = [];
+        // Headings still in the document after being removed have moved
+        removed.forEach(function(heading) {
+            if (!outlineState.keys.has(heading)) return;
+            changes.push(outlineRemove(heading));
+            if (editor.contains(heading)) added.add(heading);
+        });
+        touched.forEach(function(heading) {
+            if (!outlineState.keys.has(heading)) return;
+            if (!editor.contains(heading)) {
+                changes.push(outlineRemove(heading));
+            }
+        });
+
+        // Replacing most of the document, as setContent and undo do, is
+        // cheaper to send as a new outline
+        if (added.size > outlineState.headings.length) {
+            outlinePost([outlineReset(editor)]);
+            return;
+        }
+
+        added.forEach(function(heading) {
+            if (editor.contains(heading) && !outlineState.keys.has(heading)) {
+                changes.push(outlineInsert(heading));
+            }
+        });
+        touched.forEach(function(heading) {
+            if (!outlineState.keys.has(heading)) return;
+            const text = outlineText(heading);
+            if (text === outlineState.texts.get(heading)) return;
+            outlineState.texts.set(heading, text);
+            const index = outlineIndexOfKey(outlineState.keys.get(heading));
+            changes.push({ i: index, d: 1, a: [outlineEntry(heading)] });
+        });
+
+        if (changes.length > 0) outlinePost(changes);
+    }
+
+    function setupOutline(editor) {
+        new MutationObserver(function(records) {
+            outlineState.records.push.apply(outlineState.records, records);
+            if (outlineState.pending) return;
+            outlineState.pending = true;
+            scheduleIdle(outlineProcessRecords);
+        }).observe(editor, { childList: true, subtree: true, characterData: true });
+        outlinePost([outlineReset(editor)]);
+    }
+
+    function scrollToOutlineHeading(index) {
+        const heading = outlineState.headings[index];
+        if (!heading || !heading.isConnected) return;
+        heading.scrollIntoView({ block: 'start' });
+        const range = document.createRange();
+        range.selectNodeContents(heading);
+        range.collapse(true);
+        const selection = window.getSelection();
+        selection.removeAllRanges();
+        selection.addRange(range);
+        document.getElementById('editor').focus();
+    }
+    """
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# pagination.py - page count, current page and page breaks while editing
+#
+# The editor measures each top-level block once at the width of the page's
+# printable area, in a hidden copy outside #editor, and keeps the heights until
+# the block changes. Page breaks are then found by filling pages block by
+# block: from the first block whose height changed, and only until the breaks
+# fall where they did before. Blocks no taller than PAGINATION_KEEP_HEIGHT are
+# moved whole to the next page; taller ones are split, as printing splits them
+# between lines.
+#
+# The page count and the page holding the caret are sent over the pagination
+# message handler as {"pages": N, "current": N}. Printing reuses the breaks
+# that fall between blocks through applyPrintPageBreaks.
+import json
+from gi.repository import Gtk
+
+# CSS pixels per point
+PX_PER_PT = 96 / 72
+
+
+def get_page_geometry(self, win):
+    """Width and height of the printable area of the window's pages, in CSS pixels"""
+    page_setup = getattr(win, 'page_setup', None) or self.default_page_setup
+    width = page_setup.get_page_width(Gtk.Unit.POINTS) * PX_PER_PT
+    height = page_setup.get_page_height(Gtk.Unit.POINTS) * PX_PER_PT
+    return width, height
+
+
+def apply_page_geometry(self, win):
+    """Paginate the editor for the window's current page setup"""
+    width, height = self.get_page_geometry(win)
+    self.execute_js(win, f"setPageGeometry({width:.2f}, {height:.2f});")
+
+
+def on_pagination_changed(self, win, manager, result):
+    """Keep the page count and current page reported by the editor"""
+    try:
+        if hasattr(result, 'get_js_value'):
+            message = result.get_js_value().to_string()
+        else:
+            message = result.to_string()
+        pages = json.loads(message)
+    except Exception as e:
+        print(f"Invalid pagination message: {e}")
+        return
+
+    win.page_count = pages['pages']
+    win.current_page = pages['current']
+    self.update_stats_label(win)
+
+
+def toggle_page_guides(self, win, *args):
+    """Show or hide the page break guides in the editor"""
+    win.page_guides = not getattr(win, 'page_guides', False)
+    self.execute_js(win, f"setPageGuides({'true' if win.page_guides else 'false'});")
+    win.statusbar.set_text(f"Page breaks {'shown' if win.page_guides else 'hidden'}")
+    win.webview.grab_focus()
+    return True
+
+
+def on_toggle_page_guides_action(self, action, param):
+    """Handle toggle page breaks action"""
+    active_win = self.get_active_window()
+    if active_win:
+        self.toggle_page_guides(active_win)
+
+
+def pagination_js(self):
+    """JavaScript that paginates the editor content incrementally"""
+    return """
+    // Blocks up to this height (about three lines) are never split across pages
+    const PAGINATION_KEEP_HEIGHT = 64;
+    const PAGINATION_SLICE_MS = 8;
+
+    const paginationState = {
+        // Printable area of a page, A4 with 1in margins until told otherwise
+        width: 601.7,
+        height: 930.5,
+        blocks: [],          // editor children as of the last pagination
+        metrics: new Map(),  // block -> {top, height, bottom} at the page width
+        pageAt: [],          // page on which each block starts
+        yAt: [],             // height used on that page before the block
+        changed: new Set(),  // blocks whose metrics changed since then
+        dirty: new Set(),    // blocks to measure
+        pages: 1,
+        current: 1,
+        pending: false,
+        reportPending: false,
+        guides: false,
+        measure: null,
+        lastReport: ''
+    };
+
+    function paginationMeasure(deadline) {
+        const editor = document.getElementById('editor');
+        const measure = paginationState.measure;
+        measure.className = editor.className;
+        measure.style.width = paginationState.width + 'px';
+
+        const nodes = [];
+        for (const node of paginationState.dirty) {
+            paginationState.dirty.delete(node);
+            if (node.parentNode !== editor) {
+                paginationState.metrics.delete(node);
+                continue;
+            }
+            const clone = node.cloneNode(true);
+            // Keep the rendered size of images without loading them again
+            const images = node.querySelectorAll('img');
+            clone.querySelectorAll('img').forEach(function(image, index) {
+                const live = images[index];
+                image.removeAttribute('src');
+                image.removeAttribute('srcset');
+                if (live && !image.getAttribute('height')) image.style.height = live.offsetHeight + 'px';
+                if (live && !image.getAttribute('width')) image.style.width = live.offsetWidth + 'px';
+            });
+            measure.appendChild(clone);
+            nodes.push(node);
+            if (performance.now() > deadline) break;
+        }
+
+        const clones = Array.from(measure.children);
+        clones.forEach(function(clone, index) {
+            const style = window.getComputedStyle(clone);
+            const metric = {
+                top: parseFloat(style.marginTop) || 0,
+                height: clone.offsetHeight,
+                bottom: parseFloat(style.marginBottom) || 0
+            };
+            const node = nodes[index];
+            const previous = paginationState.metrics.get(node);
+            if (!previous || previous.top !== metric.top || previous.height !== metric.height ||
+                previous.bottom !== metric.bottom) {
+                paginationState.metrics.set(node, metric);
+                paginationState.changed.add(node);
+            }
+        });
+        measure.textContent = '';
+    }
+
+    // Place a block on the pages; returns the page and used height after it
+    function paginationPlace(page, y, previous, metric) {
+        const pageHeight = paginationState.height;
+        metric = metric || { top: 0, height: 0, bottom: 0 };
+        const gap = y > 0 ? Math.max(previous ? previous.bottom : 0, metric.top) : 0;
+        const end = y + gap + metric.height;
+        if (end <= pageHeight) return [page, end];
+        if (y > 0 && metric.height <= PAGINATION_KEEP_HEIGHT) return [page + 1, metric.height];
+        const extra = Math.ceil((end - pageHeight) / pageHeight);
+        return [page + extra, end - extra * pageHeight];
+    }
+
+    function paginationBreak() {
+        const state = paginationState;
+        const current = Array.from(document.getElementById('editor').children);
+        const old = state.blocks;
+        const n = current.length;
+        const m = old.length;
+
+        let first = 0;
+        while (first < n && first < m && current[first] === old[first] && !state.changed.has(current[first])) first++;
+        let suffix = 0;
+        while (suffix < n - first && suffix < m - first &&
+               current[n - 1 - suffix] === old[m - 1 - suffix] && !state.changed.has(current[n - 1 - suffix])) suffix++;
+        state.changed.clear();
+
+        const pageAt = state.pageAt.slice(0, first);
+        const yAt = state.yAt.slice(0, first);
+        let page = 0;
+        let y = 0;
+        if (first > 0) {
+            [page, y] = paginationPlace(pageAt[first - 1], yAt[first - 1],
+                                        first > 1 ? state.metrics.get(current[first - 2]) : null,
+                                        state.metrics.get(current[first - 1]));
+        }
+        const delta = n - m;
+        let i = first;
+        for (; i < n; i++) {
+            // Past the change, the breaks repeat once a block starts where it did
+            // after the same block as before
+            if (i >= n - suffix && y === state.yAt[i - delta] &&
+                (i === 0 || current[i - 1] === old[i - 1 - delta])) break;
+            pageAt.push(page);
+            yAt.push(y);
+            [page, y] = paginationPlace(page, y, i > 0 ? state.metrics.get(current[i - 1]) : null,
+                                        state.metrics.get(current[i]));
+        }
+        let pages = page + 1;
+        if (i < n) {
+            // The rest only moves by whole pages
+            const shift = page - state.pageAt[i - delta];
+            for (let j = i - delta; j < m; j++) {
+                pageAt.push(state.pageAt[j] + shift);
+                yAt.push(state.yAt[j]);
+            }
+            pages = state.pages + shift;
+        }
+
+        state.blocks = current;
+        state.pageAt = pageAt;
+        state.yAt = yAt;
+        state.pages = pages;
+    }
+
+    function paginationCaretPage() {
+        const state = paginationState;
+        const selection = window.getSelection();
+        if (selection.rangeCount === 0 || state.blocks.length === 0) return state.current;
+        const editor = document.getElementById('editor');
+        let node = selection.getRangeAt(0).startContainer;
+        while (node && node.parentNode !== editor) node = node.parentNode;
+        if (!node || node.nodeType !== Node.ELEMENT_NODE) return state.current;
+
+        let low = 0;
+        let high = state.blocks.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            if (state.blocks[middle].compareDocumentPosition(node) & Node.DOCUMENT_POSITION_FOLLOWING) low = middle + 1;
+            else high = middle;
+        }
+        if (state.blocks[low] !== node) return state.current;
+
+        // Where the caret sits within the block, scaled to the page width
+        const metric = state.metrics.get(node);
+        const blockRect = node.getBoundingClientRect();
+        const caretRect = selection.getRangeAt(0).getBoundingClientRect();
+        let offset = 0;
+        if (metric && blockRect.height > 0 && caretRect.height > 0) {
+            offset = Math.max(0, caretRect.top - blockRect.top) * metric.height / blockRect.height;
+        }
+        const previous = low > 0 ? state.metrics.get(state.blocks[low - 1]) : null;
+        const page = paginationPlace(state.pageAt[low], state.yAt[low], previous,
+                                     { top: metric ? metric.top : 0, height: offset, bottom: 0 })[0];
+        return page + 1;
+    }
+
+    function paginationReport() {
+        paginationState.reportPending = false;
+        paginationState.current = Math.min(paginationCaretPage(), paginationState.pages);
+        const message = JSON.stringify({ pages: paginationState.pages, current: paginationState.current });
+        if (message === paginationState.lastReport) return;
+        paginationState.lastReport = message;
+        try {
+            window.webkit.messageHandlers.pagination.postMessage(message);
+        } catch (e) {
+            console.log("Could not send pagination:", e);
+        }
+    }
+
+    function paginationUpdate() {
+        paginationMeasure(performance.now() + PAGINATION_SLICE_MS);
+        if (paginationState.dirty.size > 0) {
+            scheduleIdle(paginationUpdate);
+            return;
+        }
+        paginationState.pending = false;
+        paginationBreak();
+        paginationReport();
+        if (paginationState.guides) drawPageGuides();
+    }
+
+    function paginationSchedule() {
+        if (paginationState.pending) return;
+        paginationState.pending = true;
+        scheduleIdle(paginationUpdate);
+    }
+
+    function paginationMarkDirty(records) {
+        const editor = document.getElementById('editor');
+        records.forEach(function(record) {
+            if (record.target === editor) {
+                record.addedNodes.forEach(function(node) {
+                    if (node.nodeType === Node.ELEMENT_NODE) paginationState.dirty.add(node);
+                });
+                record.removedNodes.forEach(function(node) { paginationState.metrics.delete(node); });
+                return;
+            }
+            let node = record.target;
+            while (node && node.parentNode !== editor) node = node.parentNode;
+            if (node && node.nodeType === Node.ELEMENT_NODE) paginationState.dirty.add(node);
+        });
+        paginationSchedule();
+    }
+
+    // Breaks of the last pagination as [block index, offset into the block]
+    // in page-width pixels; an offset of 0 breaks before the block
+    function getPageBreaks() {
+        const state = paginationState;
+        const breaks = [];
+        for (let i = 0; i < state.blocks.length; i++) {
+            const nextPage = i + 1 < state.blocks.length ? state.pageAt[i + 1] : state.pages - 1;
+            if (nextPage === state.pageAt[i] && i + 1 < state.blocks.length) continue;
+            const metric = state.metrics.get(state.blocks[i]);
+            if (!metric) continue;
+            const previous = i > 0 ? state.metrics.get(state.blocks[i - 1]) : null;
+            const y = state.yAt[i];
+            const gap = y > 0 ? Math.max(previous ? previous.bottom : 0, metric.top) : 0;
+            if (y > 0 && y + gap + metric.height > state.height && metric.height <= PAGINATION_KEEP_HEIGHT) {
+                breaks.push([i, 0]);
+                continue;
+            }
+            let offset = state.height - y - gap;
+            for (let page = state.pageAt[i]; page < nextPage; page++) {
+                breaks.push([i, offset]);
+                offset += state.height;
+            }
+        }
+        return breaks;
+    }
+
+    function drawPageGuides() {
+        let layer = document.getElementById('page-guides');
+        if (!layer) {
+            layer = document.createElement('div');
+            layer.id = 'page-guides';
+            layer.setAttribute('aria-hidden', 'true');
+            document.body.appendChild(layer);
+        }
+        layer.textContent = '';
+        if (!paginationState.guides) return;
+        const editor = document.getElementById('editor');
+        const editorTop = editor.getBoundingClientRect().top + window.scrollY;
+        const fragment = document.createDocumentFragment();
+        getPageBreaks().forEach(function(pageBreak, index) {
+            const block = paginationState.blocks[pageBreak[0]];
+            const metric = paginationState.metrics.get(block);
+            if (!block.isConnected || !metric) return;
+            const rect = block.getBoundingClientRect();
+            const scale = metric.height > 0 ? rect.height / metric.height : 1;
+            const guide = document.createElement('div');
+            guide.className = 'page-guide';
+            guide.style.top = (rect.top + window.scrollY - editorTop + pageBreak[1] * scale) + 'px';
+            guide.textContent = 'Page ' + (index + 2);
+            fragment.appendChild(guide);
+        });
+        layer.style.top = editorTop + 'px';
+        layer.appendChild(fragment);
+    }
+
+    function setPageGuides(enabled) {
+        paginationState.guides = enabled;
+        drawPageGuides();
+    }
+
+    function setPageGeometry(width, height) {
+        if (width === paginationState.width && height === paginationState.height) return;
+        paginationState.width = width;
+        paginationState.height = height;
+        // Every block wraps differently at the new width
+        paginationState.metrics = new Map();
+        paginationState.blocks = [];
+        Array.from(document.getElementById('editor').children).forEach(function(node) {
+            paginationState.dirty.add(node);
+        });
+        paginationSchedule();
+    }
+
+    // Make printing break before the blocks the pagination moved to a new page
+    function applyPrintPageBreaks() {
+        let style = document.getElementById('print-page-breaks');
+        if (!style) {
+            style = document.createElement('style');
+            style.id = 'print-page-breaks';
+            document.head.appendChild(style);
+        }
+        const selectors = getPageBreaks().filter(function(pageBreak) {
+            return pageBreak[1] === 0;
+        }).map(function(pageBreak) {
+            return '#editor > :nth-child(' + (pageBreak[0] + 1) + ')';
+        });
+        style.textContent = selectors.length ?
+            '@media print { ' + selectors.join(', ') + ' { break-before: page; } }' : '';
+    }
+
+    function clearPrintPageBreaks() {
+        const style = document.getElementById('print-page-breaks');
+        if (style) style.textContent = '';
+    }
+
+    function setupPagination(editor) {
+        paginationState.measure = document.createElement('div');
+        paginationState.measure.id = 'page-measure';
+        paginationState.measure.setAttribute('aria-hidden', 'true');
+        document.body.appendChild(paginationState.measure);
+        new MutationObserver(paginationMarkDirty).observe(editor, {
+            childList: true, subtree: true, characterData: true, attributes: true
+        });
+        Array.from(editor.children).forEach(function(node) { paginationState.dirty.add(node); });
+        document.addEventListener('selectionchange', function() {
+            if (paginationState.pending || paginationState.reportPending) return;
+            paginationState.reportPending = true;
+            scheduleIdle(paginationReport);
+        });
+        window.addEventListener('resize', function() {
+            if (paginationState.guides) scheduleIdle(drawPageGuides);
+        });
+        paginationSchedule();
+    }
+    """
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# pdf_render.py - headless PDF rendering from the command line
+#
+#   webkitword --pdf IN OUT [--pdf IN OUT ...] [--paper a4] [--margins 20mm]
+#              [--landscape] [--jobs N]
+#
+# Documents are rendered by a pool of WebViews in windows that are never
+# shown. HTML files are loaded directly; other formats are converted to HTML
+# in a worker thread the same way batch conversion does. Every WebView prints
+# its document through print_webview_to_pdf as soon as it has loaded, so up to
+# --jobs documents are laid out and printed at once.
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from collections import deque
+
+import gi
+gi.require_version('Gtk', '4.0')
+gi.require_version('WebKit', '6.0')
+from gi.repository import Gtk, GLib, Gio, WebKit
+
+import file_operations
+
+PAPER_SIZES = {
+    "a3": Gtk.PAPER_NAME_A3,
+    "a4": Gtk.PAPER_NAME_A4,
+    "a5": Gtk.PAPER_NAME_A5,
+    "letter": Gtk.PAPER_NAME_LETTER,
+    "legal": Gtk.PAPER_NAME_LEGAL,
+}
+
+# Points per unit accepted by --margins
+MARGIN_UNITS = {"pt": 1.0, "mm": 72 / 25.4, "cm": 72 / 2.54, "in": 72.0}
+
+DEFAULT_MARGIN = "20mm"
+
+# Layout width of the hidden WebViews
+RENDER_WIDTH = 800
+RENDER_HEIGHT = 1100
+
+
+def parse_margins(value):
+    """
+    Parse --margins: one length for all sides or top,right,bottom,left
+
+    Lengths take a unit of pt, mm, cm or in (default mm). Returns a tuple of
+    four margins in points.
+    """
+    lengths = []
+    for part in value.split(","):
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(pt|mm|cm|in)?\s*", part)
+        if not match:
+            raise argparse.ArgumentTypeError(f"invalid margin: {part!r}")
+        lengths.append(float(match.group(1)) * MARGIN_UNITS[match.group(2) or "mm"])
+    if len(lengths) == 1:
+        return tuple(lengths * 4)
+    if len(lengths) == 4:
+        return tuple(lengths)
+    raise argparse.ArgumentTypeError("margins take one value or four (top,right,bottom,left)")
+
+
+def build_page_setup(paper, landscape, margins):
+    page_setup = Gtk.PageSetup.new()
+    page_setup.set_paper_size(Gtk.PaperSize.new(PAPER_SIZES[paper]))
+    page_setup.set_orientation(Gtk.PageOrientation.LANDSCAPE if landscape
+                               else Gtk.PageOrientation.PORTRAIT)
+    top, right, bottom, left = margins
+    page_setup.set_top_margin(top, Gtk.Unit.POINTS)
+    page_setup.set_right_margin(right, Gtk.Unit.POINTS)
+    page_setup.set_bottom_margin(bottom, Gtk.Unit.POINTS)
+    page_setup.set_left_margin(left, Gtk.Unit.POINTS)
+    return page_setup
+
+
+class RenderSlot:
+    """A hidden WebView that renders one document at a time"""
+
+    def __init__(self, renderer):
+        self.renderer = renderer
+        self.job = None
+        self.webview = WebKit.WebView()
+        self.webview.set_size_request(RENDER_WIDTH, RENDER_HEIGHT)
+        # The window is never presented; it only gives the WebView a toplevel
+        self.window = Gtk.Window()
+        self.window.set_default_size(RENDER_WIDTH, RENDER_HEIGHT)
+        self.window.set_child(self.webview)
+        self.webview.connect("load-changed", self.on_load_changed)
+        self.webview.connect("load-failed", self.on_load_failed)
+
+    def start(self, job):
+        self.job = job
+        job["started"] = time.monotonic()
+        input_path = job["input"]
+        base_uri = Gio.File.new_for_path(os.path.dirname(os.path.abspath(input_path)) + os.sep).get_uri()
+
+        if os.path.splitext(input_path)[1].lower() in (".html", ".htm"):
+            self.webview.load_uri(Gio.File.new_for_path(os.path.abspath(input_path)).get_uri())
+            return
+
+        def convert():
+            import batch_convert
+            try:
+                html = file_operations.wrap_html_document(batch_convert.document_to_html(input_path))
+                GLib.idle_add(self._load_html, job, html, base_uri)
+            except Exception as e:
+                GLib.idle_add(self._finish, job, str(e))
+
+        threading.Thread(target=convert, daemon=True).start()
+
+    def _load_html(self, job, html, base_uri):
+        if self.job is job:
+            self.webview.load_html(html, base_uri)
+        return False
+
+    def on_load_changed(self, webview, event):
+        if event != WebKit.LoadEvent.FINISHED or self.job is None or self.job.get("printing"):
+            return
+        job = self.job
+        job["printing"] = True
+        try:
+            file_operations.print_webview_to_pdf(
+                webview, job["output"], self.renderer.page_setup,
+                lambda error: self._finish(job, error))
+        except Exception as e:
+            self._finish(job, str(e))
+
+    def on_load_failed(self, webview, event, uri, error):
+        if self.job is not None:
+            self._finish(self.job, error.message)
+        return True
+
+    def _finish(self, job, error):
+        if self.job is job:
+            self.job = None
+            self.renderer.job_done(self, job, error)
+        return False
+
+
+class PdfRenderer:
+    """Feed (input, output) jobs through a pool of RenderSlots"""
+
+    def __init__(self, jobs, page_setup, concurrency):
+        self.queue = deque(jobs)
+        self.total = len(jobs)
+        self.page_setup = page_setup
+        self.slots = [RenderSlot(self) for _ in range(max(1, min(concurrency, len(jobs))))]
+        self.done = 0
+        self.failed = 0
+        self.loop = GLib.MainLoop()
+
+    def run(self):
+        for slot in self.slots:
+            self._start_next(slot)
+        if self.done < self.total:
+            self.loop.run()
+
+    def _start_next(self, slot):
+        if self.queue:
+            slot.start(self.queue.popleft())
+
+    def job_done(self, slot, job, error):
+        self.done += 1
+        seconds = time.monotonic() - job["started"]
+        prefix = f"[{self.done}/{self.total}]"
+        if error:
+            self.failed += 1
+            print(f"{prefix} FAILED {job['input']}: {error} ({seconds:.2f}s)", file=sys.stderr)
+        else:
+            size = os.path.getsize(job["output"])
+            print(f"{prefix} {job['input']} -> {job['output']} "
+                  f"({GLib.format_size(size)}, {seconds:.2f}s)")
+        self._start_next(slot)
+        if self.done == self.total:
+            self.loop.quit()
+
+
+def main(argv):
+    """Entry point for webkitword --pdf; returns the process exit status"""
+    parser = argparse.ArgumentParser(
+        prog="webkitword",
+        description="Render documents to PDF without opening the editor.")
+    parser.add_argument("--pdf", nargs=2, action="append", required=True, metavar=("IN", "OUT"),
+                        help="document to render and the PDF to write; may be repeated")
+    parser.add_argument("--paper", choices=sorted(PAPER_SIZES), default="a4",
+                        help="paper size (default: a4)")
+    parser.add_argument("--margins", type=parse_margins, default=parse_margins(DEFAULT_MARGIN),
+                        help="page margins, e.g. 20mm or 1in,0.75in,1in,0.75in (default: 20mm)")
+    parser.add_argument("--landscape", action="store_true", help="landscape orientation")
+    parser.add_argument("--jobs", type=int, default=min(4, os.cpu_count() or 1),
+                        help="number of documents rendered at once (default: up to 4)")
+    args = parser.parse_args(argv)
+
+    supported = set(file_operations.get_all_supported_extensions())
+    jobs = []
+    for input_path, output_path in args.pdf:
+        if not os.path.isfile(input_path):
+            print(f"Skipping {input_path}: file not found", file=sys.stderr)
+        elif os.path.splitext(input_path)[1].lower() not in supported:
+            print(f"Skipping {input_path}: unsupported format", file=sys.stderr)
+        else:
+            output_dir = os.path.dirname(os.path.abspath(output_path))
+            os.makedirs(output_dir, exist_ok=True)
+            jobs.append({"input": input_path, "output": output_path})
+    if not jobs:
+        return 1
+
+    Gtk.init()
+    started = time.monotonic()
+    renderer = PdfRenderer(jobs, build_page_setup(args.paper, args.landscape, args.margins), args.jobs)
+    renderer.run()
+
+    elapsed = max(time.monotonic() - started, 1e-9)
+    rendered = renderer.total - renderer.failed
+    print(f"Rendered {rendered} of {len(jobs)} files in {elapsed:.2f}s with "
+          f"{len(renderer.slots)} views: {rendered / elapsed:.2f} files/s")
+    return 0 if renderer.failed == 0 else 1
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# session_journal.py - per-window journal of unsaved editor changes
+#
+# Every window owns a session in $XDG_DATA_HOME/webkitword/sessions/<id>/:
+#
+#   snapshot.json   {"seq": N, "blocks": [...]}  top-level editor nodes as HTML
+#   journal.jsonl   one change record per line, applied in order on top of
+#                   the snapshot
+#   meta.json       title, file path, owning pid and whether the session holds
+#                   changes that were never saved
+#
+# A change record replaces a run of top-level blocks:
+#
+#   {"seq": 7, "i": 3, "d": 1, "a": ["<p>new</p>"]}   blocks[3:4] = a
+#   {"seq": 8, "r": true, "a": [...]}                 blocks = a
+#
+# so autosave writes only the blocks that changed. Once the journal grows
+# larger than the snapshot it is folded into a new snapshot. Records at or
+# below the snapshot's seq are skipped on replay, which keeps a crash between
+# writing the snapshot and truncating the journal harmless.
+import os
+import json
+import time
+import uuid
+import shutil
+import tempfile
+
+# Never compact journals smaller than this, however small the snapshot is
+COMPACT_MIN_BYTES = 256 * 1024
+
+
+def get_sessions_dir():
+    """Root directory of the session journals"""
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(data_home, "webkitword", "sessions")
+
+
+def _write_json_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OverflowError, TypeError):
+        return True
+    return True
+
+
+def apply_record(blocks, record):
+    """Apply one change record to a list of blocks in place"""
+    if record.get("r"):
+        blocks[:] = record["a"]
+    else:
+        start = record["i"]
+        blocks[start:start + record["d"]] = record["a"]
+
+
+class SessionJournal:
+    """
+    Journal of one window's unsaved changes
+
+    Not thread-safe; each window drives its journal from its single save worker.
+    """
+
+    def __init__(self, session_id=None, sessions_dir=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.path = os.path.join(sessions_dir or get_sessions_dir(), self.session_id)
+        self._seq = None
+        self._meta = None
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.path, "snapshot.json")
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.path, "journal.jsonl")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            return snapshot.get("seq", 0), snapshot.get("blocks", [])
+        except (OSError, ValueError):
+            return 0, []
+
+    def _read_records(self):
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Torn by a crash or failed write; a reset record follows it
+                        continue
+        except FileNotFoundError:
+            return
+
+    def replay(self):
+        """
+        Rebuild the document from the snapshot and the journal
+
+        Returns:
+            Tuple of (last applied seq, list of blocks)
+        """
+        seq, blocks = self._load_snapshot()
+        for record in self._read_records():
+            if record.get("seq", 0) <= seq:
+                continue
+            apply_record(blocks, record)
+            seq = record["seq"]
+        return seq, blocks
+
+    def get_html(self):
+        """Editor HTML recorded by the session"""
+        return "".join(self.replay()[1])
+
+    def append(self, record):
+        """
+        Append a change record (without "seq", which is assigned here)
+
+        Returns:
+            Number of bytes written
+        """
+        os.makedirs(self.path, exist_ok=True)
+        if self._seq is None:
+            self._seq = self.replay()[0]
+        self._seq += 1
+        line = json.dumps(dict(record, seq=self._seq), separators=(",", ":")) + "\n"
+        data = line.encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            # Keep records on their own lines after a torn append
+            if f.tell() > 0 and not self._ends_with_newline():
+                data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return len(data)
+
+    def _ends_with_newline(self):
+        with open(self.journal_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def needs_compaction(self):
+        """Check whether the journal has outgrown its snapshot"""
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except OSError:
+            return False
+        try:
+            snapshot_size = os.path.getsize(self.snapshot_path)
+        except OSError:
+            snapshot_size = 0
+        return journal_size > max(COMPACT_MIN_BYTES, snapshot_size)
+
+    def compact(self):
+        """Fold the journal into a new snapshot and truncate it"""
+        seq, blocks = self.replay()
+        _write_json_atomic(self.snapshot_path, {"seq": seq, "blocks": blocks})
+        with open(self.journal_path, "wb") as f:
+            os.fsync(f.fileno())
+        self._seq = seq
+
+    def update_meta(self, **values):
+        """Merge values into meta.json, writing only when something changed"""
+        if self._meta is None:
+            self._meta = self.read_meta()
+        meta = dict(self._meta, pid=os.getpid(), **values)
+        if meta == self._meta and os.path.exists(self.meta_path):
+            return
+        meta["updated"] = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        _write_json_atomic(self.meta_path, meta)
+        self._meta = meta
+
+    def read_meta(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def discard(self):
+        """Delete the session"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._seq = None
+        self._meta = None
+
+
+def list_recoverable_sessions(sessions_dir=None):
+    """
+    Sessions left behind with unsaved changes by an instance that is no longer running
+
+    Sessions with nothing unsaved are removed on the way. Returns a list of
+    SessionJournal, most recently updated first.
+    """
+    sessions_dir = sessions_dir or get_sessions_dir()
+    try:
+        names = os.listdir(sessions_dir)
+    except OSError:
+        return []
+
+    sessions = []
+    for name in names:
+        journal = SessionJournal(name, sessions_dir)
+        meta = journal.read_meta()
+        pid = meta.get("pid")
+        if pid and _pid_alive(pid):
+            # Still in use, possibly by this very process
+            continue
+        if not meta.get("modified"):
+            journal.discard()
+            continue
+        sessions.append((meta.get("updated", 0), journal))
+    sessions.sort(key=lambda item: item[0], reverse=True)
+    return [journal for _, journal in sessions]
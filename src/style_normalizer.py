@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# style_normalizer.py - idle-time tidying of inline formatting wrappers
+#
+# Formatting through execCommand leaves <font> and <span> wrappers nested in
+# each other, split into runs of the same style and repeating the styles of
+# the wrapper around them. The editor collects the top-level blocks that
+# formatting touched and, in idle time, tidies them: styles a wrapper inherits
+# anyway are dropped, wrappers left without attributes are unwrapped, empty
+# ones removed and adjacent runs of the same style merged.
+#
+# Only "plain" wrappers are touched: <font> and <span> elements with no
+# attributes but style, color, face and size, and only text styles in their
+# style attribute, so search highlights, formatting marks and word art keep
+# their structure. The text of a block never changes, so the caret is put
+# back at the same character, and the undo history is not extended: when
+# nothing has changed the editor since the last saveState, the snapshot it
+# took is replaced with the tidied content. The observer tells whether
+# anything has, so the editor is only serialized after a block was tidied.
+#
+# With WEBKITWORD_DEBUG=1 each pass reports over the normalizerStats message
+# handler as {"blocks": N, "changed": N, "before": N, "after": N, "ms": N},
+# node counts being those of the tidied blocks.
+import json
+from file_operations import DEBUG, _debug
+
+
+def on_normalizer_stats(self, win, manager, result):
+    """Log the node counts of a normalizer pass"""
+    try:
+        if hasattr(result, 'get_js_value'):
+            message = result.get_js_value().to_string()
+        else:
+            message = result.to_string()
+        stats = json.loads(message)
+    except Exception as e:
+        print(f"Invalid normalizer statistics: {e}")
+        return
+
+    _debug(f"Normalized {stats['changed']} of {stats['blocks']} blocks: "
+           f"{stats['before']} -> {stats['after']} nodes in {stats['ms']:.1f} ms")
+
+
+def style_normalizer_js(self):
+    """JavaScript that tidies the inline formatting of changed blocks in idle time"""
+    debug = 'true' if DEBUG else 'false'
+    return f"""
+    const NORMALIZER_DEBUG = {debug};
+    """ + """
+    const NORMALIZER_SLICE_MS = 8;
+    // Records adding more top-level nodes than this replace the content, as
+    // setContent and undo do, and are not formatting to tidy
+    const NORMALIZER_MAX_ADDED = 50;
+    const NORMALIZER_ATTRIBUTES = /^(style|color|face|size)$/;
+    // Styles of plain wrappers; all but the last two are inherited
+    const NORMALIZER_TEXT_STYLES = /^(color|font-family|font-size|font-style|font-weight|background-color|text-decoration.*)$/;
+    const NORMALIZER_INHERITED = ['color', 'font-family', 'font-size', 'font-style', 'font-weight'];
+    // Where <font> keeps the same setting as an attribute
+    const NORMALIZER_FONT_ATTRIBUTES = { 'color': 'color', 'font-family': 'face', 'font-size': 'size' };
+
+    const normalizerState = {
+        dirty: new Set(),
+        // Blocks left alone while the selection was in an element of theirs
+        deferred: new Set(),
+        observer: null,
+        pending: false,
+        composing: false,
+        // Whether the last undo snapshot is still the editor's content
+        synced: false
+    };
+
+    function normalizerPlain(node) {
+        if (node.nodeType !== Node.ELEMENT_NODE || !node.matches('font, span')) return false;
+        for (const attribute of node.attributes) {
+            if (!NORMALIZER_ATTRIBUTES.test(attribute.name)) return false;
+        }
+        for (let i = 0; i < node.style.length; i++) {
+            if (!NORMALIZER_TEXT_STYLES.test(node.style[i])) return false;
+        }
+        return true;
+    }
+
+    // The value element gives property, from its style or its font attribute
+    function normalizerValue(element, property) {
+        const value = element.style.getPropertyValue(property);
+        if (value) return value;
+        const attribute = NORMALIZER_FONT_ATTRIBUTES[property];
+        if (element.tagName === 'FONT' && attribute && element.hasAttribute(attribute)) {
+            return attribute + ':' + element.getAttribute(attribute);
+        }
+        return '';
+    }
+
+    // The value element inherits for property from the plain wrappers around
+    // it, or '' when something else may set it
+    function normalizerInherited(element, property, block) {
+        for (let node = element.parentNode; node && node !== block.parentNode; node = node.parentNode) {
+            if (!normalizerPlain(node)) return '';
+            const value = normalizerValue(node, property);
+            if (value) return value;
+        }
+        return '';
+    }
+
+    function normalizerCompact(element, block) {
+        let changes = 0;
+        NORMALIZER_INHERITED.forEach(function(property) {
+            const value = element.style.getPropertyValue(property);
+            // Relative sizes and weights add up, so only absolute ones repeat
+            if (!value || element.style.getPropertyPriority(property)) return;
+            if (property === 'font-size' && !/^[\\d.]+(px|pt)$/.test(value)) return;
+            if (property === 'font-weight' && /^(bolder|lighter)$/.test(value)) return;
+            if (normalizerInherited(element, property, block) === value) {
+                element.style.removeProperty(property);
+                changes++;
+            }
+        });
+        if (element.hasAttribute('style') && element.style.length === 0) {
+            element.removeAttribute('style');
+            changes++;
+        }
+        return changes;
+    }
+
+    function normalizerSameAttributes(a, b) {
+        if (a.tagName !== b.tagName || a.attributes.length !== b.attributes.length) return false;
+        for (const attribute of a.attributes) {
+            if (attribute.name === 'style') {
+                if (a.style.cssText !== b.style.cssText) return false;
+            } else if (b.getAttribute(attribute.name) !== attribute.value) {
+                return false;
+            }
+        }
+        return true;
+    }
+
+    // Tidy the wrappers of one block; returns the number of changes
+    function normalizeBlock(block) {
+        let changes = 0;
+        // Innermost first, so a wrapper is judged after what it wraps
+        formattingElementsIn(block, 'font, span').reverse().forEach(function(element) {
+            if (!element.isConnected || !normalizerPlain(element)) return;
+            changes += normalizerCompact(element, block);
+            // The block itself stays, so the selection has somewhere to go back to
+            if (element === block) return;
+            if (element.attributes.length === 0) {
+                while (element.firstChild) element.parentNode.insertBefore(element.firstChild, element);
+                element.remove();
+                changes++;
+            } else if (!element.firstChild) {
+                element.remove();
+                changes++;
+            }
+        });
+        // In document order, so runs nested in merged runs meet as siblings
+        formattingElementsIn(block, 'font, span').forEach(function(element) {
+            if (element === block || !element.isConnected || !normalizerPlain(element)) return;
+            let next = element.nextSibling;
+            while (next && normalizerPlain(next) && normalizerSameAttributes(element, next)) {
+                while (next.firstChild) element.appendChild(next.firstChild);
+                next.remove();
+                next = element.nextSibling;
+                changes++;
+            }
+        });
+        if (changes > 0 && block.isConnected) block.normalize();
+        return changes;
+    }
+
+    function normalizerCountNodes(block) {
+        const walker = document.createTreeWalker(block, NodeFilter.SHOW_ALL);
+        let count = 1;
+        while (walker.nextNode()) count++;
+        return count;
+    }
+
+    // A selection boundary as a character offset into the text of block,
+    // leaning towards the text before it when it sat at the end of a node
+    function normalizerSavePoint(block, node, offset) {
+        const walker = document.createTreeWalker(block, NodeFilter.SHOW_TEXT);
+        let count = 0;
+        for (let text = walker.nextNode(); text; text = walker.nextNode()) {
+            if (text === node) return { offset: count + offset, atEnd: offset > 0 && offset === text.length };
+            count += text.length;
+        }
+        return { offset: count, atEnd: true };
+    }
+
+    function normalizerRestorePoint(block, point) {
+        const walker = document.createTreeWalker(block, NodeFilter.SHOW_TEXT);
+        let count = point.offset;
+        let last = null;
+        for (let text = walker.nextNode(); text; text = walker.nextNode()) {
+            if (count < text.length || (count === text.length && point.atEnd)) return [text, count];
+            count -= text.length;
+            last = text;
+        }
+        return last ? [last, last.length] : [block, 0];
+    }
+
+    function normalizerUpdate(deadline) {
+        const editor = document.getElementById('editor');
+        const selection = window.getSelection();
+        const range = selection.rangeCount > 0 ? selection.getRangeAt(0) : null;
+        const stats = { blocks: 0, changed: 0, before: 0, after: 0 };
+        const started = performance.now();
+
+        for (const block of normalizerState.dirty) {
+            normalizerState.dirty.delete(block);
+            if (block.parentNode !== editor || block.nodeType !== Node.ELEMENT_NODE) continue;
+
+            const anchorIn = range && block.contains(selection.anchorNode);
+            const focusIn = range && block.contains(selection.focusNode);
+            if ((anchorIn && selection.anchorNode.nodeType !== Node.TEXT_NODE) ||
+                (focusIn && selection.focusNode.nodeType !== Node.TEXT_NODE)) {
+                normalizerState.deferred.add(block);
+                continue;
+            }
+            const anchor = anchorIn ? normalizerSavePoint(block, selection.anchorNode, selection.anchorOffset) : null;
+            const focus = focusIn ? normalizerSavePoint(block, selection.focusNode, selection.focusOffset) : null;
+
+            stats.blocks++;
+            if (NORMALIZER_DEBUG) stats.before += normalizerCountNodes(block);
+            const changes = normalizeBlock(block);
+            if (NORMALIZER_DEBUG) stats.after += normalizerCountNodes(block);
+            if (changes > 0) {
+                stats.changed++;
+                if (anchorIn || focusIn) {
+                    const a = anchor ? normalizerRestorePoint(block, anchor) : [selection.anchorNode, selection.anchorOffset];
+                    const f = focus ? normalizerRestorePoint(block, focus) : [selection.focusNode, selection.focusOffset];
+                    selection.setBaseAndExtent(a[0], a[1], f[0], f[1]);
+                }
+            }
+            if (performance.now() > deadline) break;
+        }
+        // The tidying is not a change to look at again
+        normalizerState.observer.takeRecords();
+
+        // Undo keeps snapshots of the editor; the last one is replaced with the
+        // tidied content rather than adding another
+        if (stats.changed > 0 && normalizerState.synced && !window.isUndoRedo &&
+            window.undoStack.length > 0) {
+            const content = editor.innerHTML;
+            window.undoStack[window.undoStack.length - 1] = content;
+            window.lastContent = content;
+        }
+        if (NORMALIZER_DEBUG && stats.blocks > 0) {
+            stats.ms = performance.now() - started;
+            try {
+                window.webkit.messageHandlers.normalizerStats.postMessage(JSON.stringify(stats));
+            } catch (e) {
+                console.log("Could not send normalizer statistics:", e);
+            }
+        }
+    }
+
+    function normalizerRun() {
+        if (normalizerState.composing || window.plainTextMode) {
+            normalizerState.pending = false;
+            return;
+        }
+        normalizerUpdate(performance.now() + NORMALIZER_SLICE_MS);
+        if (normalizerState.dirty.size > 0) {
+            scheduleIdle(normalizerRun);
+            return;
+        }
+        normalizerState.pending = false;
+    }
+
+    function normalizerSchedule() {
+        if (normalizerState.pending || normalizerState.dirty.size === 0) return;
+        normalizerState.pending = true;
+        scheduleIdle(normalizerRun);
+    }
+
+    function normalizerMarkDirty(records) {
+        const editor = document.getElementById('editor');
+        if (records.length > 0) normalizerState.synced = false;
+        records.forEach(function(record) {
+            // Observed only to know that the editor changed
+            if (record.type === 'characterData' ||
+                (record.type === 'attributes' && !NORMALIZER_ATTRIBUTES.test(record.attributeName))) {
+                return;
+            }
+            if (record.target === editor) {
+                if (record.addedNodes.length > NORMALIZER_MAX_ADDED) return;
+                record.addedNodes.forEach(function(node) { normalizerState.dirty.add(node); });
+                return;
+            }
+            let node = record.target;
+            while (node && node.parentNode !== editor) node = node.parentNode;
+            if (node) normalizerState.dirty.add(node);
+        });
+        normalizerSchedule();
+    }
+
+    // Called by saveState once it has taken a snapshot: what changed before
+    // it is in the snapshot, so only later changes put the two out of sync
+    function normalizerSaved() {
+        if (!normalizerState.observer) return;
+        normalizerMarkDirty(normalizerState.observer.takeRecords());
+        normalizerState.synced = true;
+    }
+
+    function setupStyleNormalizer(editor) {
+        normalizerState.observer = new MutationObserver(normalizerMarkDirty);
+        normalizerState.observer.observe(editor, {
+            childList: true, subtree: true, attributes: true, characterData: true
+        });
+        editor.addEventListener('compositionstart', function() { normalizerState.composing = true; });
+        editor.addEventListener('compositionend', function() {
+            normalizerState.composing = false;
+            normalizerSchedule();
+        });
+        // Blocks left for the selection are tidied once it has moved on
+        document.addEventListener('selectionchange', function() {
+            if (normalizerState.deferred.size === 0) return;
+            normalizerState.deferred.forEach(function(block) { normalizerState.dirty.add(block); });
+            normalizerState.deferred.clear();
+            normalizerSchedule();
+        });
+    }
+    """
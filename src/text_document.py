@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# text_document.py - plain-text documents as bounded editor blocks
+#
+# A text file is shown as a run of <pre class="text-block"> elements of at most
+# TEXT_BLOCK_LINES lines (or about TEXT_BLOCK_CHARS characters), instead of one
+# element with a <br> per line. TextBlockReader reads the file line by line and
+# hands the blocks out in batches, so the editor can be filled while the rest
+# of the file is still being read. write_text_blocks is the way back: it writes
+# the text of each block as it comes, joined by the file's own line breaks and
+# in its own encoding.
+#
+# Within a block, lines are joined by "\n". A line break at the very end of a
+# <pre> does not start another line, so a block whose last line is empty ends
+# in <br>, and a break at the end of a block's text is dropped when reading it
+# back; see textBlockText in file_operations.plain_text_js.
+import codecs
+from html import escape
+
+TEXT_BLOCK_LINES = 100
+TEXT_BLOCK_CHARS = 16 * 1024
+# HTML handed to the editor per call while a document streams in
+TEXT_BATCH_CHARS = 512 * 1024
+# How much of the file is read at a time to check that it is UTF-8
+ENCODING_PROBE_BYTES = 1024 * 1024
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def detect_text_encoding(path):
+    """Return the encoding of a text file without reading all of it into memory"""
+    with open(path, 'rb') as f:
+        head = f.read(ENCODING_PROBE_BYTES)
+        for bom, encoding in BOMS:
+            if head.startswith(bom):
+                return encoding
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        chunk = head
+        try:
+            while chunk:
+                decoder.decode(chunk)
+                chunk = f.read(ENCODING_PROBE_BYTES)
+            decoder.decode(b'', final=True)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+
+    try:
+        import chardet
+        detected = chardet.detect(head)
+        if detected['encoding'] and detected['confidence'] > 0.7:
+            codecs.lookup(detected['encoding'])
+            return detected['encoding']
+    except (ImportError, LookupError):
+        pass
+    return 'latin-1'
+
+
+def text_block_html(lines):
+    """Editor HTML of one block of lines"""
+    text = escape('\n'.join(lines), quote=False)
+    # The HTML parser drops a newline directly after <pre>
+    if text.startswith('\n'):
+        text = '\n' + text
+    if not lines[-1]:
+        text += '<br>'
+    return f'<pre class="text-block">{text}</pre>'
+
+
+class TextBlockReader:
+    """
+    Reads a text file as editor blocks
+
+    encoding, newline and final_newline describe the file, so it can be written
+    back the way it was; the last two are known once the file has been read.
+    """
+
+    def __init__(self, path, encoding=None):
+        self.path = path
+        self.encoding = encoding or detect_text_encoding(path)
+        self.newline = None
+        self.final_newline = False
+        self.line_count = 0
+
+    def _lines(self):
+        with open(self.path, 'r', encoding=self.encoding, errors='replace', newline='') as f:
+            line = ''
+            for line in f:
+                self.line_count += 1
+                if line.endswith('\r\n'):
+                    ending = '\r\n'
+                elif line.endswith(('\n', '\r')):
+                    ending = line[-1]
+                else:
+                    yield line
+                    continue
+                if self.newline is None:
+                    self.newline = ending
+                yield line[:-len(ending)]
+            self.final_newline = line != '' and line[-1] in '\r\n'
+        if self.newline is None:
+            self.newline = '\n'
+
+    def blocks(self):
+        """Yield the HTML of each block"""
+        lines = []
+        size = 0
+        for line in self._lines():
+            lines.append(line)
+            size += len(line) + 1
+            if len(lines) >= TEXT_BLOCK_LINES or size >= TEXT_BLOCK_CHARS:
+                yield text_block_html(lines)
+                lines = []
+                size = 0
+        # An empty file still needs a block to type into
+        if lines or self.line_count == 0:
+            yield text_block_html(lines or [''])
+
+    def batches(self, batch_chars=TEXT_BATCH_CHARS):
+        """Yield the blocks joined into strings of about batch_chars characters"""
+        batch = []
+        size = 0
+        for block in self.blocks():
+            batch.append(block)
+            size += len(block)
+            if size >= batch_chars:
+                yield ''.join(batch)
+                batch = []
+                size = 0
+        if batch:
+            yield ''.join(batch)
+
+
+def write_text_blocks(output, batches, newline='\n', final_newline=True, encoding='utf-8'):
+    """
+    Write lists of block texts to a binary file object, one block at a time
+
+    One incremental encoder writes all of it, so encodings that start with a
+    byte order mark (utf-8-sig, utf-16, utf-32) write it once, at the start.
+    """
+    encoder = codecs.getincrementalencoder(encoding)()
+    first = True
+    for texts in batches:
+        for text in texts:
+            if not first:
+                output.write(encoder.encode(newline))
+            first = False
+            if newline != '\n':
+                text = text.replace('\n', newline)
+            output.write(encoder.encode(text))
+    if final_newline and not first:
+        output.write(encoder.encode(newline))
+    output.write(encoder.encode('', final=True))
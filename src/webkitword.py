@@ -20,6 +20,13 @@ import formatting_operations
 import insert_table
 import show_html
 import keyboard_shortcuts
+import image_operations
+import autosave
+import outline
+import document_stats
+import pagination
+import style_normalizer
+import exporters
  
 class WebkitWordApp(Adw.Application):
     def __init__(self, **kwargs):
@@ -48,7 +55,7 @@ class WebkitWordApp(Adw.Application):
             'on_open_clicked', 'on_open_new_window_response',
             'on_open_current_window_response', 'load_file',
             '_process_image_references', '_get_mime_type', 'cleanup_temp_files',
-            'convert_with_libreoffice', 'show_loading_dialog',
+            'convert_with_libreoffice', 'convert_with_libreoffice_async', 'show_loading_dialog',
             
             # File saving methods
             'on_save_clicked', '_on_save_dialog_response', 'show_save_dialog',
@@ -62,9 +69,10 @@ class WebkitWordApp(Adw.Application):
             
             
             # Format-specific save methods
-            'save_as_mhtml', '_restore_editable_after_save', '_restore_editable_state', 
-            '_do_mhtml_save_with_non_editable_content', 'save_webkit_callback', 'save_as_html',
+            'save_as_wwd', '_on_get_wwd_content', 'save_as_mhtml', '_on_get_mhtml_content', 'save_as_odt', '_on_get_odt_content', 'save_as_docx', '_on_get_docx_content', '_restore_editable_after_save', '_restore_editable_state', 
+            '_do_mhtml_save_with_non_editable_content', 'save_as_html',
             'save_as_text','save_as_markdown', '_simple_markdown_to_html',
+            'load_text_document', 'save_text_blocks', 'plain_text_js',
 
             # Save as PDF
             'save_as_pdf', '_save_pdf_step1', '_save_pdf_step2', '_pdf_save_success',
@@ -74,6 +82,10 @@ class WebkitWordApp(Adw.Application):
             # Callback handlers
             'save_html_callback', 'save_text_callback',
             'save_markdown_callback', 'save_completion_callback',
+            'save_as_html_fallback', 'save_html_body_callback',
+            
+            # Background writer shared by the save paths
+            'write_document_async', 'save_html_content',
             
             # Legacy methods for backward compatibility
             '_on_save_response', '_on_save_as_response', '_on_get_html_content',
@@ -87,6 +99,7 @@ class WebkitWordApp(Adw.Application):
             'load_mhtml_with_webkit', '_load_mhtml_file', '_process_mhtml_resources',
             '_extract_mhtml_content', '_on_mhtml_content_extracted',
             '_load_html_with_webkit', '_extract_html_content', '_on_html_content_extracted',
+            'register_archive_scheme', '_on_archive_uri_request', 'set_window_archive',
             
         ]
         
@@ -140,7 +153,7 @@ class WebkitWordApp(Adw.Application):
             '_update_alignment_buttons', 'on_align_left_toggled', 'on_align_center_toggled',
             'on_align_right_toggled', 'on_align_justify_toggled', '_update_alignment_buttons',
             'selection_change_js', 'on_paragraph_style_changed', 'on_font_changed',
-            'on_font_size_changed', 'cleanup_editor_tags', 'create_color_button',
+            'on_font_size_changed', 'cleanup_editor_tags', 'formatting_cleanup_js', 'create_color_button',
             'on_font_color_button_clicked', 'on_font_color_selected', 'on_font_color_automatic_clicked',
             'on_more_font_colors_clicked', 'on_font_color_dialog_response', 'apply_font_color',
             'on_bg_color_button_clicked', 'on_bg_color_selected', 'on_bg_color_automatic_clicked',
@@ -201,6 +214,77 @@ class WebkitWordApp(Adw.Application):
             if hasattr(show_html, method_name):
                 setattr(self, method_name, getattr(show_html, method_name).__get__(self, WebkitWordApp))
 
+        # Import methods from image_operations module
+        image_operations_methods = [
+            'get_image_target_width', 'prepare_image_for_insert',
+            'on_image_resample_requested', 'image_resample_js', 'lazy_images_js',
+        ]
+
+        # Import methods from image_operations
+        for method_name in image_operations_methods:
+            if hasattr(image_operations, method_name):
+                setattr(self, method_name, getattr(image_operations, method_name).__get__(self, WebkitWordApp))
+
+        # Import methods from autosave module
+        autosave_methods = [
+            'get_window_journal', 'auto_save', '_on_journal_changes',
+            'mark_journal_saved', 'discard_window_journal', 'offer_session_recovery',
+            'show_session_recovery_dialog', 'recover_sessions', '_load_recovered_session',
+            'journal_js',
+        ]
+
+        # Import methods from autosave
+        for method_name in autosave_methods:
+            if hasattr(autosave, method_name):
+                setattr(self, method_name, getattr(autosave, method_name).__get__(self, WebkitWordApp))
+
+        # Import methods from outline module
+        outline_methods = [
+            'create_outline_sidebar', 'on_outline_changed', 'on_outline_activated',
+            'toggle_outline', 'on_toggle_outline_action', 'outline_js',
+        ]
+
+        # Import methods from outline
+        for method_name in outline_methods:
+            if hasattr(outline, method_name):
+                setattr(self, method_name, getattr(outline, method_name).__get__(self, WebkitWordApp))
+
+        # Import methods from document_stats module
+        document_stats_methods = ['create_stats_label', 'on_document_stats', 'update_stats_label',
+                                  'document_stats_js']
+
+        # Import methods from document_stats
+        for method_name in document_stats_methods:
+            if hasattr(document_stats, method_name):
+                setattr(self, method_name, getattr(document_stats, method_name).__get__(self, WebkitWordApp))
+
+        # Import methods from pagination module
+        pagination_methods = [
+            'get_page_geometry', 'apply_page_geometry', 'on_pagination_changed',
+            'toggle_page_guides', 'on_toggle_page_guides_action', 'pagination_js',
+        ]
+
+        # Import methods from pagination
+        for method_name in pagination_methods:
+            if hasattr(pagination, method_name):
+                setattr(self, method_name, getattr(pagination, method_name).__get__(self, WebkitWordApp))
+
+        # Import methods from style_normalizer module
+        style_normalizer_methods = ['on_normalizer_stats', 'style_normalizer_js']
+
+        # Import methods from style_normalizer
+        for method_name in style_normalizer_methods:
+            if hasattr(style_normalizer, method_name):
+                setattr(self, method_name, getattr(style_normalizer, method_name).__get__(self, WebkitWordApp))
+
+        # Import methods from exporters module
+        exporters_methods = ['export_document', '_run_exporter', 'show_export_dialog']
+
+        # Import methods from exporters
+        for method_name in exporters_methods:
+            if hasattr(exporters, method_name):
+                setattr(self, method_name, getattr(exporters, method_name).__get__(self, WebkitWordApp))
+
 
 
         
@@ -453,6 +537,7 @@ popover.menu {
         file_section.append("Open", "app.open")
         file_section.append("Save", "app.save")
         file_section.append("Save As", "app.save-as")
+        file_section.append("Export…", "app.export")
         menu.append_section("File", file_section)
         
         # View menu section
@@ -460,6 +545,8 @@ popover.menu {
         view_section.append("Show/Hide File Toolbar", "app.toggle-file-toolbar")
         view_section.append("Show/Hide Format Toolbar", "app.toggle-format-toolbar")
         view_section.append("Show/Hide Statusbar", "app.toggle-statusbar")
+        view_section.append("Show/Hide Outline", "app.toggle-outline")
+        view_section.append("Show/Hide Page Breaks", "app.toggle-page-guides")
         menu.append_section("View", view_section)
         
         # App menu section
@@ -741,10 +828,60 @@ popover.menu {
                 position: relative; /* Important for absolute positioning of floating tables */
                 min-height: 300px;  /* Ensure there's space to drag tables */
             }
-            #editor div {
+            #editor div, #page-measure div {
                 margin: 0;
                 padding: 0;
             }
+            #editor.plain-text-mode, #page-measure.plain-text-mode {
+                font-family: monospace;
+            }
+            #editor pre.text-block, #page-measure pre.text-block {
+                margin: 0;
+                font: inherit;
+                white-space: pre-wrap;
+                overflow-wrap: anywhere;
+            }
+            /* Long documents: see large_document_js. Blocks that position or float
+               content outside themselves are always laid out */
+            #editor.large-document > :not(table):not(:has(table, [style*="float"], [style*="position"])) {
+                content-visibility: auto;
+                contain-intrinsic-height: auto var(--block-size-estimate, 24px);
+            }
+            @media print {
+                #editor.large-document > * {
+                    content-visibility: visible;
+                }
+                #page-guides {
+                    display: none;
+                }
+            }
+            /* Copies of blocks measured at the page width; see pagination_js */
+            #page-measure {
+                position: absolute;
+                top: 0;
+                left: 0;
+                height: 0;
+                overflow: hidden;
+                visibility: hidden;
+                display: flow-root;
+                font-family: Sans;
+                font-size: 12pt;
+            }
+            #page-guides {
+                position: absolute;
+                left: 0;
+                right: 0;
+                pointer-events: none;
+            }
+            .page-guide {
+                position: absolute;
+                left: 0;
+                right: 0;
+                border-top: 1px dashed rgba(127, 127, 127, 0.6);
+                color: rgba(127, 127, 127, 0.8);
+                font: 9px Sans;
+                text-align: right;
+            }
             #editor:empty:not(:focus):before {
                 content: "Type here to start editing...";
                 color: #aaa;
@@ -922,7 +1059,14 @@ popover.menu {
         {self.find_last_text_node_js()}
         {self.get_stack_sizes_js()}
         {self.set_content_js()}
+        {self.plain_text_js()}
+        {self.large_document_js()}
+        {self.outline_js()}
+        {self.document_stats_js()}
+        {self.pagination_js()}
         {self.selection_change_js()}
+        {self.formatting_cleanup_js()}
+        {self.style_normalizer_js()}
         {self.search_functions_js()}
         {self.paragraph_and_line_spacing_js()}
         {self.insert_table_js()}
@@ -931,6 +1075,9 @@ popover.menu {
         {self.table_z_index_js()}
         {self.insert_link_js()}
         {self.rtl_toggle_js()}
+        {self.image_resample_js()}
+        {self.lazy_images_js()}
+        {self.journal_js()}
         {self.init_editor_js()}
         """
 
@@ -943,6 +1090,7 @@ popover.menu {
             if (window.undoStack.length > 100) {
                 window.undoStack.shift();
             }
+            if (typeof normalizerSaved === 'function') normalizerSaved();
         }
         """
 
@@ -951,6 +1099,10 @@ popover.menu {
         return """
         function performUndo() {
             const editor = document.getElementById('editor');
+            if (window.plainTextMode) {
+                const success = document.execCommand('undo');
+                return { success: success, isInitialState: !document.queryCommandEnabled('undo') };
+            }
             if (window.undoStack.length > 1) {
                 let selection = window.getSelection();
                 let range = selection.rangeCount > 0 ? selection.getRangeAt(0) : null;
@@ -987,6 +1139,10 @@ popover.menu {
         return """
         function performRedo() {
             const editor = document.getElementById('editor');
+            if (window.plainTextMode) {
+                const success = document.execCommand('redo');
+                return { success: success, isInitialState: !document.queryCommandEnabled('undo') };
+            }
             if (window.redoStack.length > 0) {
                 let selection = window.getSelection();
                 let range = selection.rangeCount > 0 ? selection.getRangeAt(0) : null;
@@ -1036,6 +1192,12 @@ popover.menu {
         """JavaScript to get the sizes of undo and redo stacks."""
         return """
         function getStackSizes() {
+            if (window.plainTextMode) {
+                return {
+                    undoSize: document.queryCommandEnabled('undo') ? 2 : 1,
+                    redoSize: document.queryCommandEnabled('redo') ? 1 : 0
+                };
+            }
             return {
                 undoSize: window.undoStack.length,
                 redoSize: window.redoStack.length
@@ -1048,6 +1210,9 @@ popover.menu {
         return """
         function setContent(html) {
             const editor = document.getElementById('editor');
+            if (window.plainTextMode) {
+                setPlainTextMode(false);
+            }
             if (!html || html.trim() === '') {
                 editor.innerHTML = '<div><br></div>';
             } else if (!html.trim().match(/^<(div|p|h[1-6]|ul|ol|table)/i)) {
@@ -1062,6 +1227,144 @@ popover.menu {
         }
         """
 
+    def large_document_js(self):
+        """JavaScript that skips the layout of off-screen blocks in long documents"""
+        return """
+        // Documents with more top-level blocks than this are laid out lazily:
+        // off-screen blocks get content-visibility: auto, keep the height they
+        // had when last rendered, and blocks never rendered are sized by the
+        // average height measured so far. The DOM itself is left as it is.
+        const LARGE_DOCUMENT_BLOCKS = 1000;
+
+        const largeDocument = {
+            heights: new WeakMap(),
+            sum: 0,
+            count: 0,
+            estimate: 0,
+            checkPending: false,
+            measurePending: false
+        };
+
+        // Run a callback once the page is idle, where requestIdleCallback exists
+        function scheduleIdle(callback) {
+            if (window.requestIdleCallback) {
+                window.requestIdleCallback(callback, { timeout: 500 });
+            } else {
+                setTimeout(callback, 50);
+            }
+        }
+
+        function updateLargeDocumentMode() {
+            largeDocument.checkPending = false;
+            const editor = document.getElementById('editor');
+            const large = editor.childElementCount > LARGE_DOCUMENT_BLOCKS;
+            if (large !== editor.classList.contains('large-document')) {
+                editor.classList.toggle('large-document', large);
+                if (large) scheduleBlockMeasure();
+            }
+        }
+
+        // Record the rendered height of the blocks in the viewport
+        function measureVisibleBlocks() {
+            largeDocument.measurePending = false;
+            const editor = document.getElementById('editor');
+            if (!editor.classList.contains('large-document')) return;
+            const rect = editor.getBoundingClientRect();
+            const x = rect.left + Math.min(20, rect.width / 2);
+            const step = Math.max(20, window.innerHeight / 8);
+            for (let y = 0; y < window.innerHeight; y += step) {
+                let node = document.elementFromPoint(x, y);
+                while (node && node.parentNode !== editor) node = node.parentNode;
+                if (!node || node.nodeType !== Node.ELEMENT_NODE) continue;
+                const height = node.getBoundingClientRect().height;
+                const previous = largeDocument.heights.get(node);
+                if (previous !== undefined) {
+                    largeDocument.sum -= previous;
+                    largeDocument.count--;
+                }
+                largeDocument.heights.set(node, height);
+                largeDocument.sum += height;
+                largeDocument.count++;
+            }
+            if (largeDocument.count === 0) return;
+            const estimate = Math.max(1, Math.round(largeDocument.sum / largeDocument.count));
+            if (Math.abs(estimate - largeDocument.estimate) > largeDocument.estimate / 10) {
+                largeDocument.estimate = estimate;
+                editor.style.setProperty('--block-size-estimate', estimate + 'px');
+            }
+        }
+
+        function scheduleBlockMeasure() {
+            if (largeDocument.measurePending) return;
+            largeDocument.measurePending = true;
+            requestAnimationFrame(function() { scheduleIdle(measureVisibleBlocks); });
+        }
+
+        function setupLargeDocument(editor) {
+            new MutationObserver(function() {
+                if (largeDocument.checkPending) return;
+                largeDocument.checkPending = true;
+                scheduleIdle(updateLargeDocumentMode);
+            }).observe(editor, { childList: true });
+            window.addEventListener('scroll', scheduleBlockMeasure, { passive: true });
+            window.addEventListener('resize', function() {
+                // Blocks re-wrap to the new width, so earlier heights no longer apply
+                largeDocument.heights = new WeakMap();
+                largeDocument.sum = 0;
+                largeDocument.count = 0;
+                scheduleBlockMeasure();
+            });
+        }
+
+        // innerText depends on layout, so read it with every block laid out
+        function fullLayoutText(element) {
+            const editor = document.getElementById('editor');
+            const large = editor.classList.contains('large-document');
+            if (large) editor.classList.remove('large-document');
+            try {
+                return element.innerText;
+            } finally {
+                if (large) editor.classList.add('large-document');
+            }
+        }
+
+        // Scroll through the document and re-wrap it now and then, one change
+        // per frame, and report the frame times
+        function measureScrollFrames(steps) {
+            return new Promise(function(resolve) {
+                const scroller = document.scrollingElement;
+                const editor = document.getElementById('editor');
+                const start = scroller.scrollTop;
+                const times = [];
+                let last = 0;
+                let step = 0;
+                function frame(now) {
+                    if (step > 0) times.push(now - last);
+                    last = now;
+                    if (step < steps) {
+                        scroller.scrollTop = (scroller.scrollHeight - scroller.clientHeight) * step / steps;
+                        editor.style.width = step % 10 === 5 ? '90%' : '';
+                        step++;
+                        requestAnimationFrame(frame);
+                        return;
+                    }
+                    editor.style.width = '';
+                    scroller.scrollTop = start;
+                    times.sort(function(a, b) { return a - b; });
+                    resolve(JSON.stringify({
+                        blocks: editor.childElementCount,
+                        large: editor.classList.contains('large-document'),
+                        frames: times.length,
+                        median: times[Math.floor(times.length / 2)] || 0,
+                        p95: times[Math.floor(times.length * 0.95)] || 0,
+                        max: times[times.length - 1] || 0
+                    }));
+                }
+                requestAnimationFrame(frame);
+            });
+        }
+        """
+
     def selection_change_js(self):
         """JavaScript to track selection changes and update formatting buttons"""
         return """
@@ -1214,6 +1517,9 @@ popover.menu {
         }
         
         document.addEventListener('selectionchange', function() {
+            // Text documents have no formatting to show
+            if (window.plainTextMode) return;
+            
             // Only update if the selection is in our editor
             const selection = window.getSelection();
             if (selection.rangeCount > 0) {
@@ -1445,6 +1751,17 @@ popover.menu {
         return """
         function setupInputHandler(editor) {
             editor.addEventListener('input', function(e) {
+                if (window.plainTextMode) {
+                    // No snapshot to compare with; undo and redo report their own state
+                    if (e.inputType !== 'historyUndo' && e.inputType !== 'historyRedo') {
+                        try {
+                            window.webkit.messageHandlers.contentChanged.postMessage("changed");
+                        } catch(e) {
+                            console.log("Could not notify about changes:", e);
+                        }
+                    }
+                    return;
+                }
                 if (document.getSelection().anchorNode === editor) {
                     document.execCommand('formatBlock', false, 'div');
                 }
@@ -1478,6 +1795,13 @@ popover.menu {
             setupTabKeyHandler(editor);
             setupFirstFocusHandler(editor);
             setupInputHandler(editor);
+            setupLazyImages(editor);
+            setupJournal(editor);
+            setupLargeDocument(editor);
+            setupOutline(editor);
+            setupDocumentStats(editor);
+            setupPagination(editor);
+            setupStyleNormalizer(editor);
             
             // Initialize content state
             window.lastContent = editor.innerHTML;
@@ -1518,6 +1842,7 @@ popover.menu {
         
         # Set new state and update window title
         win.modified = True
+        win.change_count = getattr(win, 'change_count', 0) + 1
         self.update_window_title(win)
         self.update_undo_redo_state(win)
         
@@ -1731,12 +2056,9 @@ popover.menu {
                                js_result.to_string() if hasattr(js_result, 'to_string') else str(js_result))
                 
                 # Define a callback that will close the window after saving
-                def after_save(file, result):
+                def after_save(success, error):
                     try:
-                        success, _ = file.replace_contents_finish(result)
                         if success:
-                            win.modified = False  # Mark as unmodified
-                            self.update_window_title(win)
                             # Now close the window
                             self.remove_window(win)
                             win.close()
@@ -1880,6 +2202,10 @@ popover.menu {
         save_as_action.connect("activate", self.on_save_as_action)
         self.add_action(save_as_action)
         
+        export_action = Gio.SimpleAction.new("export", None)
+        export_action.connect("activate", self.on_export_action)
+        self.add_action(export_action)
+        
         # View actions
         toggle_file_toolbar_action = Gio.SimpleAction.new("toggle-file-toolbar", None)
         toggle_file_toolbar_action.connect("activate", self.on_toggle_file_toolbar_action)
@@ -1892,6 +2218,14 @@ popover.menu {
         toggle_statusbar_action = Gio.SimpleAction.new("toggle-statusbar", None)
         toggle_statusbar_action.connect("activate", self.on_toggle_statusbar_action)
         self.add_action(toggle_statusbar_action)
+        
+        toggle_outline_action = Gio.SimpleAction.new("toggle-outline", None)
+        toggle_outline_action.connect("activate", self.on_toggle_outline_action)
+        self.add_action(toggle_outline_action)
+        
+        toggle_page_guides_action = Gio.SimpleAction.new("toggle-page-guides", None)
+        toggle_page_guides_action.connect("activate", self.on_toggle_page_guides_action)
+        self.add_action(toggle_page_guides_action)
                 
         # Close other windows action
         close_other_windows_action = Gio.SimpleAction.new("close-other-windows", None)
@@ -1906,6 +2240,13 @@ popover.menu {
         switch_window_action.connect("activate", self.on_switch_window)
         self.add_action(switch_window_action)
 
+        # Frame timing of the current document, for debugging layout performance
+        if file_operations.DEBUG:
+            scroll_benchmark_action = Gio.SimpleAction.new("scroll-benchmark", None)
+            scroll_benchmark_action.connect("activate", self.on_scroll_benchmark_action)
+            self.add_action(scroll_benchmark_action)
+            self.set_accels_for_action("app.scroll-benchmark", ["<Ctrl><Shift><Alt>b"])
+
     def create_window_menu(self):
         """Create a fresh window menu"""
         menu = Gio.Menu()
@@ -2103,6 +2444,9 @@ popover.menu {
         if window in self.windows:
             # Remove window from list
             self.windows.remove(window)
+            # Closed on purpose, so its unsaved changes are not offered for recovery
+            self.discard_window_journal(window)
+            self.set_window_archive(window, None)
             # Clean up button reference
             if id(window) in self.window_buttons:
                 del self.window_buttons[id(window)]
@@ -2121,6 +2465,29 @@ popover.menu {
         if active_win:
             self.on_open_clicked(active_win, None)
 
+    def on_scroll_benchmark_action(self, action, param):
+        """Time scrolling and re-wrapping the document in the active window"""
+        win = self.get_active_window()
+        if not win:
+            return
+        win.statusbar.set_text("Measuring scroll frame times...")
+        
+        def on_measured(webview, result, data):
+            import json
+            try:
+                stats = json.loads(webview.call_async_javascript_function_finish(result).to_string())
+            except (GLib.Error, ValueError) as e:
+                print(f"Scroll benchmark failed: {e}")
+                return
+            message = (f"{stats['blocks']} blocks{' (large document)' if stats['large'] else ''}: "
+                       f"median {stats['median']:.1f} ms, 95th percentile {stats['p95']:.1f} ms, "
+                       f"max {stats['max']:.1f} ms over {stats['frames']} frames")
+            print(f"Scroll benchmark: {message}")
+            win.statusbar.set_text(message)
+        
+        win.webview.call_async_javascript_function(
+            "return await measureScrollFrames(200);", -1, None, None, None, None, on_measured, None)
+
     def on_save_action(self, action, param):
         """Handle save action"""
         active_win = self.get_active_window()
@@ -2133,6 +2500,12 @@ popover.menu {
         if active_win:
             self.on_save_as_clicked(active_win, None)
 
+    def on_export_action(self, action, param):
+        """Handle export action"""
+        active_win = self.get_active_window()
+        if active_win:
+            self.show_export_dialog(active_win)
+
     def on_toggle_file_toolbar_action(self, action, param):
         """Handle toggle file toolbar action"""
         active_win = self.get_active_window()
@@ -2253,13 +2626,8 @@ popover.menu {
                                js_result.to_string() if hasattr(js_result, 'to_string') else str(js_result))
                 
                 # Define a callback for after saving
-                def after_save(file, result):
+                def after_save(success, error):
                     try:
-                        success, _ = file.replace_contents_finish(result)
-                        if success:
-                            win.modified = False  # Mark as unmodified
-                            self.update_window_title(win)
-                        
                         # Close this window
                         self.remove_window(win)
                         win.close()
@@ -2404,7 +2772,7 @@ popover.menu {
         # Auto-save group
         auto_save_group = Adw.PreferencesGroup()
         auto_save_group.set_title("Auto Save")
-        auto_save_group.set_description("Configure auto-save settings")
+        auto_save_group.set_description("Unsaved changes are journaled so they can be recovered after a crash")
         page.add(auto_save_group)
 
         # Auto-save switch
@@ -2420,6 +2788,20 @@ popover.menu {
         interval_row.set_digits(0)  # Display as integers only
         auto_save_group.add(interval_row)
 
+        # Images group
+        images_group = Adw.PreferencesGroup()
+        images_group.set_title("Images")
+        images_group.set_description("Configure how inserted images are stored")
+        page.add(images_group)
+
+        # Downsample switch
+        downsample_row = Adw.SwitchRow()
+        downsample_row.set_title("Downsample Inserted Images")
+        downsample_row.set_subtitle("Store images at their display size; originals are kept for enlarging")
+        downsample_row.set_active(active_win.downsample_images)
+        downsample_row.connect("notify::active", lambda row, _: setattr(active_win, 'downsample_images', row.get_active()))
+        images_group.add(downsample_row)
+
         # Save settings on dialog close
         def on_dialog_closed(dlg):
             self.save_preferences(
@@ -2479,46 +2861,6 @@ popover.menu {
             GLib.source_remove(win.auto_save_source_id)
             win.auto_save_source_id = None
 
-    def auto_save(self, win):
-        """Perform auto-save if needed"""
-        if win.modified and win.current_file:
-            win.statusbar.set_text("Auto-saving...")
-            win.webview.evaluate_javascript(
-                "document.getElementById('editor').innerHTML;",
-                -1, None, None, None,
-                lambda webview, result, file: self._on_get_html_content_auto_save(win, webview, result, win.current_file),
-                None
-            )
-        return win.auto_save_enabled
-
-    def _on_get_html_content_auto_save(self, win, webview, result, file):
-        """Handle auto-save content retrieval"""
-        try:
-            js_result = webview.evaluate_javascript_finish(result)
-            if js_result:
-                editor_content = (js_result.get_js_value().to_string() if hasattr(js_result, 'get_js_value') else
-                                js_result.to_string() if hasattr(js_result, 'to_string') else str(js_result))
-
-                self.save_html_content(win, editor_content, file,
-                                    lambda file, result: self._on_auto_save_completed(win, file, result))
-        except Exception as e:
-            print(f"Error getting HTML content for auto-save: {e}")
-            win.statusbar.set_text(f"Auto-save failed: {e}")
-
-    def _on_auto_save_completed(self, win, file, result):
-        """Handle auto-save completion"""
-        try:
-            success, _ = file.replace_contents_finish(result)
-            if success:
-                win.modified = False
-                self.update_window_title(win)
-                win.statusbar.set_text(f"Auto-saved at {GLib.DateTime.new_now_local().format('%H:%M:%S')}")
-            else:
-                win.statusbar.set_text("Auto-save failed")
-        except GLib.Error as error:
-            print(f"Error during auto-save: {error.message}")
-            win.statusbar.set_text(f"Auto-save failed: {error.message}")
-
     def show_error_dialog(self, win, message):
         """Show error message dialog"""
         dialog = Adw.Dialog.new()
@@ -2617,6 +2959,10 @@ popover.menu {
         else:
             print_op.set_page_setup(self.default_page_setup)
         
+        # Break pages where the editor shows them
+        self.execute_js(win, "applyPrintPageBreaks();")
+        print_op.connect("finished", lambda op: self.execute_js(win, "clearPrintPageBreaks();"))
+        
         # Run the print dialog
         print_op.run_dialog(win)
         win.webview.grab_focus()
@@ -3279,10 +3625,11 @@ popover.menu {
         
         # Set window properties
         win.modified = False
-        win.auto_save_enabled = False
+        win.auto_save_enabled = True
         win.auto_save_interval = 60
         win.current_file = None
         win.auto_save_source_id = None
+        win.downsample_images = True
         
         win.set_default_size(1000, 768)
         win.set_title("Untitled - Webkit Word")
@@ -3355,6 +3702,8 @@ popover.menu {
         content_box.set_hexpand(True)
         
         # Create webview
+        if not getattr(self, 'archive_scheme_registered', False):
+            self.register_archive_scheme()
         win.webview = WebKit.WebView()
         win.webview.set_vexpand(True)
         win.webview.set_hexpand(True) 
@@ -3374,7 +3723,13 @@ popover.menu {
         win.webview.add_controller(win.key_controller)
         
         win.webview.load_html(self.get_initial_html(), None)
-        content_box.append(win.webview)
+        
+        # Outline sidebar beside the editor
+        editor_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+        editor_box.set_vexpand(True)
+        editor_box.append(self.create_outline_sidebar(win))
+        editor_box.append(win.webview)
+        content_box.append(editor_box)
         
         # Find bar with revealer
         win.find_bar = self.create_find_bar(win)
@@ -3419,6 +3774,15 @@ popover.menu {
         # Add to windows list
         self.windows.append(win)
         
+        # Journal unsaved changes so they survive a crash
+        if win.auto_save_enabled:
+            self.start_auto_save_timer(win)
+        
+        # The first window offers to recover sessions a previous run left behind
+        if not getattr(self, 'recovery_offered', False):
+            self.recovery_offered = True
+            GLib.timeout_add(1000, lambda: self.offer_session_recovery(win))
+        
         return win
 
 
@@ -3446,6 +3810,31 @@ popover.menu {
                                         lambda mgr, res: self.on_table_deleted(win, mgr, res))
             user_content_manager.connect("script-message-received::tablesDeactivated", 
                                         lambda mgr, res: self.on_tables_deactivated(win, mgr, res))
+            
+            # Downsampled images that were enlarged past their encoded size
+            user_content_manager.register_script_message_handler("imageResample")
+            user_content_manager.connect("script-message-received::imageResample",
+                                        lambda mgr, res: self.on_image_resample_requested(win, mgr, res))
+            
+            # Changes to the heading outline
+            user_content_manager.register_script_message_handler("outlineChanged")
+            user_content_manager.connect("script-message-received::outlineChanged",
+                                        lambda mgr, res: self.on_outline_changed(win, mgr, res))
+            
+            # Word, character and page counts
+            user_content_manager.register_script_message_handler("documentStats")
+            user_content_manager.connect("script-message-received::documentStats",
+                                        lambda mgr, res: self.on_document_stats(win, mgr, res))
+            
+            # Page count and the page of the caret
+            user_content_manager.register_script_message_handler("pagination")
+            user_content_manager.connect("script-message-received::pagination",
+                                        lambda mgr, res: self.on_pagination_changed(win, mgr, res))
+            
+            # Node counts of the style normalizer, sent in debug mode only
+            user_content_manager.register_script_message_handler("normalizerStats")
+            user_content_manager.connect("script-message-received::normalizerStats",
+                                        lambda mgr, res: self.on_normalizer_stats(win, mgr, res))
         except:
             print("Warning: Could not set up JavaScript message handlers")
 
@@ -3465,6 +3854,9 @@ popover.menu {
         win.statusbar.set_hexpand(True)
         statusbar_box.append(win.statusbar)
         
+        # Word and page counts, kept up to date by the editor
+        statusbar_box.append(self.create_stats_label(win))
+        
         # Add zoom toggle button at the right side of the statusbar
         win.zoom_toggle_button = Gtk.ToggleButton()
         win.zoom_toggle_button.set_icon_name("zoom-symbolic")
@@ -3484,7 +3876,7 @@ popover.menu {
         win.zoom_revealer.set_child(zoom_control_box)
         
         # Add the zoom revealer to the statusbar, before the toggle button
-        statusbar_box.insert_child_after(win.zoom_revealer, win.statusbar)
+        statusbar_box.insert_child_after(win.zoom_revealer, win.stats_label)
         
         return statusbar_box
 
@@ -3608,6 +4000,14 @@ popover.menu {
         toggle_statusbar_action.connect("activate", lambda action, param: self.toggle_statusbar(win))
         win.add_action(toggle_statusbar_action)
         
+        toggle_outline_action = Gio.SimpleAction.new("toggle-outline", None)
+        toggle_outline_action.connect("activate", lambda action, param: self.toggle_outline(win))
+        win.add_action(toggle_outline_action)
+        
+        toggle_page_guides_action = Gio.SimpleAction.new("toggle-page-guides", None)
+        toggle_page_guides_action.connect("activate", lambda action, param: self.toggle_page_guides(win))
+        win.add_action(toggle_page_guides_action)
+        
         # Set up spacing and formatting actions
         self.setup_spacing_actions(win)
 
@@ -5249,18 +5649,6 @@ popover.menu {
         
         # Set filename and prepare image source for JS
         if from_file:
-            # Create base64 of the image for local file
-            import base64
-            with open(image_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode("utf-8")
-            
-            # Get image mime type
-            import mimetypes
-            mime_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
-            
-            # Image source for JS
-            img_src = f"data:{mime_type};base64,{encoded_image}"
-            
             # Get image filename for caption
             import os
             filename = os.path.basename(image_path)
@@ -5278,7 +5666,20 @@ popover.menu {
         
         dialog.close()
         
-        # Insert a table with the image at the current selection point
+        if from_file:
+            # Encode (and optionally downsample) the image off the main thread
+            self.prepare_image_for_insert(
+                win, image_path, width,
+                lambda img_src, original_id: self._insert_image_table(
+                    win, img_src, filename, from_file, width, border_width,
+                    is_floating, add_caption, original_id))
+        else:
+            self._insert_image_table(win, img_src, filename, from_file, width,
+                                     border_width, is_floating, add_caption)
+
+    def _insert_image_table(self, win, img_src, filename, from_file, width, border_width,
+                            is_floating, add_caption, original_id=None):
+        """Insert a single-cell table holding the image at the current selection point"""
         js_code = f"""
         (function() {{
             // Determine the current context - where we're inserting
@@ -5339,6 +5740,11 @@ popover.menu {
                         img.setAttribute('data-embedded', '{str(from_file).lower()}');
                         img.setAttribute('alt', '{filename}');
                         img.setAttribute('draggable', 'false'); // Prevent dragging
+                        if ({'true' if original_id else 'false'}) {{
+                            // Downsampled copy: remember the original for later enlargement
+                            img.setAttribute('data-original-id', '{original_id or ""}');
+                            img.setAttribute('data-rendered-width', '{self.get_image_target_width(win, width)}');
+                        }}
                         
                         // Add the image to the container
                         containerDiv.appendChild(img);
@@ -6837,17 +7243,8 @@ popover.menu {
             
             // If text is selected, apply font size to selection
             if (!range.collapsed) {{
-                // Apply font size to selected text
-                document.execCommand('fontSize', false, '7');
-                
-                const fontElements = editor.querySelectorAll('font[size="7"]');
-                for (const font of fontElements) {{
-                    font.removeAttribute('size');
-                    font.style.fontSize = '{new_size}pt';
-                }}
-                
-                // Clean up the DOM
-                cleanupEditorTags();
+                // Apply font size to selected text and clean up around it
+                applyFontSize('{new_size}pt');
                 
                 // Record state
                 saveState();
@@ -6903,14 +7300,7 @@ popover.menu {
                         sel.addRange(charRange);
                         
                         // Apply formatting to the selected character
-                        document.execCommand('fontSize', false, '7');
-                        
-                        // Update the font elements with the correct size
-                        const fontElements = editor.querySelectorAll('font[size="7"]');
-                        for (const font of fontElements) {{
-                            font.removeAttribute('size');
-                            font.style.fontSize = fontSize;
-                        }}
+                        const newFontElements = applyFontSize(fontSize);
                         
                         // Important: Set the cursor AFTER the new character
                         // The DOM structure has changed, so we need to find where to put the cursor
@@ -6919,11 +7309,6 @@ popover.menu {
                         // Create a new selection at the right place
                         const newRange = document.createRange();
                         
-                        // Find the newly created font element
-                        const newFontElements = Array.from(editor.querySelectorAll('font')).filter(
-                            font => font.style.fontSize === fontSize
-                        );
-                        
                         if (newFontElements.length > 0) {{
                             // Find the last text node inside this font element
                             const lastFont = newFontElements[newFontElements.length - 1];
@@ -6971,9 +7356,6 @@ popover.menu {
                         sel.removeAllRanges();
                         sel.addRange(newRange);
                         
-                        // Clean up the DOM
-                        cleanupEditorTags();
-                        
                         // Record state
                         saveState();
                         window.lastContent = editor.innerHTML;
@@ -7598,6 +7980,7 @@ popover.menu {
             
             # Store the page setup in the window for future use
             win.page_setup = page_setup
+            self.apply_page_geometry(win)
             dialog.close()
             win.statusbar.set_text("Page setup saved")
             win.webview.grab_focus()
@@ -7616,6 +7999,13 @@ popover.menu {
 ######################
 
 def main():
+    # Batch conversion and PDF rendering run headless and never start the GUI
+    if '--convert' in sys.argv[1:]:
+        import batch_convert
+        return batch_convert.main(sys.argv[1:])
+    if '--pdf' in sys.argv[1:]:
+        import pdf_render
+        return pdf_render.main(sys.argv[1:])
     app = WebkitWordApp()
     return app.run(sys.argv)
 
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# wwd_format.py - the native WebkitWord document format
+#
+# A .wwd file is a zip archive:
+#
+#   mimetype               application/x-webkitword, first and uncompressed
+#   manifest.json          format version, title, content hashes and the media
+#                          list with types and sizes
+#   content.html           editor HTML; images point at media/<name>
+#   content.txt            plain text of the document, for search indexers
+#   media/<sha256>.<ext>   images, named after the hash of their bytes so each
+#                          is stored once however often it is used
+#
+# Saving over an existing .wwd appends only what changed: media already in
+# the archive are never written again, and changed content and the manifest
+# are appended as new entries that shadow the old ones (the last entry of a
+# name wins). Once shadowed entries and unused media make up more than half
+# the file, it is compacted into a fresh archive.
+#
+# Appended entries and a new central directory go after the old end record,
+# which is left as it is, so the old directory stays valid until the new one
+# has been written and synced; a failed save is cut back to the old archive.
+# Fresh and compacted archives are written to a temporary file renamed over
+# the old one.
+#
+# Opening reads content.html only. Images are served lazily through the
+# archive registry of mhtml_import, one media entry per request.
+import os
+import re
+import json
+import base64
+import hashlib
+import tempfile
+import warnings
+import mimetypes
+import threading
+import zipfile
+from urllib.parse import unquote, unquote_to_bytes, urlparse
+
+import mhtml_import
+
+MIMETYPE = "application/x-webkitword"
+FORMAT_VERSION = 1
+MEDIA_DIR = "media/"
+CONTENT_HTML = "content.html"
+CONTENT_TEXT = "content.txt"
+MANIFEST = "manifest.json"
+
+# Never compact archives with less dead space than this
+COMPACT_MIN_BYTES = 1024 * 1024
+
+# Local file header size without the name and extra field
+ZIP_LOCAL_HEADER_SIZE = 30
+
+DATA_URI_PATTERN = re.compile(r'data:([^;,]*)((?:;[^;,]*)*),', re.IGNORECASE)
+MEDIA_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])' + re.escape(MEDIA_DIR) + r'([\w.-]+)\2',
+                               re.IGNORECASE)
+
+
+class MediaEntry:
+    """An image of the document; load() returns its bytes"""
+
+    def __init__(self, name, content_type, load):
+        self.name = name
+        self.content_type = content_type
+        self.load = load
+
+
+def _media_name(data, content_type):
+    extension = mimetypes.guess_extension(content_type) or ".bin"
+    return hashlib.sha256(data).hexdigest() + extension
+
+
+def read_image(src, base_dir):
+    """Bytes and content type of an image source, or None to leave it as it is"""
+    if src.startswith('data:'):
+        match = DATA_URI_PATTERN.match(src)
+        if not match:
+            return None
+        payload = src[match.end():]
+        if ';base64' in match.group(2).lower():
+            data = base64.b64decode(payload)
+        else:
+            data = unquote_to_bytes(payload)
+        return data, match.group(1) or "application/octet-stream"
+
+    if src.startswith(mhtml_import.ARCHIVE_SCHEME + "://"):
+        try:
+            return mhtml_import.read_archive_url(src)
+        except (KeyError, ValueError, OSError):
+            return None
+
+    parsed = urlparse(src)
+    if parsed.scheme == 'file':
+        path = unquote(parsed.path)
+    elif not parsed.scheme:
+        path = unquote(src)
+        if not os.path.isabs(path):
+            if not base_dir:
+                return None
+            path = os.path.join(base_dir, path)
+    else:
+        return None
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data, mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def collect_media(html, base_dir=None):
+    """
+    Move the images of editor HTML into media entries
+
+    Returns:
+        Tuple of (HTML with images pointing at media/, dict of name -> MediaEntry)
+    """
+    media = {}
+
+    def replace(match):
+        src = match.group(3)
+        archive_match = mhtml_import.ARCHIVE_URL_PATTERN.fullmatch(src)
+        if archive_match and WwdArchive.MEDIA_NAME_PATTERN.fullmatch(archive_match.group(2)):
+            # Already content-addressed; only read if the target lacks it
+            name = archive_match.group(2)
+            entry = MediaEntry(name, mimetypes.guess_type(name)[0] or "application/octet-stream",
+                               lambda src=src: mhtml_import.read_archive_url(src)[0])
+        else:
+            image = read_image(src, base_dir)
+            if image is None:
+                return match.group(0)
+            data, content_type = image
+            name = _media_name(data, content_type)
+            entry = MediaEntry(name, content_type, lambda data=data: data)
+        media.setdefault(name, entry)
+        return f'{match.group(1)}{match.group(2)}{MEDIA_DIR}{name}{match.group(2)}'
+
+    html = mhtml_import.IMG_SRC_PATTERN.sub(replace, html)
+    return html, media
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _manifest(title, html, text, media_info):
+    return json.dumps({
+        "format": "webkitword",
+        "version": FORMAT_VERSION,
+        "title": title,
+        "content": {
+            "html": CONTENT_HTML,
+            "text": CONTENT_TEXT,
+            "html_sha256": _sha256(html),
+            "text_sha256": _sha256(text),
+        },
+        "media": media_info,
+    }, indent=1)
+
+
+def _write_entry(archive, name, data, compress_type):
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    archive.writestr(info, data)
+
+
+def _write_archive(output, title, html, text, media):
+    """Write a complete archive; media maps names to MediaEntry"""
+    media_info = {}
+    with zipfile.ZipFile(output, 'w') as archive:
+        _write_entry(archive, "mimetype", MIMETYPE, zipfile.ZIP_STORED)
+        _write_entry(archive, CONTENT_HTML, html, zipfile.ZIP_DEFLATED)
+        _write_entry(archive, CONTENT_TEXT, text, zipfile.ZIP_DEFLATED)
+        for name, entry in media.items():
+            data = entry.load()
+            # Images are compressed already
+            _write_entry(archive, MEDIA_DIR + name, data, zipfile.ZIP_STORED)
+            media_info[name] = {"type": entry.content_type, "size": len(data)}
+        _write_entry(archive, MANIFEST, _manifest(title, html, text, media_info), zipfile.ZIP_DEFLATED)
+
+
+def write_wwd(output, html, text, title="Document", base_dir=None):
+    """Write editor HTML and text to a binary file object as a fresh .wwd archive"""
+    html, media = collect_media(html, base_dir)
+    _write_archive(output, title, html, text, media)
+
+
+def _replace_atomic(path, write):
+    """Write path through a temporary file renamed over it"""
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp",
+                                     dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _dead_bytes(archive, live_names, size):
+    """Bytes of an archive of size bytes taken by shadowed or unused entries
+    and by the directories of earlier saves"""
+    live = size - archive.start_dir
+    for name in live_names:
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            continue
+        live += ZIP_LOCAL_HEADER_SIZE + len(info.filename.encode('utf-8')) + len(info.extra) + info.compress_size
+    return max(0, size - live)
+
+
+def save_wwd(path, html, text, title="Document", base_dir=None):
+    """
+    Save editor HTML and text to path, appending to an existing archive
+
+    Returns:
+        Number of bytes written
+    """
+    html, media = collect_media(html, base_dir)
+    path = os.path.realpath(path)
+    if not zipfile.is_zipfile(path):
+        _replace_atomic(path, lambda f: _write_archive(f, title, html, text, media))
+        return os.path.getsize(path)
+
+    start_size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        try:
+            with warnings.catch_warnings():
+                # Shadowing older entries is the point
+                warnings.simplefilter("ignore", UserWarning)
+                with zipfile.ZipFile(f, 'a') as archive:
+                    # Write after the old end record rather than over the old
+                    # directory, which stays valid until the new one is synced
+                    archive.start_dir = start_size
+                    _append_entries(archive, title, html, text, media)
+                    f.flush()
+                    os.fsync(f.fileno())
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(start_size)
+            f.flush()
+            os.fsync(f.fileno())
+            raise
+    size = os.path.getsize(path)
+    written = size - start_size
+
+    with zipfile.ZipFile(path) as archive:
+        live_names = {"mimetype", MANIFEST, CONTENT_HTML, CONTENT_TEXT}
+        try:
+            manifest = json.loads(archive.read(MANIFEST))
+            live_names.update(MEDIA_DIR + name for name in manifest.get("media", {}))
+        except (KeyError, ValueError):
+            pass
+        dead = _dead_bytes(archive, live_names, size)
+
+    if dead > max(COMPACT_MIN_BYTES, size // 2):
+        compact_wwd(path)
+        written = os.path.getsize(path)
+    return written
+
+
+def _append_entries(archive, title, html, text, media):
+    """Append what changed to an archive open for appending"""
+    names = set(archive.namelist())
+    try:
+        old_manifest = json.loads(archive.read(MANIFEST))
+    except (KeyError, ValueError):
+        old_manifest = {}
+    old_content = old_manifest.get("content", {})
+    old_media = old_manifest.get("media", {})
+
+    media_info = {}
+    for name, entry in media.items():
+        if MEDIA_DIR + name in names and name in old_media:
+            media_info[name] = old_media[name]
+            continue
+        data = entry.load()
+        _write_entry(archive, MEDIA_DIR + name, data, zipfile.ZIP_STORED)
+        media_info[name] = {"type": entry.content_type, "size": len(data)}
+    if "mimetype" not in names:
+        _write_entry(archive, "mimetype", MIMETYPE, zipfile.ZIP_STORED)
+    if old_content.get("html_sha256") != _sha256(html) or CONTENT_HTML not in names:
+        _write_entry(archive, CONTENT_HTML, html, zipfile.ZIP_DEFLATED)
+    if old_content.get("text_sha256") != _sha256(text) or CONTENT_TEXT not in names:
+        _write_entry(archive, CONTENT_TEXT, text, zipfile.ZIP_DEFLATED)
+    _write_entry(archive, MANIFEST, _manifest(title, html, text, media_info), zipfile.ZIP_DEFLATED)
+
+
+def compact_wwd(path):
+    """Rewrite an archive with only the latest entry of each name still in use"""
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST))
+        html = archive.read(CONTENT_HTML).decode('utf-8')
+        text = archive.read(CONTENT_TEXT).decode('utf-8')
+        media = {
+            name: MediaEntry(name, info.get("type", "application/octet-stream"),
+                             lambda name=name: archive.read(MEDIA_DIR + name))
+            for name, info in manifest.get("media", {}).items()
+        }
+        _replace_atomic(path, lambda f: _write_archive(f, manifest.get("title", "Document"), html, text, media))
+
+
+class WwdArchive:
+    """
+    An open .wwd document whose media are read on request
+
+    The archive id depends only on the path: media names are content hashes,
+    so URLs stay valid across saves. Entries are read from the file as it was
+    opened, and from the current file for media added by later saves.
+    """
+
+    MEDIA_NAME_PATTERN = re.compile(r'[0-9a-f]{64}\.[\w]+')
+
+    def __init__(self, path):
+        self.path = os.path.realpath(path)
+        self.archive_id = hashlib.sha1(self.path.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+        try:
+            self._zip = zipfile.ZipFile(self.path)
+            if self._zip.read("mimetype").decode('ascii', 'replace').strip() != MIMETYPE:
+                raise ValueError("Not a WebkitWord document")
+        except (zipfile.BadZipFile, KeyError) as e:
+            raise ValueError(f"Not a WebkitWord document: {e}")
+        self._lock = threading.Lock()
+
+    def get_part(self, key):
+        """Bytes and content type of the media entry named key"""
+        name = MEDIA_DIR + key
+        with self._lock:
+            try:
+                data = self._zip.read(name)
+            except KeyError:
+                with zipfile.ZipFile(self.path) as current:
+                    data = current.read(name)
+        return data, mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    def get_editor_html(self, inline=False):
+        """
+        The document's HTML with images pointing at archive URLs
+
+        With inline=True images become data URIs instead.
+        """
+        with zipfile.ZipFile(self.path) as current:
+            html = current.read(CONTENT_HTML).decode('utf-8')
+
+            def replace(match):
+                key = match.group(3)
+                if inline:
+                    try:
+                        data = current.read(MEDIA_DIR + key)
+                    except KeyError:
+                        return match.group(0)
+                    content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+                    src = f"data:{content_type};base64,{base64.b64encode(data).decode('ascii')}"
+                else:
+                    src = mhtml_import.archive_url(self.archive_id, key)
+                return f'{match.group(1)}{match.group(2)}{src}{match.group(2)}'
+
+            return MEDIA_SRC_PATTERN.sub(replace, html)
+
+    def get_text(self):
+        """The cached plain-text extract"""
+        with zipfile.ZipFile(self.path) as current:
+            return current.read(CONTENT_TEXT).decode('utf-8')
+
+    def close(self):
+        with self._lock:
+            self._zip.close()